@@ -1,6 +1,7 @@
 
 import os
 import time
+import threading
 from datetime import datetime, timezone
 from typing import Dict, Optional
 
@@ -9,6 +10,9 @@ pd.set_option('future.no_silent_downcasting', True)
 
 from dotenv import load_dotenv, find_dotenv
 import bybit  # 네 로컬 모듈
+from kline import kline_frame
+from incremental import EMAState
+from engine import Engine
 # =============== 사용자 설정 (심볼별 단일 TF) ===============
 SYMBOLS = {
     "PUMPFUNUSDT": {"interval": "5", "fast": 3, "slow": 12},
@@ -21,10 +25,14 @@ TP_ROE   = 7.5         # ROE% 익절
 SL_ROE   = 10         # ROE% 손절
 LOOKBACK = 400         # EMA 계산용 캔들 개수
 
-POLL_SEC = 2.0         # 심볼 간 루프 주기
+POLL_SEC = 2.0         # 신호 검사 주기 (USE_CURRENT_CANDLE=True 일 때만 — False 면 봉 마감마다 한 번)
+RISK_SEC = 2.0         # 보유 중 TP/SL 검사 주기 (봉 안)
+BAR_GRACE = 1.0        # 봉 마감(서버 시각) 후 이만큼 뒤에 닫힌 봉 평가
 CALL_GAP = 0.35        # API 호출 간 최소 간격
 USE_CURRENT_CANDLE = True   # True: 현재(미확정) 봉 포함 / False: 닫힌 봉만
 COOLDOWN_BARS = 0      # 청산 후 N봉 동안 재진입 금지 (깊은 연속거래 방지용, 0이면 비활성)
+USE_WS   = True        # True: kline/현재가를 WebSocket 버퍼에서 (LOOKBACK 봉을 매번 REST 로 받지 않음)
+USE_PRIVATE_WS = True  # True: 포지션/체결을 private WebSocket 으로 받아 TP/SL 을 갱신마다 검사 (USE_WS 필요)
 # ==========================================================
 load_dotenv(find_dotenv(), override=True)
 # ===== 상태 (심볼 단위) =====
@@ -37,13 +45,16 @@ last_bar_ts:       Dict[str, Optional[int]] = {s: None for s in SYMBOLS}  # 마
 last_signal_ts:    Dict[str, Optional[int]] = {s: None for s in SYMBOLS}  # 마지막 "진입 시도"가 일어난 봉 ts (중복 진입 방지)
 cooldown_left:     Dict[str, int] = {s: 0 for s in SYMBOLS}              # 청산 후 쿨다운 남은 봉 수
 
+# EMA 스트리밍 상태 (처음만 LOOKBACK 개로 워밍업, 이후엔 최근 3봉만 받아 갱신)
+ema_state: Dict[str, tuple] = {}   # symbol → (EMAState(fast), EMAState(slow))
+
+# 신호 task / TP·SL task / 계좌 스트림 콜백이 같은 심볼 상태를 동시에 건드리지 않도록 (심볼끼리는 독립)
+LOCKS: Dict[str, threading.RLock] = {s: threading.RLock() for s in SYMBOLS}
+
 # ===== 유틸 =====
 def utc_now_str() -> str:
     return datetime.now(tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
-def ema(series: pd.Series, period: int) -> pd.Series:
-    return series.ewm(span=period, adjust=False).mean()
-
 def get_bars(symbol: str, interval: str, limit: int) -> pd.DataFrame:
     """
     bybit.get_kline_http(symbol, interval, limit) 결과를 표준 6컬럼 DF로 정규화
@@ -58,39 +69,14 @@ def get_bars(symbol: str, interval: str, limit: int) -> pd.DataFrame:
     if not kl:
         return pd.DataFrame(columns=["ts","open","high","low","close","volume"])
 
-    first = kl[0]
-
-    if isinstance(first, (list, tuple)):
-        n = len(first)
-        tmp_cols_all = ["ts","open","high","low","close","volume","turnover","confirm","start","end"]
-        tmp_cols = tmp_cols_all[:n]
-        df_raw = pd.DataFrame(kl, columns=tmp_cols)
-        need = ["ts","open","high","low","close","volume"]
-        for c in need:
-            if c not in df_raw.columns:
-                df_raw[c] = pd.NA
-        df = df_raw[need].copy()
-    elif isinstance(first, dict):
-        rows = []
-        for d in kl:
-            rows.append({
-                "ts":     d.get("ts") or d.get("start") or d.get("startTime") or d.get("timestamp") or d.get("time"),
-                "open":   d.get("open"),
-                "high":   d.get("high"),
-                "low":    d.get("low"),
-                "close":  d.get("close"),
-                "volume": d.get("volume"),
-            })
-        df = pd.DataFrame(rows, columns=["ts","open","high","low","close","volume"])
-    else:
+    try:
+        # 리스트/딕셔너리 행 모두 처리, ts/close 없는 행 제거, 시간 오름차순
+        return kline_frame(kl)
+    except (TypeError, ValueError) as e:
         # 예상치 못한 포맷
+        print(f"[ERR] kline 파싱 {symbol}@{interval}: {e}")
         return pd.DataFrame(columns=["ts","open","high","low","close","volume"])
 
-    for c in ["ts","open","high","low","close","volume"]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
-    df = df.dropna(subset=["ts","close"]).sort_values("ts").reset_index(drop=True)
-    return df
-
 def set_leverage_all():
     # bybit 모듈에 비중/심볼 반영 + 레버리지 설정
     bybit.PCT = PCT
@@ -165,6 +151,52 @@ def close(symbol: str, reason: str, this_bar_ts: int):
     if COOLDOWN_BARS > 0:
         cooldown_left[symbol] = COOLDOWN_BARS
 
+def exit_reason(side: str, roe: float) -> Optional[str]:
+    """TP/SL 도달 시 청산 사유"""
+    if roe >= TP_ROE:
+        return f"TP {side}"
+    if roe <= -SL_ROE:
+        return f"SL {side}"
+    return None
+
+def check_risk(symbol: str):
+    """보유 중이면 TP/SL 검사 (LOCKS[symbol] 을 잡은 쪽에서)"""
+    side = position_side.get(symbol)
+    if side is None:
+        return
+    if bybit.get_position_size(symbol) <= 0:
+        # 거래소에서 닫힘 (청산/수동 종료) → 상태만 정리
+        print(f"[{utc_now_str()}] 🔴 CLOSED {symbol} (거래소)")
+        position_side[symbol] = None
+        entry_price[symbol]   = None
+        qty_map[symbol]       = None
+        if COOLDOWN_BARS > 0:
+            cooldown_left[symbol] = COOLDOWN_BARS
+        return
+    reason = exit_reason(side, bybit.get_ROE(symbol))
+    if reason is not None:
+        close(symbol, reason, last_bar_ts[symbol])
+
+def risk_task(symbol: str):
+    """봉 안 TP/SL — 엔진이 RISK_SEC 주기로"""
+    with LOCKS[symbol]:
+        check_risk(symbol)
+
+def on_account_update(symbol: str):
+    """계좌 스트림 갱신마다 (포지션/체결 메시지, 보유 심볼 시세) TP/SL 검사 — 엔진이 스트림 스레드에서 넘겨받아 스레드 풀에서 부름
+    다른 task 가 이 심볼을 보고 있으면 건너뜀"""
+    if position_side.get(symbol) is None or not LOCKS[symbol].acquire(blocking=False):
+        return
+    try:
+        check_risk(symbol)
+    finally:
+        LOCKS[symbol].release()
+
+def signal_task(symbol: str):
+    """EMA 교차 신호 — 현재 봉 기준이면 POLL_SEC 마다, 닫힌 봉 기준이면 봉 마감마다"""
+    with LOCKS[symbol]:
+        handle_symbol(symbol)
+
 def handle_symbol(symbol: str):
     # 설정 로드
     cfg  = SYMBOLS[symbol]
@@ -175,16 +207,31 @@ def handle_symbol(symbol: str):
         print(f"[WARN] {symbol} EMA 설정 오류 (fast={fast}, slow={slow})")
         return
 
-    # 캔들 로드
-    df = get_bars(symbol, tf, limit=max(LOOKBACK, slow + 10))
-    if df.empty or len(df) < slow + 5:
-        print(f"[SKIP] {symbol}@{tf}: 캔들 부족")
-        return
+    # 캔들 로드 — 상태가 있으면 최근 3봉만
+    st = ema_state.get(symbol)
+    now = None
+    if st:
+        df = get_bars(symbol, tf, limit=3)
+        if len(df) >= 2:
+            ts, closes = df["ts"].to_numpy(), df["close"].to_numpy()
+            now = [e.sync(ts, closes) for e in st]
+    if now is None or None in now:
+        # 처음이거나 폴링 사이에 봉을 놓침 → 다시 워밍업
+        df = get_bars(symbol, tf, limit=max(LOOKBACK, slow + 10))
+        if df.empty or len(df) < slow + 5:
+            print(f"[SKIP] {symbol}@{tf}: 캔들 부족")
+            return
+        st = ema_state[symbol] = (EMAState(fast), EMAState(slow))
+        ts, closes = df["ts"].to_numpy(), df["close"].to_numpy()
+        now = [e.sync(ts, closes) for e in st]
 
     # 봉 선택 (현재 봉 포함/제외)
-    bars = df.copy() if USE_CURRENT_CANDLE else (df.iloc[:-1].copy() if len(df) > 1 else df.copy())
-    this_bar_ts = int(bars["ts"].iloc[-1])
-    price       = float(bars["close"].iloc[-1])
+    if USE_CURRENT_CANDLE:
+        this_bar_ts, price = int(ts[-1]), float(closes[-1])
+        (ef_prev, es_prev), (ef_now, es_now) = [e.value for e in st], now
+    else:
+        this_bar_ts, price = int(ts[-2]), float(closes[-2])
+        (ef_prev, es_prev), (ef_now, es_now) = [e.prev for e in st], [e.value for e in st]
 
     # 봉 변경 감지 → 쿨다운 카운터 감소
     if last_bar_ts[symbol] is None:
@@ -194,30 +241,26 @@ def handle_symbol(symbol: str):
         if cooldown_left[symbol] > 0:
             cooldown_left[symbol] -= 1
 
-    # EMA & 교차
-    close_ser = bars["close"].astype(float)
-    ef = ema(close_ser, fast)
-    es = ema(close_ser, slow)
-
-    above      = (ef > es).fillna(False).astype(bool)
-    above_prev = above.shift(1).fillna(False).astype(bool)
-    cross_up   = (~above_prev) & (above)     # 골든
-    cross_dn   = (above_prev) & (~above)     # 데드
+    # EMA 교차 (직전 봉 → 이번 봉)
+    above      = ef_now > es_now
+    above_prev = ef_prev > es_prev
+    cross_up   = (not above_prev) and above     # 골든
+    cross_dn   = above_prev and (not above)     # 데드
 
     # 진입/반대교차 평가는 매 봉 1회만
     opp_reason = None
 
     # 진입
     if position_side[symbol] is None:
-        if bool(cross_up.iloc[-1]):
+        if cross_up:
             enter(symbol, "LONG", price, this_bar_ts)
-        elif bool(cross_dn.iloc[-1]):
+        elif cross_dn:
             enter(symbol, "SHORT", price, this_bar_ts)
     else:
         # 반대교차는 보호 청산 후보
-        if position_side[symbol] == "LONG" and bool(cross_dn.iloc[-1]):
+        if position_side[symbol] == "LONG" and cross_dn:
             opp_reason = "XC LONG"
-        if position_side[symbol] == "SHORT" and bool(cross_up.iloc[-1]):
+        if position_side[symbol] == "SHORT" and cross_up:
             opp_reason = "XC SHORT"
 
     # 보유 중이면 TP/SL/반대교차 체크
@@ -232,16 +275,8 @@ def handle_symbol(symbol: str):
         except Exception as e:
             print(f"[ERR] get_ROE {symbol}: {e}"); roe = 0.0
 
-        do_close = None
-        reason   = None
-        if roe >= TP_ROE:
-            do_close, reason = True, f"TP {side}"
-        elif roe <= -SL_ROE:
-            do_close, reason = True, f"SL {side}"
-        elif opp_reason is not None:
-            do_close, reason = True, opp_reason
-
-        if do_close:
+        reason = exit_reason(side, roe) or opp_reason
+        if reason is not None:
             close(symbol, reason, this_bar_ts)
 
         # 출력용 현재가(진행중 봉)
@@ -253,25 +288,35 @@ def handle_symbol(symbol: str):
 
         print(f"[{utc_now_str()}] 🪙{symbol} @{tf} "
               f"💲현재가: {last_px:.6f} 🚩포지션 {position_side[symbol]} "
-              f"| EMA{fast}/{slow} = {float(ef.iloc[-1]):.6f}/{float(es.iloc[-1]):.6f} "
+              f"| EMA{fast}/{slow} = {ef_now:.6f}/{es_now:.6f} "
               f"| 💎PnL: {pnl:.6f} ⚜️ROE: {roe:.2f}% "
               f"| ⏳CD:{cooldown_left[symbol]}")
     else:
         print(f"[{utc_now_str()}] 🪙{symbol} @{tf} "
               f"💲현재가: {price:.6f} 🚩포지션 None "
-              f"| EMA{fast}/{slow} = {float(ef.iloc[-1]):.6f}/{float(es.iloc[-1]):.6f} "
+              f"| EMA{fast}/{slow} = {ef_now:.6f}/{es_now:.6f} "
               f"| ⏳CD:{cooldown_left[symbol]}")
 
 def main():
     set_leverage_all()
+    if USE_WS:
+        bybit.start_feed([(s, cfg["interval"]) for s, cfg in SYMBOLS.items()], warmup=LOOKBACK)
+        if USE_PRIVATE_WS:
+            bybit.start_account_feed()   # 청산 검사 콜백은 엔진을 만든 뒤
     print(f"▶ EMA Cross 실거래 시작 (lev={LEVERAGE}x, TP={TP_ROE}%, SL={SL_ROE}%, alloc={PCT}%, "
           f"use_current={USE_CURRENT_CANDLE}, cooldown_bars={COOLDOWN_BARS})")
 
-    while True:
-        for s in SYMBOLS.keys():
-            handle_symbol(s)
-            time.sleep(CALL_GAP)
-        time.sleep(POLL_SEC)
+    engine = Engine(clock=bybit.server_now_ms)
+    for s, cfg in SYMBOLS.items():
+        if USE_CURRENT_CANDLE:
+            engine.every(POLL_SEC, signal_task, s, name=s)
+        else:
+            engine.on_bar_close(cfg["interval"], signal_task, s, grace=BAR_GRACE, name=s)
+        engine.every(RISK_SEC, risk_task, s, name=f"{s} TP/SL")
+    if USE_WS and USE_PRIVATE_WS:
+        bybit.start_account_feed(on_update=engine.trigger(on_account_update, name="account"))
+    bybit.share_session(engine.workers)
+    engine.run()
 
 if __name__ == "__main__":
     main()
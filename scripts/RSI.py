@@ -1,9 +1,10 @@
 from dotenv import load_dotenv, find_dotenv
-from pybit.unified_trading import HTTP
+from mock_bybit import make_session   # BYBIT_MOCK=1 이면 오프라인 대역
 import os, sys
 from datetime import datetime
-import time
+import threading
 import bybit
+from engine import Engine
 
 load_dotenv(find_dotenv(), override=True)
 _api_key = os.getenv("API_KEY")
@@ -12,7 +13,7 @@ if not _api_key or not _api_secret:
     print("❌ API_KEY 또는 API_KEY_SECRET을 .env에서 못 찾았습니다.")
     sys.exit(1)
 
-session = HTTP(api_key=_api_key, api_secret=_api_secret, recv_window=10000, max_retries=0)
+session = make_session(api_key=_api_key, api_secret=_api_secret, recv_window=10000, max_retries=0)
 
 # ===================== 사용자 설정 =====================
 
@@ -34,6 +35,12 @@ TP_ROE  = [10]           # TP 기준(ROE %)
 SL_ROE  = [15]           # SL 기준(ROE %)
 TP_MODE = [1]            # 1: 모드1 (RSI 반대 과상태 + doorstep 트레일링), 2: 그냥 TP/SL
 
+POLL_SEC = [5]           # 심볼별 검사 주기(초) — 심볼마다 독립 task 라 심볼 수와 무관
+BAR_GRACE = 1.0          # 봉 마감(서버 시각) 후 이만큼 뒤에 봉 단위 처리 (쿨다운 카운트)
+
+USE_WS  = True           # True: kline/현재가를 WebSocket 버퍼에서 (REST 폴링 안 함)
+USE_PRIVATE_WS = True    # True: 포지션/체결을 private WebSocket 으로 받아 청산 검사를 갱신마다 (USE_WS 필요)
+
 # ===================== 상태 변수 =====================
 
 position      = {s: None for s in SYMBOLS}   # "long" / "short" / None
@@ -47,8 +54,7 @@ last_trough_level  = {s: None for s in SYMBOLS}  # 롱용 RSI 바닥
 armed_short_switch = {s: False for s in SYMBOLS}
 armed_long_switch  = {s: False for s in SYMBOLS}
 
-# 봉 기준 쿨다운
-last_closed_price1 = {s: None for s in SYMBOLS}
+# 봉 기준 쿨다운 (봉 마감마다 on_bar 가 하나씩 줄임)
 cooldown_bars      = {s: 0   for s in SYMBOLS}
 
 # 모드1 TP 유지용
@@ -62,6 +68,9 @@ for s in SYMBOLS:
 
 BASE_CASH = None
 
+# 심볼 task 와 계좌 스트림 콜백이 같은 심볼 상태를 동시에 건드리지 않도록 (심볼끼리는 독립)
+LOCKS = {s: threading.RLock() for s in SYMBOLS}
+
 
 # ===================== 유틸 함수 =====================
 
@@ -72,6 +81,10 @@ def start():
     print(f"🔧 보유금액: {BASE_CASH:.2f} USDT")
     for s in SYMBOLS:
         bybit.set_leverage(symbol=s, leverage=LEVERAGE)
+    if USE_WS:
+        bybit.start_feed(zip(SYMBOLS, INTERVALS))
+        if USE_PRIVATE_WS:
+            bybit.start_account_feed()   # 청산 검사 콜백은 엔진을 만든 뒤 (update)
 
 
 def reset_switch_after_close(symbol, closed_side):
@@ -119,196 +132,234 @@ def enter_short(symbol, px, q, leverage):
     roe_peak[symbol] = None
 
 
+# ===================== 청산 =====================
+
+def check_exit(idx, symbol, ROE, RSI):
+    """보유 중이면 TP/SL·모드1 트레일링 청산 (폴링 루프와 계좌 스트림 콜백이 같이 씀)"""
+    tp_roe    = TP_ROE[idx]
+    sl_roe    = SL_ROE[idx]
+    tp_mode   = TP_MODE[idx]
+    long_rsi  = LONG_SWITCH_RSI[idx]
+    short_rsi = SHORT_SWITCH_RSI[idx]
+
+    closed = False
+    closed_side = None
+
+    # ---- 숏 포지션 ----
+    if position[symbol] == "short":
+        roe = ROE  # bybit에서 받은 ROE 그대로 사용
+
+        # (a) SL 먼저 체크
+        if roe <= -sl_roe:
+            close_short(symbol)
+            closed = True
+            closed_side = "short"
+
+        # (b) TP MODE 처리
+        if not closed:
+            if tp_mode == 1:
+                # 모드1: TP 돌파 후 RSI 반대 과상태일 때 버티다가,
+                # ROE가 피크에서 DOORSTEP만큼 떨어지면 익절.
+
+                # 1) 아직 hold 모드 아니고, TP 처음 돌파
+                if not tp_hold[symbol] and roe >= tp_roe:
+                    tp_hold[symbol]  = True
+                    roe_peak[symbol] = roe
+
+                # 2) hold 모드일 때
+                if tp_hold[symbol]:
+                    # 숏이니까 반대 과상태 = 과매도 → RSI <= long_rsi
+                    if RSI <= long_rsi:
+                        # ROE 피크 갱신
+                        if roe > roe_peak[symbol]:
+                            roe_peak[symbol] = roe
+
+                        # 피크에서 DOORSTEP만큼 하락하면 청산
+                        if roe_peak[symbol] - roe >= DOORSTEP:
+                            close_short(symbol)
+                            closed = True
+                            closed_side = "short"
+                    else:
+                        # 반대 과상태 벗어나면 그냥 TP 익절
+                        close_short(symbol)
+                        closed = True
+                        closed_side = "short"
+            else:
+                # 기본 모드: TP / SL 단순 조건
+                if roe >= tp_roe or roe <= -sl_roe:
+                    close_short(symbol)
+                    closed = True
+                    closed_side = "short"
+
+    # ---- 롱 포지션 ----
+    elif position[symbol] == "long":
+        roe = ROE
+
+        # (a) SL 먼저 체크
+        if roe <= -sl_roe:
+            close_long(symbol)
+            closed = True
+            closed_side = "long"
+
+        # (b) TP MODE 처리
+        if not closed:
+            if tp_mode == 1:
+                # 롱: TP 돌파 후 과매수(숏 방향) RSI 상태 유지하며 버티다가
+                # ROE가 피크에서 DOORSTEP만큼 떨어지면 익절.
+
+                # 1) 아직 hold 모드 아니고 TP 처음 돌파
+                if not tp_hold[symbol] and roe >= tp_roe:
+                    tp_hold[symbol]  = True
+                    roe_peak[symbol] = roe
+
+                # 2) hold 모드일 때
+                if tp_hold[symbol]:
+                    # 롱이니까 반대 과상태 = 과매수 → RSI >= short_rsi
+                    if RSI >= short_rsi:
+                        if roe > roe_peak[symbol]:
+                            roe_peak[symbol] = roe
+
+                        if roe_peak[symbol] - roe >= DOORSTEP:
+                            close_long(symbol)
+                            closed = True
+                            closed_side = "long"
+                    else:
+                        # 반대 과상태 벗어나면 그냥 TP 익절
+                        close_long(symbol)
+                        closed = True
+                        closed_side = "long"
+            else:
+                # 기본 모드: TP / SL 단순
+                if roe >= tp_roe or roe <= -sl_roe:
+                    close_long(symbol)
+                    closed = True
+                    closed_side = "long"
+
+    # ---- 청산 후 공통 처리 ----
+    if closed:
+        clear_position(symbol, closed_side)
+
+
+def clear_position(symbol, closed_side):
+    """청산 후 공통 상태 정리"""
+    position[symbol]    = None
+    entry_px[symbol]    = None
+    qty[symbol]         = None
+    init_margin[symbol] = None
+    cooldown_bars[symbol] = COOLDOWN_BARS
+    reset_switch_after_close(symbol, closed_side)
+
+
+def on_account_update(symbol):
+    """계좌 스트림 갱신마다 (포지션/체결 메시지, 보유 심볼 시세) — 엔진이 스트림 스레드에서 넘겨받아 스레드 풀에서 부름
+    심볼 task 가 이 심볼을 보고 있으면 건너뜀"""
+    if position.get(symbol) is None or not LOCKS[symbol].acquire(blocking=False):
+        return
+    try:
+        idx = SYMBOLS.index(symbol)
+        if bybit.get_position_size(symbol) <= 0:
+            # 거래소에서 닫힘 (청산/수동 종료) → 상태만 정리
+            print(f"📍 {symbol} 포지션이 거래소에서 종료됨 → 상태 리셋")
+            clear_position(symbol, position[symbol])
+            return
+        RSI = bybit.get_RSI(symbol, interval=INTERVALS[idx], period=RSI_PERIODS[idx])
+        check_exit(idx, symbol, bybit.get_ROE(symbol), RSI)
+    finally:
+        LOCKS[symbol].release()
+
+
 # ===================== 메인 루프 =====================
 
-def update():
-    while True:
-        for idx, symbol in enumerate(SYMBOLS):
-            try:
-                tp_roe  = TP_ROE[idx]
-                sl_roe  = SL_ROE[idx]
-                tp_mode = TP_MODE[idx]
-
-                rsi_period = RSI_PERIODS[idx]
-                interval   = INTERVALS[idx]
-                long_rsi   = LONG_SWITCH_RSI[idx]
-                short_rsi  = SHORT_SWITCH_RSI[idx]
-
-                # 현재 PnL, ROE, 가격, RSI
-                Pnl = bybit.get_PnL(symbol)
-                ROE = bybit.get_ROE(symbol)   # 여기 ROE를 기준으로 TP/SL/doorstep 트레일링
-                c_prev2, c_prev1, cur_3 = bybit.get_close_price(symbol, interval=interval)
-                RSI = bybit.get_RSI(symbol, interval=interval, period=rsi_period)
-
-                # 새 봉 체크 (쿨다운용)
-                new_bar = (last_closed_price1[symbol] is None) or (last_closed_price1[symbol] != c_prev1)
-                if new_bar:
-                    last_closed_price1[symbol] = c_prev1
-                    if cooldown_bars[symbol] > 0:
-                        cooldown_bars[symbol] -= 1
-
-                # ===== 1) RSI 스위치 업데이트 (doorstep 진입용) =====
-
-                # 롱 방향: RSI가 long_rsi 이하로 내려갔을 때
-                if RSI <= long_rsi:
-                    if not armed_long_switch[symbol]:
-                        armed_long_switch[symbol] = True
+def step(idx, symbol):
+    """심볼 하나 한 번 — 엔진이 심볼마다 POLL_SEC 주기로 부름"""
+    with LOCKS[symbol]:
+        try:
+            rsi_period = RSI_PERIODS[idx]
+            interval   = INTERVALS[idx]
+            long_rsi   = LONG_SWITCH_RSI[idx]
+            short_rsi  = SHORT_SWITCH_RSI[idx]
+
+            # 현재 PnL, ROE, 가격, RSI
+            Pnl = bybit.get_PnL(symbol)
+            ROE = bybit.get_ROE(symbol)   # 여기 ROE를 기준으로 TP/SL/doorstep 트레일링
+            RSI = bybit.get_RSI(symbol, interval=interval, period=rsi_period)
+
+            # ===== 1) RSI 스위치 업데이트 (doorstep 진입용) =====
+
+            # 롱 방향: RSI가 long_rsi 이하로 내려갔을 때
+            if RSI <= long_rsi:
+                if not armed_long_switch[symbol]:
+                    armed_long_switch[symbol] = True
+                    last_trough_level[symbol] = RSI
+                else:
+                    if last_trough_level[symbol] is None or RSI < last_trough_level[symbol]:
                         last_trough_level[symbol] = RSI
-                    else:
-                        if last_trough_level[symbol] is None or RSI < last_trough_level[symbol]:
-                            last_trough_level[symbol] = RSI
 
-                # 숏 방향: RSI가 short_rsi 이상으로 올라갔을 때
-                if RSI >= short_rsi:
-                    if not armed_short_switch[symbol]:
-                        armed_short_switch[symbol] = True
+            # 숏 방향: RSI가 short_rsi 이상으로 올라갔을 때
+            if RSI >= short_rsi:
+                if not armed_short_switch[symbol]:
+                    armed_short_switch[symbol] = True
+                    last_peak_level[symbol] = RSI
+                else:
+                    if last_peak_level[symbol] is None or RSI > last_peak_level[symbol]:
                         last_peak_level[symbol] = RSI
-                    else:
-                        if last_peak_level[symbol] is None or RSI > last_peak_level[symbol]:
-                            last_peak_level[symbol] = RSI
 
-                # ===== 2) 포지션 없음 & 쿨다운 끝 → 진입 =====
+            # ===== 2) 포지션 없음 & 쿨다운 끝 → 진입 =====
+            if position[symbol] is None and cooldown_bars[symbol] == 0:
+
+                # (1) 숏 진입: RSI 피크 찍고 DOORSTEP만큼 내려왔을 때
+                if armed_short_switch[symbol] and last_peak_level[symbol] is not None:
+                    short_trigger = last_peak_level[symbol] - DOORSTEP
+                    if RSI <= short_trigger:
+                        px, q = bybit.entry_position(symbol, "Sell", LEVERAGE)
+                        if q > 0 and px is not None:
+                            enter_short(symbol, px, q, LEVERAGE)
+                            armed_short_switch[symbol] = False
+                            last_peak_level[symbol] = None
+                            cooldown_bars[symbol] = COOLDOWN_BARS
+
+                # (2) 롱 진입: RSI 바닥 찍고 DOORSTEP만큼 올라왔을 때
                 if position[symbol] is None and cooldown_bars[symbol] == 0:
-
-                    # (1) 숏 진입: RSI 피크 찍고 DOORSTEP만큼 내려왔을 때
-                    if armed_short_switch[symbol] and last_peak_level[symbol] is not None:
-                        short_trigger = last_peak_level[symbol] - DOORSTEP
-                        if RSI <= short_trigger:
-                            px, q = bybit.entry_position(symbol, "Sell", LEVERAGE)
+                    if armed_long_switch[symbol] and last_trough_level[symbol] is not None:
+                        long_trigger = last_trough_level[symbol] + DOORSTEP
+                        if RSI >= long_trigger:
+                            px, q = bybit.entry_position(symbol, "Buy", LEVERAGE)
                             if q > 0 and px is not None:
-                                enter_short(symbol, px, q, LEVERAGE)
-                                armed_short_switch[symbol] = False
-                                last_peak_level[symbol] = None
+                                enter_long(symbol, px, q, LEVERAGE)
+                                armed_long_switch[symbol] = False
+                                last_trough_level[symbol] = None
                                 cooldown_bars[symbol] = COOLDOWN_BARS
 
-                    # (2) 롱 진입: RSI 바닥 찍고 DOORSTEP만큼 올라왔을 때
-                    if position[symbol] is None and cooldown_bars[symbol] == 0:
-                        if armed_long_switch[symbol] and last_trough_level[symbol] is not None:
-                            long_trigger = last_trough_level[symbol] + DOORSTEP
-                            if RSI >= long_trigger:
-                                px, q = bybit.entry_position(symbol, "Buy", LEVERAGE)
-                                if q > 0 and px is not None:
-                                    enter_long(symbol, px, q, LEVERAGE)
-                                    armed_long_switch[symbol] = False
-                                    last_trough_level[symbol] = None
-                                    cooldown_bars[symbol] = COOLDOWN_BARS
-
-                # ===== 3) 포지션 보유 시 청산 로직 =====
-                closed = False
-                closed_side = None
-
-                # ---- 숏 포지션 ----
-                if position[symbol] == "short":
-                    roe = ROE  # bybit에서 받은 ROE 그대로 사용
-
-                    # (a) SL 먼저 체크
-                    if roe <= -sl_roe:
-                        close_short(symbol)
-                        closed = True
-                        closed_side = "short"
+            # ===== 3) 포지션 보유 시 청산 로직 =====
+            check_exit(idx, symbol, ROE, RSI)
+
+            # ===== 4) 상태 출력 (이모지 그대로 유지) =====
+            print(
+                f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+                f"🪙 {symbol} 🕧 {interval} | 🚩포지션:{position[symbol]} "
+                f"| RSI:{RSI:.2f} |💸 PnL:{Pnl:.3f} |💎 ROE:{ROE:.2f} "
+            )
+
+        except Exception as e:
+            print(f"[ERROR] {symbol}: {type(e).__name__} {e}")
 
-                    # (b) TP MODE 처리
-                    if not closed:
-                        if tp_mode == 1:
-                            # 모드1: TP 돌파 후 RSI 반대 과상태일 때 버티다가,
-                            # ROE가 피크에서 DOORSTEP만큼 떨어지면 익절.
-
-                            # 1) 아직 hold 모드 아니고, TP 처음 돌파
-                            if not tp_hold[symbol] and roe >= tp_roe:
-                                tp_hold[symbol]  = True
-                                roe_peak[symbol] = roe
-
-                            # 2) hold 모드일 때
-                            if tp_hold[symbol]:
-                                # 숏이니까 반대 과상태 = 과매도 → RSI <= long_rsi
-                                if RSI <= long_rsi:
-                                    # ROE 피크 갱신
-                                    if roe > roe_peak[symbol]:
-                                        roe_peak[symbol] = roe
-
-                                    # 피크에서 DOORSTEP만큼 하락하면 청산
-                                    if roe_peak[symbol] - roe >= DOORSTEP:
-                                        close_short(symbol)
-                                        closed = True
-                                        closed_side = "short"
-                                else:
-                                    # 반대 과상태 벗어나면 그냥 TP 익절
-                                    close_short(symbol)
-                                    closed = True
-                                    closed_side = "short"
-                        else:
-                            # 기본 모드: TP / SL 단순 조건
-                            if roe >= tp_roe or roe <= -sl_roe:
-                                close_short(symbol)
-                                closed = True
-                                closed_side = "short"
-
-                # ---- 롱 포지션 ----
-                elif position[symbol] == "long":
-                    roe = ROE
-
-                    # (a) SL 먼저 체크
-                    if roe <= -sl_roe:
-                        close_long(symbol)
-                        closed = True
-                        closed_side = "long"
 
-                    # (b) TP MODE 처리
-                    if not closed:
-                        if tp_mode == 1:
-                            # 롱: TP 돌파 후 과매수(숏 방향) RSI 상태 유지하며 버티다가
-                            # ROE가 피크에서 DOORSTEP만큼 떨어지면 익절.
-
-                            # 1) 아직 hold 모드 아니고 TP 처음 돌파
-                            if not tp_hold[symbol] and roe >= tp_roe:
-                                tp_hold[symbol]  = True
-                                roe_peak[symbol] = roe
-
-                            # 2) hold 모드일 때
-                            if tp_hold[symbol]:
-                                # 롱이니까 반대 과상태 = 과매수 → RSI >= short_rsi
-                                if RSI >= short_rsi:
-                                    if roe > roe_peak[symbol]:
-                                        roe_peak[symbol] = roe
-
-                                    if roe_peak[symbol] - roe >= DOORSTEP:
-                                        close_long(symbol)
-                                        closed = True
-                                        closed_side = "long"
-                                else:
-                                    # 반대 과상태 벗어나면 그냥 TP 익절
-                                    close_long(symbol)
-                                    closed = True
-                                    closed_side = "long"
-                        else:
-                            # 기본 모드: TP / SL 단순
-                            if roe >= tp_roe or roe <= -sl_roe:
-                                close_long(symbol)
-                                closed = True
-                                closed_side = "long"
-
-                # ---- 청산 후 공통 처리 ----
-                if closed:
-                    position[symbol]    = None
-                    entry_px[symbol]    = None
-                    qty[symbol]         = None
-                    init_margin[symbol] = None
-                    cooldown_bars[symbol] = COOLDOWN_BARS
-                    reset_switch_after_close(symbol, closed_side)
-
-                # ===== 4) 상태 출력 (이모지 그대로 유지) =====
-                print(
-                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-                    f"🪙 {symbol} 🕧 {interval} | 🚩포지션:{position[symbol]} "
-                    f"| RSI:{RSI:.2f} |💸 PnL:{Pnl:.3f} |💎 ROE:{ROE:.2f} "
-                )
-
-            except Exception as e:
-                print(f"[ERROR] {symbol}: {type(e).__name__} {e}")
-                continue
-
-            time.sleep(5)
-        time.sleep(10)
+def on_bar(symbol):
+    """봉 마감마다 (엔진이 서버 시각 기준으로 부름) — 쿨다운 한 봉 차감"""
+    with LOCKS[symbol]:
+        if cooldown_bars[symbol] > 0:
+            cooldown_bars[symbol] -= 1
+
+
+def update():
+    engine = Engine(clock=bybit.server_now_ms)
+    for idx, symbol in enumerate(SYMBOLS):
+        engine.every(POLL_SEC[idx], step, idx, symbol, name=symbol)
+        engine.on_bar_close(INTERVALS[idx], on_bar, symbol, grace=BAR_GRACE, name=symbol)
+    if USE_WS and USE_PRIVATE_WS:
+        bybit.start_account_feed(on_update=engine.trigger(on_account_update, name="account"))
+    bybit.share_session(engine.workers)
+    engine.run()
 
 
 start()
@@ -0,0 +1,161 @@
+"""
+백테스트 공통 (배열 기반)
+- DataFrame 에서 필요한 컬럼을 한 번만 연속 numpy 배열로 꺼내고, 봉 루프는 배열 인덱싱만 사용
+  (ohlc.loc[i, "close"] / Series.iloc[i] 스칼라 접근은 호출마다 수 µs → 스윕 전체에선 대부분의 시간)
+- 시각 문자열은 거래를 기록할 때만 만듦
+- 결과(거래 로그)는 예전 루프와 똑같음
+- first_hits / cross_grid : TP×SL 격자를 진입 구간별 running max/min ROE 로 한 번에 평가
+- trade_roes / trade_score : 거래 로그 → 청산 ROE 배열 / 점수 (sweep.search 의 목표값)
+- trade_stats : 거래 로그 → 요약 지표 (결과 저장소가 조합마다 바로 계산해 둠 → 요약은 조회만)
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import kernels
+
+
+def columns(df: pd.DataFrame, *names: str) -> Tuple[np.ndarray, ...]:
+    """컬럼들 → float64 연속 배열 (ts 는 int64)"""
+    return tuple(np.ascontiguousarray(df[n].to_numpy(dtype=np.int64 if n == "ts" else np.float64))
+                 for n in names)
+
+
+def utc_str(ts_ms) -> str:
+    """ms → 'YYYY-MM-DD HH:MM:SS' (UTC) — 예전 루프와 같은 변환"""
+    return datetime.fromtimestamp(int(ts_ms) // 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def crosses(fast, slow) -> Tuple[np.ndarray, np.ndarray]:
+    """(골든, 데드) — fast > slow 가 직전 봉 대비 바뀐 곳 (NaN 은 False, 첫 봉의 직전 = False)"""
+    gt = np.asarray(fast) > np.asarray(slow)
+    prev = np.zeros_like(gt)
+    prev[1:] = gt[:-1]
+    return (~prev & gt), (prev & ~gt)
+
+
+def utc_strs(ts_ms) -> np.ndarray:
+    """utc_str 의 배열 버전 (봉마다 한 줄씩 남기는 로그용)"""
+    sec = np.asarray(ts_ms, dtype=np.int64) // 1000
+    return pd.to_datetime(sec, unit="s", utc=True).strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+
+
+# ===== TP/SL 격자 한 번에 =====
+def first_hits(roe, tps, sls) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    포지션 하나의 봉별 ROE% 경로 → TP×SL 격자 칸마다 (첫 청산 오프셋, 사유)
+    running max 가 처음 tp 이상 / running min 이 처음 -sl 이하가 되는 봉 (같은 봉이면 TP 우선)
+    둘 다 안 닿으면 (len(roe), kernels.OPEN)
+    """
+    roe = np.asarray(roe, dtype=np.float64)
+    t = np.searchsorted(np.maximum.accumulate(roe), np.asarray(tps, dtype=np.float64), side="left")
+    s = np.searchsorted(-np.minimum.accumulate(roe), np.asarray(sls, dtype=np.float64), side="left")
+    t, s = t[:, None], s[None, :]
+    off = np.minimum(t, s)
+    hit = np.where(off >= len(roe), kernels.OPEN, np.where(t <= s, kernels.TP, kernels.SL))
+    return off, hit
+
+
+def cross_grid(cross_up, cross_dn, roe_path: Callable, tps, sls, start: int = 0) -> Dict[Tuple, List[Tuple]]:
+    """
+    EMA 교차 전략(교차 봉 진입 → TP / SL / 반대 교차 청산)을 TP×SL 격자 전체에 대해 한 번에
+    - 진입은 항상 교차 봉 → 포지션 창 = (교차, 다음 교차], 창마다 ROE 경로와 first_hits 를 한 번만 계산
+    - 격자 칸마다 창을 따라가기만 함: 창 안에서 TP/SL 이면 다음 교차에서, 반대 교차 청산이면 그다음 교차에서 재진입
+    roe_path(entry, side, bars) → bars 에서의 ROE%
+    반환: {(tp, sl): [(진입 봉, 청산 봉 또는 -1, 방향, 사유)]}
+    """
+    up = np.asarray(cross_up, dtype=bool)
+    c = np.flatnonzero(up | np.asarray(cross_dn, dtype=bool))
+    c = c[c >= start]
+    sides = np.where(up[c], kernels.LONG, kernels.SHORT)
+    last = len(up) - 1
+    offs, hits = [], []
+    for j, e in enumerate(c):
+        end = c[j + 1] if j + 1 < len(c) else last
+        off, hit = first_hits(roe_path(e, sides[j], np.arange(e + 1, end + 1)), tps, sls)
+        offs.append(off); hits.append(hit)
+
+    out = {}
+    for a, tp in enumerate(tps):
+        for b, sl in enumerate(sls):
+            trades, j = [], 0
+            while j < len(c):
+                e, side = int(c[j]), int(sides[j])
+                if hits[j][a, b] != kernels.OPEN:
+                    x, reason = e + 1 + int(offs[j][a, b]), int(hits[j][a, b])
+                elif j + 1 < len(c):
+                    x, reason = int(c[j + 1]), kernels.EXIT
+                else:
+                    trades.append((e, -1, side, kernels.OPEN))
+                    break
+                trades.append((e, x, side, reason))
+                j = int(np.searchsorted(c, x, side="right"))
+            out[(tp, sl)] = trades
+    return out
+
+
+# ===== 거래 로그 지표 =====
+def closed(log: pd.DataFrame) -> pd.DataFrame:
+    """청산 행만 — '포지션' 열이 있으면 CLOSE 행 (봉마다 남기는 로그 대응)"""
+    return log[log["포지션"] == "CLOSE"] if "포지션" in log.columns else log
+
+
+def trade_roes(log: pd.DataFrame) -> np.ndarray:
+    """청산된 거래의 ROE 배열"""
+    log = closed(log)
+    return log["ROE"].to_numpy(dtype=np.float64) if len(log) else np.empty(0)
+
+
+PNL_COLUMNS = ("미실현PnL", "PnL")   # 스크립트마다 다른 손익 열 이름
+STATS = ("trades", "total_pnl", "total_roe_pct", "win_rate_pct", "min_pnl", "min_roe_pct",
+         "max_drawdown_pct", "profit_factor", "sharpe", "first_trade_at", "last_trade_at")
+
+
+def trade_stats(log: pd.DataFrame) -> Dict[str, Any]:
+    """
+    거래 로그 하나의 요약 (청산 거래 기준, 배열 연산만)
+    - max_drawdown_pct: 누적 ROE(증거금 대비 %) 곡선의 고점 대비 최대 하락 (시작 0 포함)
+    - profit_factor: 이익 합 / 손실 합 (손실 없으면 inf), sharpe: 거래당 ROE 평균 / 표준편차 (연율화 없음)
+    """
+    log = closed(log)
+    n = len(log)
+    out = dict.fromkeys(STATS, None)
+    out.update(trades=n, total_pnl=0.0, total_roe_pct=0.0, win_rate_pct=0.0, min_pnl=0.0, min_roe_pct=0.0,
+               max_drawdown_pct=0.0)
+    if n == 0:
+        return out
+    roe = log["ROE"].to_numpy(dtype=np.float64)
+    pnl_col = next((c for c in PNL_COLUMNS if c in log.columns), None)
+    pnl = log[pnl_col].to_numpy(dtype=np.float64) if pnl_col else np.zeros(n)
+
+    curve = np.cumsum(roe)
+    peak = np.maximum.accumulate(np.maximum(curve, 0.0))
+    gain, loss = roe[roe > 0].sum(), -roe[roe < 0].sum()
+    sd = roe.std(ddof=1) if n > 1 else 0.0
+    out.update(total_pnl=float(pnl.sum()), total_roe_pct=float(roe.sum()),
+               win_rate_pct=float((roe > 0).mean() * 100.0),
+               min_pnl=float(pnl.min()), min_roe_pct=float(roe.min()),
+               max_drawdown_pct=float((peak - curve).max()),
+               profit_factor=float(gain / loss) if loss > 0 else (float("inf") if gain > 0 else None),
+               sharpe=float(roe.mean() / sd) if sd > 0 else None)
+    if "datetime" in log.columns:
+        out.update(first_trade_at=str(log["datetime"].min()), last_trade_at=str(log["datetime"].max()))
+    return out
+
+
+# 클수록 좋은 값으로 (search 는 최대화)
+METRICS: Dict[str, Callable[[np.ndarray], float]] = {
+    "total_roe":   lambda r: float(r.sum()),
+    "win_rate":    lambda r: float((r > 0).mean()) if len(r) else 0.0,
+    "worst_trade": lambda r: float(r.min()) if len(r) else 0.0,
+}
+
+
+def trade_score(metric: str, result) -> float:
+    """거래 로그(DataFrame) 점수 — TP×SL 격자 결과(dict)면 가장 좋은 칸의 점수"""
+    if isinstance(result, dict):
+        return max((trade_score(metric, v) for v in result.values()), default=float("-inf"))
+    return METRICS[metric](trade_roes(result))
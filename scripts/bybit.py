@@ -1,9 +1,14 @@
 from dotenv import load_dotenv, find_dotenv
-from pybit.unified_trading import HTTP
+from mock_bybit import make_session   # BYBIT_MOCK=1 이면 오프라인 대역
 import os, json, time
 import pandas as pd
 from datetime import datetime
 from decimal import Decimal
+from kline import parse_kline
+from incremental import RSIState
+from market_feed import MarketFeed
+from private_feed import AccountFeed, is_primary
+from ratelimit import TokenBucket, LimitedAdapter
 
 # ====== 환경 설정 ======
 load_dotenv(find_dotenv(), override=True)
@@ -11,7 +16,7 @@ _api_key = os.getenv("API_KEY")
 _api_secret = os.getenv("API_KEY_SECRET")
 
 # ====== Bybit 세션 생성 (recv_window 60초 설정) ======
-session = HTTP(
+session = make_session(
     testnet=False,
     api_key=_api_key,
     api_secret=_api_secret,
@@ -20,11 +25,33 @@ session = HTTP(
 
 BYBIT_BASE = "https://api.bybit.com"
 
+# 엔진(engine.Engine)의 심볼 task 들이 같이 쓰는 REST 속도 상한 (share_session)
+REST_RPS = 10
+
+# 거래소 서버 시각 = 로컬 시각 + 오프셋 (봉 마감 스케줄용, CLOCK_SYNC_SEC 마다 다시 맞춤)
+CLOCK_SYNC_SEC = 600
+_clock = {"offset": 0.0, "at": None}
+
 # -- 실행 코드에서 할당
 PCT = 0
 SYMBOLS = []
 entry_px = {s: None for s in SYMBOLS}
 
+# get_RSI 스트리밍 상태 — (symbol, interval, period) → RSIState
+RSI_WARMUP = 200
+rsi_state = {}
+
+# WebSocket 시세 (start_feed 후) — 구독한 심볼/인터벌의 kline·현재가는 REST 대신 메모리 버퍼에서
+FEED = None
+
+# 포지션 스냅샷 — POSITION_TTL 초 안의 조회는 get_positions(settleCoin="USDT") 한 번을 같이 씀
+# (get_PnL / get_ROE / get_position_size ... 를 연달아 불러도 요청 1번, 우리 주문 뒤엔 무효화)
+POSITION_TTL = 1.0
+_positions = {"at": None, "rows": {}}
+
+# private WebSocket 계좌 상태 (start_account_feed 후) — 포지션은 거래소 push + 시세 피드 markPrice 로 메모리에서
+ACCOUNT = None
+
 
 # ====== 함수 정의 ======
 
@@ -34,6 +61,29 @@ def get_usdt():
     return float(coin.get("equity"))
 
 
+def share_session(workers, rate=REST_RPS):
+    """여러 스레드가 session 하나를 같이 쓰도록 — 연결 풀 크기 = workers, 모든 요청이 토큰 버킷 하나를 거침"""
+    client = getattr(session, "client", None)   # MockHTTP 는 한도 없음
+    if client is None:
+        return
+    adapter = LimitedAdapter(TokenBucket(rate), pool_connections=1, pool_maxsize=int(workers))
+    client.mount("https://", adapter)
+
+
+def server_now_ms():
+    """거래소 서버 시각(ms) — get_server_time 왕복의 중간 시점 기준으로 오프셋을 잼"""
+    if _clock["at"] is None or time.monotonic() - _clock["at"] > CLOCK_SYNC_SEC:
+        try:
+            t0 = time.time()
+            r = session.get_server_time()
+            t1 = time.time()
+            _clock["offset"] = int(r["result"]["timeNano"]) / 1e6 - (t0 + t1) / 2 * 1000
+        except Exception as e:
+            print(f"📛 get_server_time 오류: {e}")   # 직전 오프셋 그대로
+        _clock["at"] = time.monotonic()
+    return time.time() * 1000 + _clock["offset"]
+
+
 def set_leverage(symbol, leverage):
     try:
         r = session.set_leverage(
@@ -47,7 +97,36 @@ def set_leverage(symbol, leverage):
         print(f"📛 {symbol} 레버리지 이미 설정 되었습니다.")
 
 
+def start_feed(pairs, warmup=RSI_WARMUP):
+    """(symbol, interval) 목록 구독 → 이후 get_kline_http / get_close_price / get_RSI / get_current_price 는 버퍼에서"""
+    global FEED
+    if FEED is None:
+        FEED = MarketFeed(session)
+    for symbol, interval in pairs:
+        FEED.subscribe(symbol, interval, warmup=warmup)
+    print(f"📡 WebSocket 시세 구독: {', '.join(f'{s}@{i}' for s, i in FEED.bars)}")
+    return FEED
+
+
+def start_account_feed(on_update=None):
+    """private 스트림 구독 (start_feed 다음에) → 포지션 조회는 메모리에서, on_update(symbol) 은 포지션/시세 갱신마다
+    (on_update 는 스트림 스레드에서 불림 → Engine.trigger 나 큐로 넘기기만, 주문은 전략 루프에서)"""
+    global ACCOUNT
+    if ACCOUNT is None:
+        ACCOUNT = AccountFeed(session, api_key=_api_key, api_secret=_api_secret, market=FEED)
+        ACCOUNT.start()
+        get_positions(force=True)   # 시작 상태는 REST 로
+        print(f"📡 WebSocket 계좌 구독: position/order/execution/wallet (보유 {len(ACCOUNT.positions)})")
+    if on_update is not None:
+        ACCOUNT.on_update(on_update)
+    return ACCOUNT
+
+
 def get_kline_http(symbol, interval, limit=200):
+    if FEED is not None:
+        rows = FEED.kline(symbol, interval, limit)
+        if rows is not None:
+            return rows
     r = session.get_kline(
         category="linear",
         symbol=str(symbol).upper(),
@@ -61,13 +140,49 @@ def get_kline(symbol, interval):
     return get_kline_http(symbol, interval)
 
 
+def get_positions(force=False):
+    """
+    USDT 무기한 전체 포지션 {symbol: 행} — 계좌 스트림이 맞으면 메모리, 아니면 TTL 안의 직전 스냅샷 (size 0 인 행은 뺌)
+    헤지 모드는 매수 쪽(positionIdx 1) 행만 — 예전 심볼 조회의 lst[0] 과 같은 행 (매도 쪽이 덮어쓰지 않게)
+    """
+    if ACCOUNT is not None and not force and ACCOUNT.fresh():
+        rows = ACCOUNT.snapshot()
+        if rows is not None:
+            return rows
+    now = time.monotonic()
+    if force or _positions["at"] is None or now - _positions["at"] > POSITION_TTL:
+        rows, cursor = {}, None
+        while True:
+            kw = {"cursor": cursor} if cursor else {}
+            r = session.get_positions(category="linear", settleCoin="USDT", limit=200, **kw)
+            res = r.get("result", {})
+            for p in res.get("list") or []:
+                if is_primary(p) and float(p.get("size") or 0) > 0:
+                    rows[p["symbol"]] = p
+            cursor = res.get("nextPageCursor")
+            if not cursor:
+                break
+        _positions["rows"], _positions["at"] = rows, now
+        if ACCOUNT is not None:
+            ACCOUNT.seed(rows, now)
+    return _positions["rows"]
+
+
+def invalidate_positions(symbol=None, sent_at=None):
+    """주문 직후 — 다음 조회는 새로 (계좌 스트림은 sent_at 이후 그 심볼 메시지가 올 때까지 REST)"""
+    _positions["at"] = None
+    if ACCOUNT is not None and symbol is not None:
+        ACCOUNT.expect(symbol, sent_at)
+
+
+def get_position(symbol):
+    """심볼 포지션 행 (없으면 {})"""
+    return get_positions().get(str(symbol).upper(), {})
+
+
 def get_PnL(symbol):
     try:
-        r = session.get_positions(category="linear", symbol=str(symbol).upper())
-        lst = r.get("result", {}).get("list") or []
-        if not lst:
-            return 0.0
-        v = lst[0].get("unrealisedPnl")
+        v = get_position(symbol).get("unrealisedPnl")
         return float(v) if v not in ("", None) else 0.0
     except Exception as e:
         print(f"📛 get_PnL 오류: {e}")
@@ -76,11 +191,9 @@ def get_PnL(symbol):
 
 def get_ROE(symbol):
     try:
-        r = session.get_positions(category="linear", symbol=str(symbol).upper())
-        lst = r.get("result", {}).get("list") or []
-        if not lst:
+        pos = get_position(symbol)
+        if not pos:
             return 0.0
-        pos = lst[0]
         unreal = float(pos.get("unrealisedPnl", 0) or 0)
         position_im = float(pos.get("positionIM", 0) or 0)
         return (unreal / position_im * 100) if position_im > 0 else 0.0
@@ -90,20 +203,26 @@ def get_ROE(symbol):
 
 
 def get_RSI(symbol, interval, period=14):
-    closes = [float(k[4]) for k in get_kline(symbol, interval)]
-    series = pd.Series(closes)
-    delta = series.diff()
-    up = delta.clip(lower=0)
-    down = -delta.clip(upper=0)
-    avg_gain = up.ewm(alpha=1 / period, adjust=False).mean()
-    avg_loss = down.ewm(alpha=1 / period, adjust=False).mean()
-    rs = avg_gain / avg_loss.replace(0, 1e-10)
-    rsi = 100 - (100 / (1 + rs))
-    return float(rsi.iloc[-1])
+    """진행 중인 봉 기준 RSI — 처음만 RSI_WARMUP 개로 워밍업, 이후엔 최근 3봉만 받아 갱신"""
+    key = (str(symbol).upper(), str(interval), int(period))
+    st = rsi_state.get(key)
+    if st is not None:
+        kl = parse_kline(get_kline_http(symbol, interval, limit=3))
+        rsi = st.sync(kl["ts"], kl["close"])
+        if rsi is not None:
+            return float(rsi)
+    # 처음이거나 폴링 사이에 봉을 놓침 → 다시 워밍업
+    st = rsi_state[key] = RSIState(period)
+    kl = parse_kline(get_kline_http(symbol, interval, limit=RSI_WARMUP))
+    return float(st.sync(kl["ts"], kl["close"]))
 
 
 def get_current_price(symbol):
     s = str(symbol).upper()
+    if FEED is not None:
+        px = FEED.price(s)
+        if px is not None:
+            return px
     r = session.get_tickers(category="linear", symbol=s)
     lst = r["result"]["list"]
     if not lst:
@@ -115,9 +234,16 @@ def get_current_price(symbol):
 
 
 def get_position_size(symbol):
-    r = session.get_positions(category="linear", symbol=str(symbol).upper())
-    lst = r.get("result", {}).get("list") or []
-    return 0.0 if not lst else float(lst[0].get("size", 0) or 0.0)
+    return float(get_position(symbol).get("size", 0) or 0.0)
+
+
+def get_position_side(symbol):
+    """"Buy" / "Sell" / "" (없음)"""
+    return get_position(symbol).get("side") or ""
+
+
+def get_entry_price(symbol):
+    return float(get_position(symbol).get("avgPrice", 0) or 0.0)
 
 
 def get_close_price(symbol, interval):
@@ -155,6 +281,7 @@ def entry_position(symbol, side, leverage):
         print(f"📛 수량 부족: raw={raw_qty:.8f}, adj={adj_qty:.8f}, min={min_qty}")
         return None, 0
 
+    sent_at = time.monotonic()
     r = session.place_order(
         category="linear",
         symbol=str(symbol).upper(),
@@ -164,6 +291,7 @@ def entry_position(symbol, side, leverage):
         isLeverage=1,
         reduceOnly=False,
     )
+    invalidate_positions(symbol, sent_at)
     if r.get("retCode") != 0:
         print(f"📛 주문 실패: {r.get('retMsg')}")
         return None, 0
@@ -182,6 +310,7 @@ def close_position(symbol, side):
     ep = entry_px.get(symbol)
     profit_pct = ((current_price - ep) / ep * 100) if ep else 0.0
 
+    sent_at = time.monotonic()
     r = session.place_order(
         category="linear",
         symbol=str(symbol).upper(),
@@ -191,5 +320,6 @@ def close_position(symbol, side):
         isLeverage=1,
         reduceOnly=True,
     )
+    invalidate_positions(symbol, sent_at)
     print(f"📍 {symbol} 포지션 종료 / 수량 {qty} / 💹 수익률 {profit_pct:.2f}%")
 
@@ -0,0 +1,611 @@
+"""
+로컬 OHLCV 캔들 저장소
+- (category, symbol, interval) 단위로 컬럼별 .npy 파일(ts/open/high/low/close/volume)에 저장
+- 백테스트 fetcher 들은 전부 여기를 거쳐서 읽음 → 같은 심볼/TF는 한 번만 다운로드
+- meta.json 의 ranges = 거래소에 이미 물어본 구간 → 그 밖의 구간만 네트워크로 가져옴
+  pending = 동기화 도중 끊겨 못 받은 창 (다음 fill_gaps 가 그것만 다시 받음)
+- 읽기는 np.load(mmap_mode="r") → 열기 O(1), 프로세스끼리 페이지 캐시를 공유 (워커당 추가 RSS 없음)
+- 쓰기는 버전별 파일({col}.{version}.npy)로 → 다른 프로세스가 매핑 중인 파일을 덮어쓰지 않음
+- 다운로드는 구간을 봉 PAGE_LIMIT 개짜리 창으로 미리 나눠 스레드 풀로 동시에 요청
+  (모든 심볼이 토큰 버킷 LIMITER 하나를 공유 → 전체 요청 속도는 MAX_RPS 이하)
+- 스윕 워커는 부모가 공유 메모리에 올린 캔들을 PINNED 로 받아 씀 (sweep.py)
+- arrays(..., span=0.1) 은 구간의 최근 10% 봉만 돌려줌 (sweep.search 의 짧은 구간 평가용)
+- 상위 TF 는 저장된 1분봉(BASE_TF)에서 로컬로 만들 수 있음 (resample, Bybit 봉 경계 기준)
+  1분봉이 덜 찬 봉(저장 안 된 구간, 잘린 첫 봉)은 버림 — 거래소에도 없던 구멍(meta.holes)은 찬 것으로 봄
+  Bybit 에 없는 TF(45, 90 ...)는 항상 1분봉에서 만들고, 결과는 '{tf}.from1' 폴더에 캐시
+"""
+
+import os, json, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kline import parse_kline
+from ratelimit import TokenBucket
+
+COLUMNS = ["ts","open","high","low","close","volume"]
+PAGE_LIMIT = 1000
+
+MAX_RPS     = 40    # 전체 kline 요청 속도 상한 (Bybit 공개 API IP 한도보다 충분히 낮게)
+MAX_WORKERS = 8     # 동시 요청 스레드 수
+LIMITER = TokenBucket(rate=MAX_RPS, burst=MAX_WORKERS)
+
+DEFAULT_ROOT = os.getenv("CANDLE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "candles"
+)
+DEFAULT_START = "2018-01-01"
+
+# Bybit UTA 인터벌 → 분 (M은 가변 길이라 31일로 근사)
+INTERVAL_MINUTES = {
+    "1":1, "3":3, "5":5, "15":15, "30":30, "60":60,
+    "120":120, "240":240, "360":360, "720":720,
+    "D":1440, "W":10080, "M":44640,
+}
+BASE_TF = "1"                 # 로컬 리샘플링의 원본 TF
+WEEK_OFFSET_MS = 4 * 86_400_000   # 1970-01-01 은 목요일 → 주봉은 월요일 00:00 UTC 시작
+RESAMPLE_RULE = 2             # 집계 규칙이 바뀌면 올림 → '{tf}.from1' 캐시를 다시 만듦 (2: 1분봉이 덜 찬 봉 제외)
+
+# 스윕 워커가 공유 메모리에서 꽂아 넣는 캔들 (sweep.py) — arrays() 가 저장소보다 먼저 봄
+PINNED: Dict[Tuple, "Candles"] = {}
+
+
+def pin_key(symbol: str, tf, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int]) -> Tuple:
+    return (symbol.upper(), str(tf).upper(), start_ms, end_ms, int(cap) if cap else None)
+
+
+# ================= 인터벌 유틸 =================
+def bybit_interval(tf) -> str:
+    tf = str(tf).upper()
+    if tf not in INTERVAL_MINUTES:
+        raise ValueError(f"unsupported tf: {tf}")
+    return tf
+
+def is_native(tf) -> bool:
+    """Bybit 가 직접 주는 TF 인지"""
+    return str(tf).upper() in INTERVAL_MINUTES
+
+def tf_minutes(tf) -> int:
+    tf = str(tf).upper()
+    if tf in INTERVAL_MINUTES:
+        return INTERVAL_MINUTES[tf]
+    if tf.isdigit() and int(tf) > 0:   # 45, 90 같은 임의 분봉 (1분봉에서 만듦)
+        return int(tf)
+    raise ValueError(f"unsupported tf: {tf}")
+
+def interval_ms(tf) -> int:
+    return tf_minutes(tf) * 60_000
+
+def now_ms() -> int:
+    return int(datetime.now(tz=timezone.utc).timestamp() * 1000)
+
+def parse_date_ms(s: Optional[str]) -> Optional[int]:
+    if not s: return None
+    try:
+        dt = datetime.fromisoformat(s)
+    except ValueError:
+        dt = datetime.strptime(s, "%Y-%m-%d")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+def empty_frame() -> pd.DataFrame:
+    return pd.DataFrame(columns=COLUMNS).astype({
+        "ts":"int64","open":"float64","high":"float64","low":"float64","close":"float64","volume":"float64"
+    })
+
+
+# ================= 구간(range) 계산 =================
+def merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    out: List[List[int]] = []
+    for a, b in sorted(ranges):
+        if out and a <= out[-1][1] + 1:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return out
+
+def missing_ranges(ranges: List[List[int]], start: int, end: int) -> List[Tuple[int,int]]:
+    """[start, end] 중 ranges 로 덮이지 않은 부분 (양끝 포함, ms)"""
+    out: List[Tuple[int,int]] = []
+    cur = start
+    for a, b in merge_ranges(ranges):
+        if b < cur: continue
+        if a > end: break
+        if a > cur:
+            out.append((cur, a - 1))
+        cur = max(cur, b + 1)
+        if cur > end: break
+    if cur <= end:
+        out.append((cur, end))
+    return out
+
+def page_windows(start_ms: int, end_ms: int, tf) -> List[Tuple[int,int]]:
+    """[start, end] 를 봉 PAGE_LIMIT 개 이하짜리 창으로 미리 나눔 (창 하나 = 요청 1번)"""
+    span = PAGE_LIMIT * interval_ms(tf)
+    return [(a, min(a + span - 1, end_ms)) for a in range(start_ms, end_ms + 1, span)]
+
+
+# ================= 리샘플링 =================
+def bucket_start(ts, tf):
+    """ts(ms) 가 속한 봉의 시작 시각 — Bybit 경계: 분봉/D 는 UTC 기준 배수, W 는 월요일, M 은 매월 1일"""
+    tf = str(tf).upper()
+    ts = np.asarray(ts, dtype=np.int64)
+    if tf == "M":
+        return ts.astype("datetime64[ms]").astype("datetime64[M]").astype("datetime64[ms]").astype(np.int64)
+    step = interval_ms(tf)
+    off = WEEK_OFFSET_MS if tf == "W" else 0
+    return (ts - off) // step * step + off
+
+def bucket_end(start, tf) -> np.ndarray:
+    """봉 시작 시각들 → 각 봉이 닫히는 시각 (M 은 다음 달 1일)"""
+    start = np.asarray(start, dtype=np.int64)
+    if str(tf).upper() == "M":
+        return bucket_start(start + 32 * 86_400_000, "M")
+    return start + interval_ms(tf)
+
+def bar_close(ts, tf) -> int:
+    """ts(ms) 가 속한 봉이 닫히는 시각 (= 다음 봉 시작)"""
+    return int(bucket_end(bucket_start(int(ts), tf), tf))
+
+def resample(cols: Dict[str, np.ndarray], tf, holes: List[List[int]] = (),
+             now_ms: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """1분봉 → tf 봉 (open=첫값, high=최대, low=최소, close=마지막, volume=합)
+    1분봉이 다 있는 봉만 — 빠진 분이 거래소에도 없던 구멍(holes, [a, b] ms)이 아니면 버림
+    (저장 안 된 구간에 걸친 봉, 잘린 첫 봉 등). 단 now_ms 에 아직 진행 중인 마지막 봉은 남김"""
+    ts = np.asarray(cols["ts"])
+    if len(ts) == 0:
+        return {c: np.asarray(cols[c])[:0].copy() for c in COLUMNS}
+    b = bucket_start(ts, tf)
+    first = np.concatenate([[0], np.flatnonzero(np.diff(b)) + 1])
+    last = np.concatenate([first[1:] - 1, [len(ts) - 1]])
+    start, end = b[first], bucket_end(b[first], tf)
+    have = last - first + 1
+    for a, z in holes:
+        have = have + np.clip(np.minimum(int(z) + 1, end) - np.maximum(int(a), start), 0, None) // 60_000
+    full = have >= (end - start) // 60_000
+    if now_ms is not None:
+        full[-1] |= bool(end[-1] > now_ms)
+    return {
+        "ts":     start[full],
+        "open":   np.asarray(cols["open"])[first[full]],
+        "high":   np.maximum.reduceat(np.asarray(cols["high"]), first)[full],
+        "low":    np.minimum.reduceat(np.asarray(cols["low"]), first)[full],
+        "close":  np.asarray(cols["close"])[last[full]],
+        "volume": np.add.reduceat(np.asarray(cols["volume"]), first)[full],
+    }
+
+
+# ================= 저장소 =================
+class CandleStore:
+    def __init__(self, root: Optional[str] = None, session=None, category: str = "linear",
+                 max_retry: int = 3, max_workers: int = MAX_WORKERS, limiter: TokenBucket = LIMITER,
+                 derive="auto"):
+        """
+        derive: Bybit 지원 TF 를 1분봉에서 만들지
+          "auto" — 1분봉이 이미 그 구간을 다 갖고 있으면 로컬 생성, 아니면 직접 다운로드
+          True   — 항상 1분봉에서 (1분봉 한 번만 받고 TF 스윕 전체를 로컬로)
+          False  — 항상 직접 다운로드
+        (Bybit 에 없는 TF 는 설정과 무관하게 항상 1분봉에서 만듦)
+        """
+        # 세션이 자기 저장 위치를 주면(오프라인 대역 등) 실제 캐시와 섞이지 않게 그쪽을 씀
+        self.root = os.path.abspath(root or getattr(session, "candle_root", None) or DEFAULT_ROOT)
+        self.derive = derive
+        self.session = session
+        self.category = category
+        self.max_retry = max_retry
+        self.max_workers = max_workers
+        self.limiter = limiter
+        # 창 다운로드 풀 하나 — sync_all 의 여러 시리즈 스레드가 같이 씀 (스레드는 첫 요청 때 생김)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kline")
+        # END=None 은 저장소 생성 시각으로 고정 → 한 스윕 안의 모든 조합이 같은 캔들을 봄
+        self.now_ms = now_ms()
+        self._mem: Dict[Tuple[str,str], Tuple[int, Dict[str, np.ndarray]]] = {}
+        # 이번 프로세스에서 받은 구간 (아직 안 닫힌 봉 포함) → 스윕 중 같은 꼬리를 또 받지 않음
+        self._fetched: Dict[Tuple[str,str], List[List[int]]] = {}
+
+    def close(self):
+        """다운로드 스레드 풀 정리"""
+        self._pool.shutdown(wait=True)
+
+    # ---------- 파일 ----------
+    def _dir(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, self.category, symbol.upper(), interval)
+
+    def _load_meta(self, symbol: str, interval: str) -> dict:
+        path = os.path.join(self._dir(symbol, interval), "meta.json")
+        if not os.path.exists(path):
+            return {"ranges": [], "version": 0}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _open_files(self, d: str, version: int) -> Dict[str, np.ndarray]:
+        cols = {}
+        for c in COLUMNS:
+            path = os.path.join(d, f"{c}.{version}.npy")
+            if not os.path.exists(path):
+                path = os.path.join(d, f"{c}.npy")   # 버전 없는 예전 형식
+            cols[c] = np.load(path, mmap_mode="r")
+        return cols
+
+    def _read(self, symbol: str, interval: str) -> Dict[str, np.ndarray]:
+        """저장된 시리즈를 읽기 전용 memmap 으로 (메모리 캐시는 meta.version 이 같을 때만 재사용)"""
+        key = (symbol.upper(), interval)
+        version = int(self._load_meta(symbol, interval).get("version", 0))
+        hit = self._mem.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        if version == 0:
+            cols = {c: np.empty(0, dtype=np.int64 if c == "ts" else np.float64) for c in COLUMNS}
+        else:
+            cols = self._open_files(self._dir(symbol, interval), version)
+        self._mem[key] = (version, cols)
+        return cols
+
+    def _write(self, symbol: str, interval: str, cols: Dict[str, np.ndarray], meta: dict):
+        d = self._dir(symbol, interval)
+        os.makedirs(d, exist_ok=True)
+        version = int(meta.get("version", 0)) + 1
+        # 새 버전 파일에 쓰고(임시 파일 → os.replace) 마지막에 meta 를 바꿈 → 읽는 쪽은 항상 완성된 버전만 봄
+        for c in COLUMNS:
+            tmp = os.path.join(d, f"{c}.{version}.npy.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(cols[c]))
+            os.replace(tmp, os.path.join(d, f"{c}.{version}.npy"))
+        meta["version"] = version
+        meta["updated"] = now_ms()
+        tmp = os.path.join(d, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(d, "meta.json"))
+        self._cleanup(d, keep={version, version - 1})
+        self._mem[(symbol.upper(), interval)] = (version, self._open_files(d, version))
+
+    @staticmethod
+    def _cleanup(d: str, keep: set):
+        """이전 버전 파일 정리 — 직전 버전은 남김 (막 meta 를 읽은 다른 프로세스용).
+        다른 프로세스가 매핑 중이라 못 지우면(Windows) 다음 쓰기 때 다시 시도"""
+        for fname in os.listdir(d):
+            parts = fname.split(".")
+            if parts[-1] != "npy" or parts[0] not in COLUMNS: continue
+            if len(parts) == 3 and parts[1].isdigit() and int(parts[1]) in keep: continue
+            try:
+                os.remove(os.path.join(d, fname))
+            except OSError:
+                pass
+
+    # ---------- 네트워크 ----------
+    def _get_kline(self, **kw) -> list:
+        last_exc = None
+        for _ in range(self.max_retry):
+            self.limiter.acquire()
+            try:
+                resp = self.session.get_kline(category=self.category, **kw)
+            except Exception as e:
+                last_exc = e
+                time.sleep(0.3)
+                continue
+            if resp.get("retCode") == 10006:   # 요청 과다 → 잠깐 쉬고 재시도
+                last_exc = RuntimeError(resp.get("retMsg"))
+                time.sleep(1.0)
+                continue
+            if resp.get("retCode") != 0:
+                raise RuntimeError(resp.get("retMsg", "bybit error"))
+            return resp.get("result", {}).get("list", [])
+        raise RuntimeError(f"Bybit API error: {last_exc}")
+
+    def _download_window(self, symbol: str, interval: str, start_ms: int, end_ms: int) -> Dict[str, np.ndarray]:
+        """봉 PAGE_LIMIT 개 이하로 잘린 [start_ms, end_ms] 창 하나 = 요청 1번"""
+        lst = self._get_kline(symbol=symbol, interval=interval,
+                              start=start_ms, end=end_ms, limit=PAGE_LIMIT)
+        cols = parse_kline(lst)
+        i0 = np.searchsorted(cols["ts"], start_ms, side="left")
+        i1 = np.searchsorted(cols["ts"], end_ms, side="right")
+        return {c: cols[c][i0:i1] for c in COLUMNS}
+
+    def _fetch_pages(self, symbol: str, interval: str, windows: List[Tuple[int,int]]) -> List[Dict[str, np.ndarray]]:
+        """창 목록을 스레드 풀로 동시에 요청 (순서는 windows 와 같음)"""
+        if self.session is None:
+            raise RuntimeError("CandleStore: session 이 없어 다운로드할 수 없습니다.")
+        if len(windows) <= 1:
+            return [self._download_window(symbol, interval, a, b) for a, b in windows]
+        return list(self._pool.map(lambda w: self._download_window(symbol, interval, *w), windows))
+
+    @staticmethod
+    def _concat(pages: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """페이지들을 합치고 ts 중복 제거 + 오름차순"""
+        if not pages:
+            return parse_kline([])
+        cols = {c: np.concatenate([p[c] for p in pages]) for c in COLUMNS}
+        _, idx = np.unique(cols["ts"], return_index=True)
+        return {c: cols[c][idx] for c in COLUMNS}
+
+    @staticmethod
+    def _merge(old: Dict[str, np.ndarray], new: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """ts 기준 병합 — 같은 ts 는 새 값 우선, 결과는 오름차순"""
+        ts = np.concatenate([new["ts"], old["ts"]])
+        _, idx = np.unique(ts, return_index=True)   # 첫 등장(=new) 인덱스, ts 오름차순
+        return {c: np.concatenate([new[c], old[c]])[idx] for c in COLUMNS}
+
+    def _commit(self, symbol: str, interval: str, cols: Dict[str, np.ndarray], meta: dict,
+                spans: List[Tuple[int,int]], pending: Optional[List[Tuple[int,int]]] = None):
+        """받은 구간(spans)을 meta.ranges 에 반영하고 저장
+        pending: 이번 동기화에서 아직 못 받은 창 (체크포인트) → meta.pending 에 기록, 받은 구간은 pending 에서 뺌"""
+        key = (symbol.upper(), interval)
+        # 아직 안 닫힌 봉은 '확인된 구간'에서 제외 → 다음 실행 때 다시 받아 덮어씀
+        closed_until = self.now_ms - interval_ms(interval)
+        done = [[a, min(b, closed_until)] for a, b in spans if a <= min(b, closed_until)]
+        meta["ranges"] = merge_ranges(meta["ranges"] + done)
+        got = [list(r) for r in spans]
+        meta["pending"] = [list(r) for a, b in merge_ranges(meta.get("pending", []) + [list(r) for r in pending or []])
+                           for r in missing_ranges(got, a, b)]
+        self._fetched[key] = merge_ranges(self._fetched.get(key, []) + [list(r) for r in spans])
+        self._write(symbol, interval, cols, meta)
+
+    def ensure(self, symbol: str, tf, start_ms: int, end_ms: int) -> Dict[str, np.ndarray]:
+        """[start_ms, end_ms] 중 저장 안 된 구간만 받아서 저장소에 합침"""
+        interval = bybit_interval(tf)
+        meta = self._load_meta(symbol, interval)
+        cols = self._read(symbol, interval)
+        key = (symbol.upper(), interval)
+        todo = missing_ranges(meta["ranges"] + self._fetched.get(key, []), start_ms, end_ms)
+        if not todo:
+            return cols
+
+        windows = [w for a, b in todo for w in page_windows(a, b, interval)]
+        cols = self._merge(cols, self._concat(self._fetch_pages(symbol, interval, windows)))
+        self._commit(symbol, interval, cols, meta, todo)
+        return self._read(symbol, interval)
+
+    # ---------- 증분 동기화 ----------
+    def gaps(self, symbol: str, tf) -> List[Tuple[int,int]]:
+        """
+        저장된 구간 안의 빈 곳
+        - 동기화 도중 끊겨 못 받은 창 (meta.pending — 체크포인트 때 기록) 중 아직 안 덮인 곳
+          (meta.ranges 사이의 빈 곳 자체는 구멍이 아님: START 가 다른 ensure 두 번이면 원래 떨어져 있음)
+        - 확인된 구간 안인데 봉이 빠진 곳 (ts 간격 > interval) — 거래소에도 없던 구멍(meta.holes)은 제외
+        """
+        interval = bybit_interval(tf)
+        meta = self._load_meta(symbol, interval)
+        ranges = merge_ranges(meta["ranges"])
+        out: List[Tuple[int,int]] = [g for a, b in meta.get("pending", []) for g in missing_ranges(ranges, a, b)]
+
+        if interval != "M":   # 월봉은 길이가 달라 간격 검사 안 함
+            ts = self._read(symbol, interval)["ts"]
+            step = interval_ms(interval)
+            idx = np.nonzero(np.diff(ts) > step)[0]
+            known = {tuple(h) for h in meta.get("holes", [])}
+            for a, b in zip(ts[idx] + step, ts[idx + 1] - 1):
+                a, b = int(a), int(b)
+                if (a, b) in known: continue
+                # 확인된 구간 안쪽만
+                if any(ra <= a and b <= rb for ra, rb in ranges):
+                    out.append((a, b))
+        return sorted(out)
+
+    def sync(self, symbol: str, tf, start_ms: Optional[int] = None, fill_gaps: bool = True,
+             checkpoint_pages: int = 50) -> int:
+        """
+        꼬리 이어받기: 저장된 마지막 ts 부터 현재까지 창 단위로 (창들은 동시에) 요청
+        - 마지막 봉(당시 미확정)도 다시 받아 덮어씀
+        - checkpoint_pages 페이지마다 저장 → 중간에 죽어도 받은 만큼은 남음
+          (남은 창은 meta.pending 에 기록 → 다음 gaps()/fill_gaps() 가 그 창만 다시 받음)
+        - start_ms 가 있으면 그 이후 빠진 과거 구간도 채움 (비어 있는 시리즈는 없으면 DEFAULT_START 부터)
+        반환: 요청 횟수
+        """
+        self.now_ms = now_ms()
+        tf = str(tf).upper()
+        return self._sync(symbol, tf if is_native(tf) else BASE_TF, start_ms, fill_gaps, checkpoint_pages)
+
+    def _sync(self, symbol: str, interval: str, start_ms: Optional[int], fill_gaps: bool,
+              checkpoint_pages: int) -> int:
+        meta = self._load_meta(symbol, interval)
+        cols = self._read(symbol, interval)
+        n_req = 0
+
+        if len(cols["ts"]):
+            s = int(cols["ts"][-1])
+            if meta["ranges"]:   # 확인된 구간 끝과 이어 붙여서 사이에 구멍이 안 생기게
+                s = min(s, merge_ranges(meta["ranges"])[-1][1] + 1)
+            if start_ms is not None and start_ms < s:   # 과거 백필
+                todo = missing_ranges(meta["ranges"], start_ms, s - 1)
+                windows = [w for a, b in todo for w in page_windows(a, b, interval)]
+                if windows:
+                    cols = self._merge(cols, self._concat(self._fetch_pages(symbol, interval, windows)))
+                    n_req += len(windows)
+                    self._commit(symbol, interval, cols, meta, todo)
+        else:
+            s = start_ms if start_ms is not None else parse_date_ms(DEFAULT_START)
+
+        windows = page_windows(s, self.now_ms, interval)
+        for k in range(0, len(windows), checkpoint_pages):
+            chunk = windows[k:k + checkpoint_pages]
+            cols = self._merge(cols, self._concat(self._fetch_pages(symbol, interval, chunk)))
+            n_req += len(chunk)
+            rest = windows[k + checkpoint_pages:]
+            self._commit(symbol, interval, cols, meta, chunk, [(rest[0][0], rest[-1][1])] if rest else None)
+
+        if fill_gaps:
+            n_req += self.fill_gaps(symbol, interval)
+        return n_req
+
+    def fill_gaps(self, symbol: str, tf) -> int:
+        """gaps() 를 다시 받아 메움. 거래소에도 없는 구멍은 meta.holes 에 기록해 다음부터 건너뜀"""
+        interval = bybit_interval(tf)
+        gaps = self.gaps(symbol, interval)
+        if not gaps:
+            return 0
+        windows = [(g, w) for g in gaps for w in page_windows(g[0], g[1], interval)]
+        pages = self._fetch_pages(symbol, interval, [w for _, w in windows])
+
+        meta = self._load_meta(symbol, interval)
+        got = {g: 0 for g in gaps}
+        for (g, _), p in zip(windows, pages):
+            got[g] += len(p["ts"])
+        meta["holes"] = meta.get("holes", []) + [list(g) for g in gaps if got[g] == 0]
+        cols = self._merge(self._read(symbol, interval), self._concat(pages))
+        self._commit(symbol, interval, cols, meta, gaps)
+        return len(windows)
+
+    def sync_all(self, symbols: List[str], tfs: List, start_ms: Optional[int] = None,
+                 max_series: int = 4) -> Dict[Tuple[str,str], int]:
+        """
+        여러 심볼 × TF 야간 갱신/백필 — 시리즈 max_series 개를 동시에 진행 (요청 속도는 LIMITER 공유)
+        (symbol, tf) 별 요청 횟수 반환, 실패는 출력 후 계속
+        """
+        if self.session is None:
+            raise RuntimeError("CandleStore: session 이 없어 동기화할 수 없습니다.")
+        self.now_ms = now_ms()
+        out: Dict[Tuple[str,str], int] = {}
+
+        def one(s, tf):
+            try:
+                out[(s, str(tf))] = self._sync(s, bybit_interval(tf), start_ms, True, 50)
+                print(f"✅ sync {s}@{tf}: {out[(s, str(tf))]} req")
+            except Exception as e:
+                print(f"[ERR ] sync {s}@{tf}: {type(e).__name__} {e}")
+
+        # Bybit 에 없는 TF 는 1분봉만 갱신하면 됨
+        tfs = list(dict.fromkeys(str(tf).upper() if is_native(tf) else BASE_TF for tf in tfs))
+        with ThreadPoolExecutor(max_workers=max_series) as ex:
+            list(ex.map(lambda st: one(*st), [(s, tf) for s in symbols for tf in tfs]))
+        return out
+
+    # ---------- 1분봉 → 상위 TF ----------
+    def _use_derived(self, symbol: str, tf: str, start_ms: int, end_ms: int) -> bool:
+        if not is_native(tf):
+            return True
+        if tf == BASE_TF or self.derive is False:
+            return False
+        if self.derive is True:
+            return True
+        # auto: 1분봉이 이미 [첫 봉 시작, end] 를 다 덮고 있으면 네트워크 없이 만들 수 있음
+        key = (symbol.upper(), BASE_TF)
+        ranges = self._load_meta(symbol, BASE_TF)["ranges"] + self._fetched.get(key, [])
+        return not missing_ranges(ranges, int(bucket_start(start_ms, tf)), end_ms)
+
+    def _derived(self, symbol: str, tf: str) -> Dict[str, np.ndarray]:
+        """1분봉 버전이 바뀌었을 때만 다시 집계 (메모리 + '{tf}.from1' 폴더 캐시)"""
+        name = f"{tf}.from{BASE_TF}"
+        key = (symbol.upper(), name)
+        base_ver = int(self._load_meta(symbol, BASE_TF).get("version", 0))
+        hit = self._mem.get(key)
+        if hit is not None and hit[0] == base_ver:
+            return hit[1]
+        meta = self._load_meta(symbol, name)
+        if (meta.get("base_version") == base_ver and meta.get("resample") == RESAMPLE_RULE
+                and meta.get("version", 0) > 0):
+            cols = self._open_files(self._dir(symbol, name), int(meta["version"]))
+        else:
+            # 1분봉을 저장한 시각에 진행 중이던 마지막 봉만 덜 찬 채로 남김
+            base = self._load_meta(symbol, BASE_TF)
+            cols = resample(self._read(symbol, BASE_TF), tf, base.get("holes", []), base.get("updated"))
+            meta["base_version"] = base_ver
+            meta["resample"] = RESAMPLE_RULE
+            self._write(symbol, name, cols, meta)
+            cols = self._mem[key][1]
+        self._mem[key] = (base_ver, cols)
+        return cols
+
+    def _ensure_tf(self, symbol: str, tf: str, start_ms: int, end_ms: int) -> Dict[str, np.ndarray]:
+        """tf 시리즈 확보 — 직접 다운로드 또는 1분봉 확보 후 로컬 집계"""
+        if not self._use_derived(symbol, tf, start_ms, end_ms):
+            return self.ensure(symbol, tf, start_ms, end_ms)
+        # 첫 봉이 잘리지 않도록 봉 시작 시각부터 1분봉 확보
+        self.ensure(symbol, BASE_TF, int(bucket_start(start_ms, tf)), end_ms)
+        return self._derived(symbol, tf)
+
+    # ---------- 조회 ----------
+    def open(self, symbol: str, tf) -> "Candles":
+        """저장된 전체 시리즈 (네트워크 없음, 읽기 전용 memmap)"""
+        tf = str(tf).upper()
+        return Candles(self._read(symbol, tf) if is_native(tf) else self._derived(symbol, tf))
+
+    def arrays(self, symbol: str, tf, start_ms: Optional[int], end_ms: Optional[int],
+               cap: Optional[int], span: float = 1.0) -> "Candles":
+        """
+        기존 fetch_ohlcv 와 같은 범위: [start, end] 구간의 최근 cap 개 캔들 (ts 오름차순)
+        start_ms=None & cap 지정 → 시작 제한 없이 최근 cap 개
+        span: 1.0 = 그 구간 전체, 0.1 = 그중 최근 10% 봉만 (successive halving 단계)
+        반환값은 memmap 위의 뷰 — 복사 없음
+        """
+        c = PINNED.get(pin_key(symbol, tf, start_ms, end_ms, cap))
+        if c is None:
+            c = self._arrays(symbol, tf, start_ms, end_ms, cap)
+        if span < 1.0 and len(c):
+            c = c.window(None, None, max(1, int(np.ceil(len(c) * span))))
+        return c
+
+    def _arrays(self, symbol: str, tf, start_ms: Optional[int], end_ms: Optional[int],
+                cap: Optional[int]) -> "Candles":
+        interval = str(tf).upper()
+        if end_ms is None: end_ms = self.now_ms
+        lo = start_ms if start_ms is not None else parse_date_ms(DEFAULT_START)
+        step = interval_ms(interval)
+
+        # cap 이 있으면 필요한 만큼만 뒤에서부터 넓혀가며 확보 (2018년부터 전부 받지 않도록)
+        want_start = lo if not cap else max(lo, end_ms - (int(cap) + 1) * step)
+        prev = -1
+        while True:
+            cols = self._ensure_tf(symbol, interval, want_start, end_ms)
+            i0 = np.searchsorted(cols["ts"], want_start, side="left")
+            i1 = np.searchsorted(cols["ts"], end_ms, side="right")
+            have = int(i1 - i0)
+            # 다 모았거나 / 시작일에 닿았거나 / 넓혀도 안 늘면(상장 이전) 종료
+            if not cap or have >= cap or want_start <= lo or have == prev:
+                break
+            prev = have
+            want_start = max(lo, want_start - max(int(cap) - have + 1, PAGE_LIMIT) * step)
+
+        return Candles(cols).window(lo, end_ms, cap)
+
+    def get(self, symbol: str, tf, start_ms: Optional[int], end_ms: Optional[int],
+            cap: Optional[int], span: float = 1.0) -> pd.DataFrame:
+        """arrays() 를 DataFrame 으로 (백테스트가 컬럼을 추가하므로 여기서 한 번만 복사)"""
+        c = self.arrays(symbol, tf, start_ms, end_ms, cap, span)
+        return c.to_frame() if len(c) else empty_frame()
+
+
+class Candles:
+    """캔들 시리즈 — 컬럼별 numpy 배열 (int64 ts, float64 OHLCV)"""
+    __slots__ = COLUMNS
+
+    def __init__(self, cols: Dict[str, np.ndarray]):
+        for c in COLUMNS:
+            setattr(self, c, cols[c])
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def window(self, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int] = None) -> "Candles":
+        """[start, end] 의 최근 cap 개 — 슬라이스 뷰라 복사 없음"""
+        i0 = 0 if start_ms is None else int(np.searchsorted(self.ts, start_ms, side="left"))
+        i1 = len(self.ts) if end_ms is None else int(np.searchsorted(self.ts, end_ms, side="right"))
+        if cap:
+            i0 = max(i0, i1 - int(cap))
+        i0 = min(i0, i1)
+        return Candles({c: getattr(self, c)[i0:i1] for c in COLUMNS})
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({c: np.array(getattr(self, c)) for c in COLUMNS})
+
+
+# ================= 실행: 야간 동기화 =================
+if __name__ == "__main__":
+    import argparse
+    from pybit.unified_trading import HTTP
+
+    ap = argparse.ArgumentParser(description="로컬 캔들 저장소 꼬리 동기화 + 구멍 메우기")
+    ap.add_argument("symbols", nargs="+")
+    ap.add_argument("--tf", nargs="+", default=["1","5","15","30","60","D"])
+    ap.add_argument("--start", default=None, help="백필 시작일 (YYYY-MM-DD) — 이후 빠진 과거 구간도 채움")
+    ap.add_argument("--root", default=None)
+    args = ap.parse_args()
+
+    store = CandleStore(args.root, session=HTTP())
+    try:
+        store.sync_all(args.symbols, args.tf, parse_date_ms(args.start))
+    finally:
+        store.close()
@@ -0,0 +1,131 @@
+"""
+심볼별 실행 엔진 (asyncio)
+- 심볼마다 독립 task 가 자기 주기(초)로 step 을 돌림 → 심볼이 늘어도 먼저 있던 심볼의 반응 시간은 그대로
+  (예전: 심볼마다 sleep(5) + 한 바퀴 sleep(10) 을 차례로 → 심볼 N 개면 5N+10 초)
+- step 은 지금 코드 그대로(동기 bybit 호출) — 공용 스레드 풀에서 돌림, 한 심볼이 느려도 그 심볼만 늦어짐
+- REST 는 bybit.session 하나(연결 풀 하나)와 토큰 버킷 하나를 모든 task 가 같이 씀 (bybit.share_session)
+- 주기는 step 시작 기준 (step 이 주기보다 길면 끝나자마자 다음 회)
+- on_bar_close: 봉이 닫히는 순간(거래소 서버 시각 기준) + grace 초에 한 번 — 닫힌 봉 평가용
+  (새 봉인지 가격/ts 를 비교해 추측하지 않음, 15/30/60분 전략이 봉 사이에 kline 을 부를 일이 없음)
+- trigger: 다른 스레드(WebSocket 콜백)의 이벤트를 루프로 넘겨 같은 스레드 풀에서 fn — 콜백 스레드에서는 주문/지표 계산 안 함
+  (같은 인자가 돌고 있거나 대기 중이면 한 번으로 합침 → 끝난 뒤 한 번 더)
+
+  eng = Engine(clock=bybit.server_now_ms)
+  for s in SYMBOLS:
+      eng.every(5, step, s, name=s)                 # 봉 안 리스크 검사
+      eng.on_bar_close("15", on_bar, s, name=s)     # 닫힌 봉 평가
+  acct.on_update(eng.trigger(on_account_update))    # 계좌 스트림 갱신마다 청산 검사
+  eng.run()
+"""
+
+import asyncio, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from candle_store import bar_close, bybit_interval
+
+BAR_GRACE_SEC = 1.0   # 봉 마감 후 이만큼 기다렸다가 (거래소가 마감 봉을 확정할 시간)
+
+
+def local_now_ms() -> float:
+    return time.time() * 1000
+
+
+class Engine:
+    def __init__(self, max_workers: Optional[int] = None, clock: Callable[[], float] = local_now_ms):
+        self.max_workers = max_workers     # None 이면 task 수 (task 끼리 스레드를 기다리지 않음)
+        self.clock = clock                 # 봉 마감 기준 시각 (ms) — 보통 bybit.server_now_ms
+        self.tasks: List[Tuple[str, str, Callable]] = []   # (이름, 표시, 루프 코루틴 함수)
+        self.triggers: List[str] = []      # trigger 이름 (스레드 수에 하나씩)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._again: Dict[tuple, bool] = {}   # (fn, args) → 도는 중에 이벤트가 또 왔는지
+        self._running = set()                 # trigger 로 만든 task (GC 방지)
+
+    def every(self, sec: float, fn: Callable, *args, name: Optional[str] = None) -> None:
+        """sec 초마다 fn(*args)"""
+        self.tasks.append((name or getattr(fn, "__name__", "task"), f"{float(sec):g}s",
+                           lambda pool, n: self._every(pool, n, float(sec), fn, args)))
+
+    def on_bar_close(self, interval, fn: Callable, *args, grace: float = BAR_GRACE_SEC,
+                     name: Optional[str] = None) -> None:
+        """interval 봉이 닫힐 때마다 (서버 시각 기준 + grace 초) fn(*args)"""
+        tf = bybit_interval(interval)
+        self.tasks.append((name or getattr(fn, "__name__", "task"), f"{tf}봉+{float(grace):g}s",
+                           lambda pool, n: self._bars(pool, n, tf, float(grace), fn, args)))
+
+    def trigger(self, fn: Callable, name: Optional[str] = None) -> Callable:
+        """아무 스레드에서나 부를 post(*args) — 엔진 루프에서 fn(*args) (엔진 시작 전/종료 후 이벤트는 버림)"""
+        name = name or getattr(fn, "__name__", "trigger")
+        self.triggers.append(name)
+
+        def post(*args) -> None:
+            loop = self._loop
+            if loop is None:
+                return
+            try:
+                loop.call_soon_threadsafe(self._fire, name, fn, args)
+            except RuntimeError:   # 루프가 닫힘
+                pass
+        return post
+
+    def _fire(self, name: str, fn: Callable, args: tuple) -> None:
+        """(루프 스레드) 같은 (fn, args) 가 이미 있으면 끝난 뒤 한 번 더만 표시"""
+        key = (fn, args)
+        if key in self._again:
+            self._again[key] = True
+            return
+        self._again[key] = False
+        task = asyncio.get_running_loop().create_task(self._drain(name, key, fn, args))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _drain(self, name: str, key: tuple, fn: Callable, args: tuple) -> None:
+        while True:
+            self._again[key] = False
+            await self._call(self._pool, name, fn, args)
+            if not self._again[key]:
+                del self._again[key]
+                return
+
+    @property
+    def workers(self) -> int:
+        return self.max_workers or max(1, len(self.tasks) + len(self.triggers))
+
+    async def _call(self, pool: ThreadPoolExecutor, name: str, fn: Callable, args: tuple) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except Exception as e:
+            print(f"[ERR] {name}: {type(e).__name__} {e}")
+
+    async def _every(self, pool: ThreadPoolExecutor, name: str, sec: float, fn: Callable, args: tuple) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await self._call(pool, name, fn, args)
+            await asyncio.sleep(max(0.0, sec - (loop.time() - t0)))
+
+    async def _bars(self, pool: ThreadPoolExecutor, name: str, tf: str, grace: float, fn: Callable, args: tuple) -> None:
+        last = 0
+        while True:
+            # 지난번 마감 이후의 다음 마감 (일찍 깨도 같은 봉을 두 번 부르지 않음)
+            last = bar_close(max(self.clock(), last), tf)
+            while True:
+                wait = (last - self.clock()) / 1000 + grace
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            await self._call(pool, name, fn, args)
+
+    async def main(self) -> None:
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="engine") as pool:
+            self._loop, self._pool = asyncio.get_running_loop(), pool
+            try:
+                await asyncio.gather(*(loop(pool, name) for name, _, loop in self.tasks))
+            finally:
+                self._loop = None
+
+    def run(self) -> None:
+        print(f"▶ 엔진 시작: task {len(self.tasks)}개 ({', '.join(f'{n}/{lb}' for n, lb, _ in self.tasks)})"
+              + (f", 이벤트 {', '.join(self.triggers)}" if self.triggers else ""))
+        asyncio.run(self.main())
@@ -0,0 +1,171 @@
+"""
+스트리밍 지표 (실거래 루프용)
+- 처음 한 번만 과거 봉으로 워밍업 → 이후 새 봉/수정된 봉 하나당 O(1) 갱신
+- update(ts, ...) : 확정 봉 반영 (같은 ts 면 직전 봉 수정으로 보고 그 봉만 다시 계산)
+- peek(...)       : 진행 중인 봉을 넣었을 때의 값 (상태는 안 바뀜)
+- sync(ts, ...)   : get_kline 결과(오름차순, 마지막 = 진행 중 봉)를 그대로 넣는 편의 함수
+계산식은 기존 pandas 버전과 같음
+  EMAState   : ewm(span=period, adjust=False)
+  RSIState   : bybit.get_RSI (Wilder, ewm(alpha=1/period, adjust=False))
+  StochState : stochatic.compute_stoch (rolling min/max → %K raw → SMA k → SMA d), 극값은 단조 덱
+"""
+
+from typing import Optional, Tuple
+
+from indicators import MonoDeque
+
+NAN = float("nan")
+INF = float("inf")
+
+
+class Incremental:
+    """상태는 불변 값(tuple 등) → 직전 봉 이전 상태(_base)를 그대로 들고 있다가 수정/미리보기에 씀"""
+
+    def __init__(self):
+        self.ts: Optional[int] = None   # 마지막 확정 봉 ts
+        self._base = self._init()       # 마지막 확정 봉 직전까지의 상태
+        self._state = self._base        # 마지막 확정 봉까지의 상태
+        self.prev = self._empty()       # 직전 봉 값
+        self.value = self._empty()      # 마지막 확정 봉 값
+
+    # 하위 클래스 구현
+    def _init(self):
+        return None
+
+    def _empty(self):
+        return NAN
+
+    def _step(self, state, *x):
+        """(상태, 봉 입력) → (새 상태, 값) — state 를 바꾸지 말 것"""
+        raise NotImplementedError
+
+    # 공통
+    def update(self, ts: int, *x):
+        """확정 봉 반영. ts 가 마지막 봉과 같으면 그 봉을 다시 계산, 더 과거면 무시"""
+        ts = int(ts)
+        if self.ts is not None and ts < self.ts:
+            return self.value
+        if ts != self.ts:
+            self._base, self.prev = self._state, self.value
+        self._state, self.value = self._step(self._base, *x)
+        self.ts = ts
+        return self.value
+
+    def peek(self, *x):
+        """진행 중인 봉 기준 값 (상태 변화 없음)"""
+        return self._step(self._state, *x)[1]
+
+    def warmup(self, ts, *cols):
+        """과거 확정 봉 전체를 한 번에 반영"""
+        for row in zip(ts, *cols):
+            self.update(*row)
+        return self.value
+
+    def sync(self, ts, *cols):
+        """
+        최근 봉 목록(오름차순, 마지막 = 진행 중 봉) 반영 → 진행 중 봉 기준 값
+        마지막 확정 봉과 겹치지 않으면(그 사이 봉을 놓침) None → 다시 워밍업할 것
+        """
+        n = len(ts)
+        if n == 0 or (self.ts is not None and int(ts[0]) > self.ts):
+            return None
+        for i in range(n - 1):
+            if self.ts is None or int(ts[i]) >= self.ts:
+                self.update(ts[i], *(c[i] for c in cols))
+        return self.peek(*(c[n - 1] for c in cols))
+
+
+class EMAState(Incremental):
+    def __init__(self, period: int):
+        self.alpha = 2.0 / (int(period) + 1)
+        super().__init__()
+
+    def _step(self, e, x):
+        x = float(x)
+        e = x if e is None else e + self.alpha * (x - e)
+        return e, e
+
+
+class RSIState(Incremental):
+    """상태 = (직전 종가, 평균 상승, 평균 하락) — 첫 변화량으로 평균을 시작 (pandas ewm 과 동일)"""
+
+    def __init__(self, period: int = 14):
+        self.alpha = 1.0 / int(period)
+        super().__init__()
+
+    def _step(self, state, x):
+        x = float(x)
+        if state is None:
+            return (x, None, None), NAN
+        prev, ag, al = state
+        d = x - prev
+        up, dn = max(d, 0.0), max(-d, 0.0)
+        if ag is None:
+            ag, al = up, dn
+        else:
+            ag += self.alpha * (up - ag)
+            al += self.alpha * (dn - al)
+        rs = ag / (al if al != 0 else 1e-10)
+        return (x, ag, al), 100 - 100 / (1 + rs)
+
+
+class StochState(Incremental):
+    """
+    고가/저가 극값은 단조 덱(indicators.MonoDeque) — 마지막 확정 봉 이전까지만 넣어 두고
+    마지막 봉/진행 중 봉은 덱 밖에서 비교 → 봉 수정/미리보기에도 덱을 건드리지 않음 (기간과 무관하게 O(1))
+    스무딩 상태 = 최근 k_smooth 개 %K raw, 최근 d_smooth 개 %K (tuple)
+    """
+
+    def __init__(self, period: int, k_smooth: int, d_smooth: int):
+        self.period, self.k_smooth, self.d_smooth = int(period), int(k_smooth), int(d_smooth)
+        self._hi = MonoDeque(self.period, is_max=True)
+        self._lo = MonoDeque(self.period, is_max=False)
+        self._n = -1        # 마지막 확정 봉 번호
+        self._last = None   # 마지막 확정 봉 (high, low) — 아직 덱에 안 넣음
+        super().__init__()
+
+    def _init(self):
+        return ((), ())
+
+    def _empty(self) -> Tuple[float, float]:
+        return (NAN, NAN)
+
+    def _raw(self, i: int, high: float, low: float, close: float, extra=None):
+        """봉 i 의 %K raw — 덱(봉 i-1 까지) + extra(덱에 아직 없는 봉) + 봉 i"""
+        if i < self.period - 1:
+            return None
+        hh = max(self._hi.front(i), high, extra[0] if extra else -INF)
+        ll = min(self._lo.front(i), low, extra[1] if extra else INF)
+        return 100 * (close - ll) / (hh - ll + 1e-9)
+
+    def _step(self, state, kraw):
+        kraws, ks = state
+        if kraw is None:
+            return state, (NAN, NAN)
+        kraws = (kraws + (kraw,))[-self.k_smooth:]
+        if len(kraws) < self.k_smooth:
+            return (kraws, ks), (NAN, NAN)
+        k = sum(kraws) / self.k_smooth
+        ks = (ks + (k,))[-self.d_smooth:]
+        d = sum(ks) / self.d_smooth if len(ks) == self.d_smooth else NAN
+        return (kraws, ks), (k, d)
+
+    def update(self, ts: int, high, low, close):
+        ts = int(ts)
+        if self.ts is not None and ts < self.ts:
+            return self.value
+        high, low, close = float(high), float(low), float(close)
+        if ts != self.ts:
+            if self._last is not None:   # 직전 봉 확정 → 덱에 넣음
+                self._hi.push(self._n, self._last[0])
+                self._lo.push(self._n, self._last[1])
+            self._n += 1
+            self._base, self.prev = self._state, self.value
+        self._last = (high, low)
+        self._state, self.value = self._step(self._base, self._raw(self._n, high, low, close))
+        self.ts = ts
+        return self.value
+
+    def peek(self, high, low, close):
+        raw = self._raw(self._n + 1, float(high), float(low), float(close), self._last)
+        return self._step(self._state, raw)[1]
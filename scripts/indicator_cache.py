@@ -0,0 +1,133 @@
+"""
+지표 메모이제이션 (파라미터 스윕용)
+- 키 = 캔들 내용 지문(fingerprint) + 지표 이름 + 파라미터 → 같은 시리즈는 한 실행에서 한 번만 계산
+- 메모리는 LRU (max_items 개), 밀려난 항목은 disk_dir 가 있으면 .npy 로 내려놓고 다음에 다시 읽음
+- 캐시 미스가 여러 기간이면 indicators 의 배치 함수로 한 번에 계산
+- 캐시에 든 행은 읽기 전용, 돌려주는 (기간 × 봉) 배열은 새로 쌓은 복사본
+
+  CACHE.rsi(close, [7, 9, 12])       → (3, n)
+  CACHE.ema(close, [5])[0]           → (n,)
+"""
+
+import os, hashlib, threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+
+import indicators as ind
+
+
+def fingerprint(*arrays) -> str:
+    """배열 내용 해시 (길이/dtype 포함) — 같은 캔들이면 어느 조합에서 읽어도 같은 값"""
+    h = hashlib.blake2b(digest_size=16)
+    for a in arrays:
+        a = np.ascontiguousarray(np.asarray(a, dtype=np.float64))
+        h.update(len(a).to_bytes(8, "little"))
+        h.update(a.data)
+    return h.hexdigest()
+
+
+class IndicatorCache:
+    def __init__(self, max_items: int = 512, disk_dir: Optional[str] = None):
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self._mem: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- 저장 ----------
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + ".npy")
+
+    def _get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            a = self._mem.get(key)
+            if a is not None:
+                self._mem.move_to_end(key)
+                return a
+        if self.disk_dir:
+            path = self._path(key)
+            if os.path.exists(path):
+                a = np.load(path, mmap_mode="r")
+                self._put(key, a, spill=False)
+                return a
+        return None
+
+    def _put(self, key: str, a: np.ndarray, spill: bool = True):
+        if isinstance(a, np.ndarray) and not isinstance(a, np.memmap):
+            a.setflags(write=False)
+        evicted = []
+        with self._lock:
+            self._mem[key] = a
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_items:
+                evicted.append(self._mem.popitem(last=False))
+        if spill and self.disk_dir:
+            for k, v in evicted:
+                self._spill(k, v)
+
+    def _spill(self, key: str, a: np.ndarray):
+        if isinstance(a, np.memmap):   # 디스크에서 읽은 것 → 이미 있음
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, a)
+        os.replace(tmp, path)
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+
+    # ---------- 조회 ----------
+    def batch(self, fp: str, name: str, params: List, compute: Callable[[List], np.ndarray]) -> np.ndarray:
+        """params 각각의 행 — 없는 것만 compute(없는 params) 로 한 번에 계산"""
+        rows = [self._get(f"{fp}:{name}:{p!r}") for p in params]
+        todo = list(dict.fromkeys(p for p, r in zip(params, rows) if r is None))
+        self.hits += len(params) - sum(r is None for r in rows)
+        if todo:
+            self.misses += len(todo)
+            got = dict(zip(todo, compute(todo)))
+            for p, a in got.items():
+                self._put(f"{fp}:{name}:{p!r}", np.array(a))
+            rows = [got[p] if r is None else r for p, r in zip(params, rows)]
+        return np.stack(rows) if rows else np.empty((0, 0))
+
+    def ema(self, close, periods, fp: Optional[str] = None) -> np.ndarray:
+        fp = fp or fingerprint(close)
+        return self.batch(fp, "ema", [int(p) for p in periods], lambda ps: ind.ema(close, ps))
+
+    def rsi(self, close, periods, eps: float = 1e-12, fp: Optional[str] = None) -> np.ndarray:
+        fp = fp or fingerprint(close)
+        return self.batch(fp, f"rsi{eps!r}", [int(p) for p in periods], lambda ps: ind.rsi(close, ps, eps))
+
+    def stoch_raw(self, high, low, close, periods, eps: float = 1e-9, floor: bool = False,
+                  fp: Optional[str] = None) -> np.ndarray:
+        fp = fp or fingerprint(high, low, close)
+        return self.batch(fp, f"stoch_raw{eps!r}{floor}", [int(p) for p in periods],
+                          lambda ps: ind.stoch_raw(high, low, close, ps, eps, floor))
+
+    def stoch_k(self, high, low, close, period: int, smooths, eps: float = 1e-9, floor: bool = False,
+                fp: Optional[str] = None) -> np.ndarray:
+        """기간 하나 × 스무딩 여러 개 — (len(smooths), n)"""
+        fp = fp or fingerprint(high, low, close)
+        raw = lambda: self.stoch_raw(high, low, close, [period], eps, floor, fp)
+        return self.batch(fp, f"stoch_k{eps!r}{floor}:{int(period)}", [max(1, int(s)) for s in smooths],
+                          lambda ss: ind.sma(raw(), ss)[:, 0])
+
+    def stoch_d(self, high, low, close, period: int, k_smooth: int, d_smooths, eps: float = 1e-9,
+                floor: bool = False, fp: Optional[str] = None) -> np.ndarray:
+        """%K(period, k_smooth) 의 SMA — (len(d_smooths), n)"""
+        fp = fp or fingerprint(high, low, close)
+        k = lambda: self.stoch_k(high, low, close, period, [k_smooth], eps, floor, fp)[0]
+        return self.batch(fp, f"stoch_d{eps!r}{floor}:{int(period)}:{max(1, int(k_smooth))}",
+                          [int(d) for d in d_smooths], lambda ds: ind.sma(k(), ds))
+
+
+# 스윕 전체가 공유하는 기본 캐시 (INDICATOR_CACHE_DIR 를 주면 디스크로 내려놓음)
+CACHE = IndicatorCache(disk_dir=os.getenv("INDICATOR_CACHE_DIR") or None)
@@ -0,0 +1,179 @@
+"""
+공용 지표 (numpy, 여러 기간 한 번에)
+- 입력: 1-D 배열(close/high/low), 출력: (기간 수 × 봉 수) 2-D 배열 — 행 순서 = 넘긴 기간 순서
+- 값은 예전 스크립트별 pandas 구현과 같음 (앞쪽 NaN 구간 포함)
+    ema      : Series.ewm(span=p, adjust=False).mean()
+    rsi      : compute_rsi (Wilder, rs = up / (down + eps))
+    stoch_k  : compute_k / compute_stoch 의 %K  → (기간 × 스무딩 × 봉) 3-D
+    stoch_d  : %K 의 SMA                         → 마지막 축 앞에 d 축 추가
+- rolling_min/max 는 기간과 무관하게 O(n) (van Herk/Gil-Werman), 실시간은 MonoDeque
+- 같은 기간이 여러 번 들어와도 한 번만 계산
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+def _periods(periods) -> list:
+    if isinstance(periods, (int, np.integer)):
+        return [int(periods)]
+    return [int(p) for p in periods]
+
+
+def _array(x) -> np.ndarray:
+    return np.asarray(x, dtype=np.float64)
+
+
+def _ewm(x: np.ndarray, alpha: float) -> np.ndarray:
+    """ewm(alpha, adjust=False) — 재귀식이라 pandas 의 C 루프를 그대로 씀"""
+    return pd.Series(x).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+def ema(close, periods) -> np.ndarray:
+    """EMA(span=p) — (len(periods), n)"""
+    x = _array(close)
+    ps = _periods(periods)
+    out = np.empty((len(ps), len(x)))
+    done = {}
+    for i, p in enumerate(ps):
+        if p not in done:
+            done[p] = _ewm(x, 2.0 / (p + 1))
+        out[i] = done[p]
+    return out
+
+
+def rsi(close, periods, eps: float = 1e-12) -> np.ndarray:
+    """Wilder RSI — (len(periods), n). 상승/하락 분해는 기간과 무관하게 한 번만"""
+    x = _array(close)
+    ps = _periods(periods)
+    delta = np.empty_like(x)
+    delta[:1] = np.nan
+    delta[1:] = np.diff(x)
+    up = np.where(np.isnan(delta), np.nan, np.maximum(delta, 0.0))
+    down = np.where(np.isnan(delta), np.nan, np.maximum(-delta, 0.0))
+    out = np.empty((len(ps), len(x)))
+    done = {}
+    for i, p in enumerate(ps):
+        if p not in done:
+            rs = _ewm(up, 1.0 / p) / (_ewm(down, 1.0 / p) + eps)
+            done[p] = 100 - 100 / (1 + rs)
+        out[i] = done[p]
+    return out
+
+
+class MonoDeque:
+    """창 window 개의 최댓값(is_max) / 최솟값 — 단조 덱, push 는 amortized O(1) (실시간 갱신용)
+    덱 안의 값은 앞에서부터 단조 → 창 안에 남은 첫 항목이 곧 극값"""
+
+    def __init__(self, window: int, is_max: bool = True):
+        self.window = int(window)
+        self.is_max = is_max
+        self.q = deque()   # (봉 번호, 값)
+
+    def push(self, i: int, x: float):
+        q = self.q
+        if self.is_max:
+            while q and q[-1][1] <= x: q.pop()
+        else:
+            while q and q[-1][1] >= x: q.pop()
+        q.append((i, x))
+        while q[0][0] <= i - self.window: q.popleft()
+
+    def front(self, i: int) -> float:
+        """봉 i 에서 끝나는 창 [i-window+1, i] 안의 극값 (push 된 봉만, 덱은 안 바꿈)"""
+        for j, v in self.q:
+            if j > i - self.window:
+                return v
+        return -np.inf if self.is_max else np.inf
+
+
+def _rolling_extreme(x, window: int, fn, pad: float) -> np.ndarray:
+    """van Herk / Gil-Werman: window 크기 블록의 앞쪽 누적 + 뒤쪽 누적 → 창마다 비교 1번.
+    기간과 무관하게 O(n), 전부 numpy 벡터 연산 (단조 덱과 같은 결과, 파이썬 루프 없음)"""
+    x = _array(x)
+    n = len(x)
+    out = np.full(n, np.nan)
+    if not 0 < window <= n:
+        return out
+    m = -(-n // window) * window
+    blocks = np.full(m, pad)
+    blocks[:n] = x
+    blocks = blocks.reshape(-1, window)
+    g = fn.accumulate(blocks, axis=1).ravel()                      # 블록 시작 → i
+    h = fn.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()    # j → 블록 끝
+    out[window - 1:] = fn(h[:n - window + 1], g[window - 1:n])
+    return out
+
+
+def rolling_max(x, window: int) -> np.ndarray:
+    """rolling(window).max() — 앞 window-1 개는 NaN"""
+    return _rolling_extreme(x, window, np.maximum, -np.inf)
+
+
+def rolling_min(x, window: int) -> np.ndarray:
+    """rolling(window).min() — 앞 window-1 개는 NaN"""
+    return _rolling_extreme(x, window, np.minimum, np.inf)
+
+
+def _window_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """마지막 축의 창 합 (길이 n-window+1) — window 크기 블록의 앞쪽 누적 + 뒤쪽 누적 → 창마다 덧셈 1번.
+    O(n) 이면서 더하는 항이 창 하나 분량뿐이라 긴 시리즈 전체 누적합 차분처럼 오차가 쌓이지 않음"""
+    n = x.shape[-1]
+    m = -(-n // window) * window
+    blocks = np.zeros(x.shape[:-1] + (m,))
+    blocks[..., :n] = x
+    blocks = blocks.reshape(x.shape[:-1] + (-1, window))
+    g = np.cumsum(blocks, axis=-1).reshape(x.shape[:-1] + (m,))                       # 블록 시작 → i
+    h = np.cumsum(blocks[..., ::-1], axis=-1)[..., ::-1].reshape(x.shape[:-1] + (m,))  # j → 블록 끝
+    j = np.arange(n - window + 1)
+    aligned = j % window == 0   # 창 = 블록 하나 → h 만
+    return h[..., j] + np.where(aligned, 0.0, g[..., j + window - 1])
+
+
+def sma(x, windows) -> np.ndarray:
+    """rolling(w).mean() — x 의 마지막 축 기준, 결과는 앞에 windows 축 추가.
+    창 안에 NaN 이 있으면 NaN (pandas min_periods=w 와 같음) — NaN 위치는 누적 개수로 표시"""
+    x = _array(x)
+    ws = _periods(windows)
+    n = x.shape[-1]
+    nan = np.isnan(x)
+    vals = np.where(nan, 0.0, x)
+    cnt = np.zeros(x.shape[:-1] + (n + 1,), dtype=np.int64)
+    np.cumsum(nan, axis=-1, out=cnt[..., 1:])
+    out = np.full((len(ws),) + x.shape, np.nan)
+    for i, w in enumerate(ws):
+        if 0 < w <= n:
+            bad = cnt[..., w:] - cnt[..., :n - w + 1] > 0
+            out[i, ..., w - 1:] = np.where(bad, np.nan, _window_sum(vals, w) / w)
+    return out
+
+
+def stoch_raw(high, low, close, periods, eps: float = 1e-9, floor: bool = False) -> np.ndarray:
+    """%K raw = 100 * (C - LL) / (HH - LL) — (len(periods), n)
+    분모: floor=False → HH-LL+eps (stochastic.py),  floor=True → max(HH-LL, eps) (EMA_stochastic.py)"""
+    h, l, c = _array(high), _array(low), _array(close)
+    ps = _periods(periods)
+    out = np.empty((len(ps), len(c)))
+    done = {}
+    for i, p in enumerate(ps):
+        if p not in done:
+            ll, hh = rolling_min(l, p), rolling_max(h, p)
+            rng = np.maximum(hh - ll, eps) if floor else hh - ll + eps
+            done[p] = 100.0 * (c - ll) / rng
+        out[i] = done[p]
+    return out
+
+
+def stoch_k(high, low, close, periods, smooths, eps: float = 1e-9, floor: bool = False) -> np.ndarray:
+    """%K = SMA(%K raw, k_smooth) — (len(periods), len(smooths), n)"""
+    raw = stoch_raw(high, low, close, periods, eps, floor)
+    return np.moveaxis(sma(raw, [max(1, s) for s in _periods(smooths)]), 0, 1)
+
+
+def stoch_d(k, d_smooths) -> np.ndarray:
+    """%D = SMA(%K, d_smooth) — k 의 마지막 축 앞에 d 축 추가 (예: (P, S, n) → (P, S, D, n))"""
+    k = _array(k)
+    return np.moveaxis(sma(k, d_smooths), 0, -2)
+
@@ -0,0 +1,401 @@
+"""
+전략 상태머신 커널 (백테스트 봉 루프)
+- 입력: 가격/지표 배열 + 파라미터(스칼라), 출력: 거래 배열 Trades(진입 봉, 청산 봉, 방향, 사유, 기준값)
+- numba 가 있으면 njit 로 컴파일 (봉 수백만 개/초), 없으면 같은 코드를 파이썬으로 실행 — 결과는 같음
+- 문자열/로그는 만들지 않음 → 스크립트가 거래 배열(보통 봉 수보다 훨씬 적음)로 로그를 만듦
+- 끝까지 청산 안 된 포지션은 exit = -1, reason = OPEN
+
+  rsi_doorstep : RSItest.py          (과매수/과매도 진입, DOORSTEP 밴드 익절, TP/SL)
+  rsi50_trail  : RSI50_test.py       (50±doorstep 진입, ARM 후 트레일링 익절, 재진입 차단, 쿨다운)
+  stoch_cross  : stochastic.py       (%K/%D 교차 + gap, strict 상/하한 터치, 크로스 손절)
+  ema_stoch    : EMA_stochastic.py   (K 레벨 터치 후 EMA 교차 진입, 슬리피지/수수료 반영 TP/SL)
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:   # numba 없으면 그대로 파이썬 함수 (느리지만 결과 동일)
+    HAVE_NUMBA = False
+
+    def njit(*args, **kw):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+# 방향
+LONG, SHORT = 1, -1
+
+# 청산 사유
+OPEN = 0        # 데이터 끝까지 보유 중
+TP = 1
+SL = 2
+DOORSTEP_TP = 3   # RSItest: 반대 과상태 DOORSTEP 밴드 안에서 익절
+STOP = 4          # RSI50: ARM 전 50 재진입 손절
+TRAIL = 5         # RSI50: ARM 후 트레일링 익절 (level = 트리거 RSI)
+CROSS_SL = 6      # stochastic: 반대 크로스 손절
+EXIT = 7          # stochastic: 반대 교차 청산
+LEVEL = 8         # EMA_stochastic: 반대 극단 K 레벨 청산
+
+
+class Trades(NamedTuple):
+    entry: np.ndarray    # 진입 봉 번호
+    exit: np.ndarray     # 청산 봉 번호 (-1 = 보유 중)
+    side: np.ndarray     # LONG / SHORT
+    reason: np.ndarray   # 청산 사유
+    level: np.ndarray    # 사유별 기준값 (RSI50 트리거 RSI), 없으면 0
+
+    def __len__(self):
+        return len(self.entry)
+
+    def rows(self):
+        """(entry, exit, side, reason, level) — 파이썬 int/float"""
+        return zip(self.entry.tolist(), self.exit.tolist(), self.side.tolist(),
+                   self.reason.tolist(), self.level.tolist())
+
+
+def _inputs(*arrays):
+    """numba → float64 연속 배열, 파이썬 → list (원소 접근이 numpy 스칼라보다 몇 배 빠르고 값은 같음)"""
+    if HAVE_NUMBA:
+        return tuple(np.ascontiguousarray(a, dtype=np.float64) for a in arrays)
+    return tuple(np.asarray(a, dtype=np.float64).tolist() for a in arrays)
+
+
+@njit(cache=True)
+def _alloc(n):
+    return (np.empty(n, np.int64), np.empty(n, np.int64), np.empty(n, np.int64),
+            np.empty(n, np.int64), np.zeros(n, np.float64))
+
+
+# ===== RSItest =====
+@njit(cache=True)
+def _rsi_doorstep(close, rsi, equity, leverage, open_short, open_long, doorstep, tp_roe, sl_roe, tp_mode):
+    n = len(close)
+    ent, ext, sd, rs, lv = _alloc(n + 1)
+    m = 0
+    pos = 0
+    e = -1
+    entry_px = 0.0
+    qty = 0.0
+    init_margin = 0.0
+    for i in range(n):
+        px = close[i]
+        rv = rsi[i]
+        if rv != rv:   # NaN
+            continue
+
+        # === 진입 ===
+        if pos == 0:
+            if rv >= open_short or rv <= open_long:
+                pos = SHORT if rv >= open_short else LONG
+                e = i
+                entry_px = px
+                notional = equity * leverage
+                qty = notional / entry_px
+                init_margin = notional / leverage
+            continue
+
+        # === 보유 중 ===
+        if pos == LONG:
+            unreal = (px - entry_px) * qty
+        else:
+            unreal = (entry_px - px) * qty
+        roe = (unreal / init_margin) * 100
+
+        reason = OPEN
+        if tp_mode == 1:
+            if roe <= -sl_roe:
+                reason = SL
+            elif roe >= tp_roe:
+                # 반대 과상태면 DOORSTEP 밴드 안에서만 청산, 아니면 TP 즉시
+                if pos == LONG:
+                    opposite = rv >= open_short
+                    in_band = (open_short - doorstep) <= rv <= (open_short + doorstep)
+                else:
+                    opposite = rv <= open_long
+                    in_band = (open_long - doorstep) <= rv <= (open_long + doorstep)
+                if not opposite:
+                    reason = TP
+                elif in_band:
+                    reason = DOORSTEP_TP
+        elif tp_mode == 2:
+            if roe >= tp_roe:
+                reason = TP
+            elif roe <= -sl_roe:
+                reason = SL
+
+        if reason != OPEN:
+            ent[m] = e; ext[m] = i; sd[m] = pos; rs[m] = reason
+            m += 1
+            pos = 0
+
+    if pos != 0:
+        ent[m] = e; ext[m] = -1; sd[m] = pos; rs[m] = OPEN
+        m += 1
+    return ent[:m], ext[:m], sd[:m], rs[:m], lv[:m]
+
+
+def rsi_doorstep(close, rsi, equity, leverage, open_short, open_long, doorstep,
+                 tp_roe, sl_roe, tp_mode) -> Trades:
+    return Trades(*_rsi_doorstep(*_inputs(close, rsi), float(equity), float(leverage), float(open_short),
+                                 float(open_long), float(doorstep), float(tp_roe), float(sl_roe), int(tp_mode)))
+
+
+# ===== RSI50_test =====
+@njit(cache=True)
+def _rsi50_trail(rsi, doorstep_entry, doorstep_close, close_band, cooldown_bars, reentry_level):
+    n = len(rsi)
+    ent, ext, sd, rs, lv = _alloc(n + 1)
+    m = 0
+    pos = 0
+    e = -1
+    cooldown = 0
+    armed = False
+    extreme = 0.0     # ARM 이후 최고(롱)/최저(숏) RSI
+    blocked = False
+    block_side = 0    # 1 = 50 위에서 청산, -1 = 아래, 0 = 정확히 50
+    for i in range(n):
+        rv = rsi[i]
+        valid = rv == rv
+
+        # 재진입 차단 해제: RSI가 기준선을 '통과'해야 해제
+        if blocked and valid:
+            if block_side == 1 and rv <= reentry_level:
+                blocked = False; block_side = 0
+            elif block_side == -1 and rv >= reentry_level:
+                blocked = False; block_side = 0
+            elif block_side == 0 and abs(rv - reentry_level) < 1e-9:
+                blocked = False
+
+        if cooldown > 0:
+            cooldown -= 1
+
+        if not valid:
+            continue
+
+        # === FLAT → 진입 ===
+        if pos == 0:
+            if cooldown == 0 and not blocked:
+                if rv >= 50.0 + doorstep_entry or rv <= 50.0 - doorstep_entry:
+                    pos = LONG if rv >= 50.0 + doorstep_entry else SHORT
+                    e = i
+                    armed = False
+                    cooldown = cooldown_bars
+            continue
+
+        # === 보유 중 → 익절/손절 ===
+        reason = OPEN
+        level = 0.0
+        if pos == LONG:
+            if (not armed) and rv >= 50.0 + doorstep_close:
+                armed = True
+                extreme = rv
+            if (not armed) and rv <= 50.0:
+                reason = STOP; level = 50.0
+                block_side = -1 if rv < 50.0 else 0
+            elif armed:
+                extreme = max(extreme, rv)
+                level = extreme - close_band
+                if rv <= level:
+                    reason = TRAIL
+        else:
+            if (not armed) and rv <= 50.0 - doorstep_close:
+                armed = True
+                extreme = rv
+            if (not armed) and rv >= 50.0:
+                reason = STOP; level = 50.0
+                block_side = 1 if rv > 50.0 else 0
+            elif armed:
+                extreme = min(extreme, rv)
+                level = extreme + close_band
+                if rv >= level:
+                    reason = TRAIL
+
+        if reason != OPEN:
+            if reason == TRAIL:
+                block_side = 1 if rv > 50.0 else (-1 if rv < 50.0 else 0)
+            ent[m] = e; ext[m] = i; sd[m] = pos; rs[m] = reason; lv[m] = level
+            m += 1
+            pos = 0
+            armed = False
+            blocked = True
+            cooldown = cooldown_bars
+
+    if pos != 0:
+        ent[m] = e; ext[m] = -1; sd[m] = pos; rs[m] = OPEN
+        m += 1
+    return ent[:m], ext[:m], sd[:m], rs[:m], lv[:m]
+
+
+def rsi50_trail(rsi, doorstep_entry, doorstep_close, close_band, cooldown_bars, reentry_level=50.0) -> Trades:
+    """진입/청산은 RSI 만 보고 결정 (PnL 무관) — 가격은 로그 만들 때만 필요"""
+    return Trades(*_rsi50_trail(*_inputs(rsi), float(doorstep_entry), float(doorstep_close),
+                                float(close_band), int(cooldown_bars), float(reentry_level)))
+
+
+# ===== stochastic =====
+@njit(cache=True)
+def _stoch_cross(close, k, d, notional, eq_used, tp_roe, sl_roe, gap, overbought, oversold,
+                 use_strict, k_only_ok, use_cross_stoploss):
+    n = len(close)
+    ent, ext, sd, rs, lv = _alloc(n + 1)
+    m = 0
+    pos = 0
+    e = -1
+    entry_px = 0.0
+    qty = 0.0
+    touched_upper = False
+    touched_lower = False
+    for i in range(2, n):
+        k_prev = k[i - 1]; d_prev = d[i - 1]
+        k_now = k[i]; d_now = d[i]
+        px = close[i]
+
+        # strict 조건일 때 상/하한 터치 체크 (기준값 0 = 미사용)
+        if use_strict:
+            if overbought != 0 and k_now >= overbought and (k_only_ok or d_now >= overbought):
+                touched_upper = True
+            if oversold != 0 and k_now <= oversold and (k_only_ok or d_now <= oversold):
+                touched_lower = True
+
+        # === 진입 ===
+        if pos == 0:
+            if k_prev > d_prev and k_now < d_now and k_prev - d_prev >= gap:
+                if use_strict and k_only_ok:
+                    cond_now = k_now > overbought
+                else:
+                    cond_now = k_now > overbought and d_now > overbought
+                if cond_now and ((not use_strict) or touched_upper):
+                    pos = SHORT; e = i; entry_px = px; qty = notional / px
+                    touched_upper = False
+                    continue
+            if k_prev < d_prev and k_now > d_now and d_prev - k_prev >= gap:
+                if use_strict and k_only_ok:
+                    cond_now = k_now < oversold
+                else:
+                    cond_now = k_now < oversold and d_now < oversold
+                if cond_now and ((not use_strict) or touched_lower):
+                    pos = LONG; e = i; entry_px = px; qty = notional / px
+                    touched_lower = False
+                    continue
+            continue
+
+        # === 청산 ===
+        if pos == LONG:
+            pnl = (px - entry_px) * qty
+        else:
+            pnl = (entry_px - px) * qty
+        roe = (pnl / eq_used) * 100
+        cross_dn = k_prev > d_prev and k_now < d_now
+        cross_up = k_prev < d_prev and k_now > d_now
+
+        reason = OPEN
+        if tp_roe > 0 and roe >= tp_roe:
+            reason = TP
+        elif sl_roe > 0 and roe <= -sl_roe:
+            reason = SL
+        elif use_cross_stoploss and pos == LONG and cross_dn and d_prev - k_prev >= gap:
+            reason = CROSS_SL
+        elif use_cross_stoploss and pos == SHORT and cross_up and k_prev - d_prev >= gap:
+            reason = CROSS_SL
+        elif (pos == LONG and cross_dn) or (pos == SHORT and cross_up):
+            reason = EXIT
+
+        if reason != OPEN:
+            ent[m] = e; ext[m] = i; sd[m] = pos; rs[m] = reason
+            m += 1
+            pos = 0
+
+    if pos != 0:
+        ent[m] = e; ext[m] = -1; sd[m] = pos; rs[m] = OPEN
+        m += 1
+    return ent[:m], ext[:m], sd[:m], rs[:m], lv[:m]
+
+
+def stoch_cross(close, k, d, notional, eq_used, tp_roe, sl_roe, gap, overbought, oversold,
+                use_strict, k_only_ok, use_cross_stoploss) -> Trades:
+    return Trades(*_stoch_cross(*_inputs(close, k, d), float(notional), float(eq_used), float(tp_roe),
+                                float(sl_roe), float(gap), float(overbought), float(oversold),
+                                bool(use_strict), bool(k_only_ok), bool(use_cross_stoploss)))
+
+
+# ===== EMA_stochastic =====
+@njit(cache=True)
+def _ema_stoch(close, k, ema_fast, ema_slow, os_level, ob_level, allow_long, allow_short,
+               tp_roe, sl_roe, notional, equity_used, slippage, fee):
+    n = len(close)
+    ent, ext, sd, rs, lv = _alloc(n + 1)
+    m = 0
+    pos = 0
+    e = -1
+    entry_exec = 0.0
+    qty = 0.0
+    wait_short = False   # OB 찍은 뒤 EMA 데드크로스 대기
+    wait_long = False    # OS 찍은 뒤 EMA 골든크로스 대기
+    for i in range(1, n):
+        px = close[i]
+        k_now = k[i]; k_prev = k[i - 1]
+        f_now = ema_fast[i]; f_prev = ema_fast[i - 1]
+        s_now = ema_slow[i]; s_prev = ema_slow[i - 1]
+
+        if k_now >= ob_level or k_prev >= ob_level:
+            wait_short = True
+        if k_now <= os_level or k_prev <= os_level:
+            wait_long = True
+
+        # === 진입 ===
+        if pos == 0:
+            valid = f_prev == f_prev and f_now == f_now and s_prev == s_prev and s_now == s_now
+            if allow_short and wait_short and valid and f_prev >= s_prev and f_now < s_now:
+                pos = SHORT; e = i
+                entry_exec = px * (1 - slippage)
+                qty = notional / max(entry_exec, 1e-12)
+                wait_short = False
+                continue
+            if allow_long and wait_long and valid and f_prev <= s_prev and f_now > s_now:
+                pos = LONG; e = i
+                entry_exec = px * (1 + slippage)
+                qty = notional / max(entry_exec, 1e-12)
+                wait_long = False
+                continue
+            continue
+
+        # === 청산 (왕복 테이커 수수료 반영 ROE) ===
+        if pos == LONG:
+            exit_exec = px * (1 - slippage)
+        else:
+            exit_exec = px * (1 + slippage)
+        fees = (qty * entry_exec + qty * exit_exec) * fee
+        if pos == LONG:
+            pnl = (exit_exec - entry_exec) * qty - fees
+        else:
+            pnl = (entry_exec - exit_exec) * qty - fees
+        roe = (pnl / equity_used) * 100.0
+
+        reason = OPEN
+        if roe >= tp_roe:
+            reason = TP
+        elif roe <= -sl_roe:
+            reason = SL
+        elif (pos == LONG and k_now >= ob_level) or (pos == SHORT and k_now <= os_level):
+            reason = LEVEL
+
+        if reason != OPEN:
+            ent[m] = e; ext[m] = i; sd[m] = pos; rs[m] = reason
+            m += 1
+            pos = 0
+
+    if pos != 0:
+        ent[m] = e; ext[m] = -1; sd[m] = pos; rs[m] = OPEN
+        m += 1
+    return ent[:m], ext[:m], sd[:m], rs[:m], lv[:m]
+
+
+def ema_stoch(close, k, ema_fast, ema_slow, os_level, ob_level, allow_long, allow_short,
+              tp_roe, sl_roe, notional, equity_used, slippage, fee) -> Trades:
+    return Trades(*_ema_stoch(*_inputs(close, k, ema_fast, ema_slow), float(os_level), float(ob_level),
+                              bool(allow_long), bool(allow_short), float(tp_roe), float(sl_roe),
+                              float(notional), float(equity_used), float(slippage), float(fee)))
@@ -0,0 +1,66 @@
+"""
+Bybit kline 응답(result.list) 파싱
+- list-of-lists(문자열) / dict 행 둘 다 한 번에 numpy 컬럼으로 변환 (행마다 float() 안 돌림)
+- 결과는 ts 오름차순, ts 중복 제거, ts/close 가 없는 행은 버림
+"""
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["ts","open","high","low","close","volume"]
+
+# dict 행에서 시작 시각으로 쓰일 수 있는 키들 (앞에 있을수록 우선)
+TS_KEYS = ("ts", "start", "startTime", "timestamp", "time")
+
+
+def _coerce(df: pd.DataFrame) -> np.ndarray:
+    """느린 경로: 빈 문자열/None 섞인 경우 → 컬럼 단위 to_numeric (이상값은 NaN)"""
+    return df.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _empty() -> Dict[str, np.ndarray]:
+    return {c: np.empty(0, dtype=np.int64 if c == "ts" else np.float64) for c in COLUMNS}
+
+
+def parse_kline(lst: List) -> Dict[str, np.ndarray]:
+    """result.list → {"ts": int64, "open".."volume": float64}"""
+    if not lst:
+        return _empty()
+
+    first = lst[0]
+    if isinstance(first, (list, tuple)):
+        try:
+            arr = np.asarray(lst, dtype=np.float64)   # 문자열 → float 변환을 C 에서 한 번에
+        except (ValueError, TypeError):   # 빈 문자열 / 행 길이가 제각각
+            arr = _coerce(pd.DataFrame([list(r[:6]) for r in lst]))
+        if arr.ndim != 2 or arr.shape[1] < 6:
+            raise ValueError(f"kline columns < 6: got {arr.shape[1] if arr.ndim == 2 else 0}")
+        raw = {c: arr[:, j] for j, c in enumerate(COLUMNS)}
+    elif isinstance(first, dict):
+        df = pd.DataFrame(lst)
+        ts = pd.Series(np.nan, index=df.index)
+        for k in reversed(TS_KEYS):   # 앞쪽 키가 우선
+            if k in df.columns:
+                v = pd.to_numeric(df[k], errors="coerce")
+                ts = v.where(v.notna(), ts)
+        df = df.reindex(columns=COLUMNS[1:])
+        arr = _coerce(df)
+        raw = {"ts": ts.to_numpy(dtype=np.float64)}
+        raw.update({c: arr[:, j] for j, c in enumerate(COLUMNS[1:])})
+    else:
+        raise TypeError(f"unexpected kline row type: {type(first)}")
+
+    ok = ~(np.isnan(raw["ts"]) | np.isnan(raw["close"]))
+    ts = raw["ts"][ok].astype(np.int64)
+    _, idx = np.unique(ts, return_index=True)   # 오름차순 + 중복 제거
+    out = {c: raw[c][ok][idx] for c in COLUMNS[1:]}
+    out["ts"] = ts[idx]
+    return out
+
+
+def kline_frame(lst: List) -> pd.DataFrame:
+    """result.list → 표준 6컬럼 DataFrame (ts, open, high, low, close, volume), 시간 오름차순"""
+    cols = parse_kline(lst)
+    return pd.DataFrame({c: cols[c] for c in COLUMNS})
@@ -0,0 +1,188 @@
+"""
+실시간 시세 (WebSocket kline / ticker 구독 → 메모리 봉 버퍼)
+- subscribe(symbol, interval) : REST 로 최근 warmup 개를 한 번 받아 버퍼를 채우고 kline/ticker 스트림 구독
+  → 이후 봉 갱신은 거래소가 밀어주는 메시지로 (진행 중 봉은 덮어쓰고, 새 봉은 뒤에 붙임)
+- kline(symbol, interval, limit) : get_kline 결과(list, 오름차순, 마지막 = 진행 중 봉)와 같은 모양으로 버퍼에서
+- price(symbol) / mark(symbol) : ticker 스트림의 lastPrice / markPrice
+- on_ticker(fn) : ticker 메시지마다 fn(symbol) (private_feed.AccountFeed 가 미실현 PnL 재계산·청산 검사에 씀)
+- REST 는 처음 채울 때와 아래 경우에만 (읽을 때 그 자리에서 보충)
+  · 봉을 건너뛴 메시지(재연결 등으로 사이 봉을 놓침) · stale_sec 동안 메시지 없음 · 버퍼보다 많은 limit 요청
+  · 봉이 닫히고 BEHIND_SEC 가 지났는데 새 봉 메시지가 아직 없음 (봉 마감 직후 평가가 닫힌 봉을 놓치지 않게)
+- 재연결/재구독은 pybit WebSocket 이 알아서 함, 콜백은 pybit 스레드에서 → 버퍼마다 락으로 보호
+  REST 보충은 락 밖에서 받고 합칠 때만 잠금 (한 심볼의 REST 가 다른 심볼 스트림/읽기를 막지 않게)
+- BYBIT_MOCK=1 이면 mock_bybit.MockWebSocket (대역 세션의 봉을 같은 형식 메시지로 밀어줌)
+
+  feed = MarketFeed(session)
+  feed.subscribe("BTCUSDT", "5", warmup=400)
+  rows = feed.kline("BTCUSDT", "5", 200)     # [[ts, open, high, low, close, volume], ...]
+"""
+
+import threading, time
+from typing import Dict, List, Optional, Tuple
+
+from candle_store import bybit_interval, interval_ms
+from kline import parse_kline, COLUMNS
+from mock_bybit import make_websocket
+
+STALE_SEC = 30.0    # 이 시간 동안 메시지가 없으면 끊긴 것으로 보고 REST 로 보충
+MAXLEN    = 1000    # 버퍼 기본 길이 (get_kline 한 번에 받을 수 있는 최대 봉 수)
+BEHIND_SEC = 0.5    # 마지막 봉이 닫힌 뒤 이만큼 지나도 새 봉이 안 오면 REST 로 보충
+
+
+class BarBuffer:
+    """(symbol, interval) 하나의 최근 봉들 — 행은 [ts, open, high, low, close, volume] (float, ts 는 int)"""
+
+    def __init__(self, interval: str, maxlen: int = MAXLEN):
+        self.interval = interval
+        self.step = interval_ms(interval) if interval != "M" else None   # 월봉은 길이가 달라 건너뜀 검사 안 함
+        self.maxlen = maxlen
+        self.rows: List[list] = []
+        self.depth = 0           # REST 로 받아 본 최대 개수 (상장 직후처럼 봉이 더 없으면 len(rows) < depth)
+        self.gap = True          # True 면 다음 읽기에서 REST 로 보충
+        self.last_msg = 0.0      # 마지막 메시지 (time.monotonic)
+        self.puts = 0            # 스트림 봉 수 (REST 를 받는 사이에 들어온 봉이 있는지)
+        self.lock = threading.Lock()
+
+    def put(self, row: list) -> None:
+        """스트림 봉 하나 — 같은 ts 면 덮어쓰기(진행 중 봉), 더 새로우면 붙임, 과거 봉은 무시"""
+        ts = row[0]
+        self.puts += 1
+        if self.rows:
+            last = self.rows[-1][0]
+            if ts == last:
+                self.rows[-1] = row
+                return
+            if ts < last:
+                return
+            if self.step is not None and ts > last + self.step:
+                self.gap = True   # 사이 봉을 놓침 → 다음 읽기에서 보충
+        self.rows.append(row)
+        if len(self.rows) > 2 * self.maxlen:
+            del self.rows[:-self.maxlen]
+
+    def merge(self, rows: List[list], puts: Optional[int] = None) -> None:
+        """
+        REST 로 받은 봉들(오름차순)로 겹치는 봉을 덮어쓰고 합침 — 안 이어지면 예전 봉은 버림
+        puts: 요청 직전의 self.puts — 그 뒤 스트림 봉이 들어왔으면 REST 마지막 봉 이후는 스트림 것이 더 새것
+        """
+        if self.rows and rows and self.step is not None and rows[0][0] > self.rows[-1][0] + self.step:
+            self.rows = []
+        by_ts = {r[0]: r for r in self.rows}
+        by_ts.update((r[0], r) for r in rows)
+        if puts is not None and puts != self.puts and rows:
+            by_ts.update((r[0], r) for r in self.rows if r[0] >= rows[-1][0])
+        self.rows = [by_ts[t] for t in sorted(by_ts)][-max(self.maxlen, len(rows)):]
+        self.gap = False
+
+
+class MarketFeed:
+    def __init__(self, session, testnet: bool = False, stale_sec: float = STALE_SEC, maxlen: int = MAXLEN):
+        self.session = session
+        self.stale_sec = float(stale_sec)
+        self.maxlen = int(maxlen)
+        self.ws = make_websocket(session=session, testnet=testnet, channel_type="linear")
+        self.bars: Dict[Tuple[str, str], BarBuffer] = {}
+        self.tickers: Dict[str, dict] = {}
+        self.ticker_at: Dict[str, float] = {}
+        self.rest_calls = 0
+        self.now_ms = getattr(session, "now_ms", None) or (lambda: time.time() * 1000)   # 대역은 가상 시계
+        self.listeners = []      # ticker 갱신마다 fn(symbol)
+        self._lock = threading.RLock()
+
+    # ---------- 구독 ----------
+    def subscribe(self, symbol: str, interval, warmup: int = 200) -> None:
+        s, iv = str(symbol).upper(), bybit_interval(interval)
+        with self._lock:
+            if (s, iv) in self.bars:
+                return
+            buf = self.bars[(s, iv)] = BarBuffer(iv, max(self.maxlen, int(warmup)))
+            new_symbol = s not in self.tickers
+            self.tickers.setdefault(s, {})
+        self._backfill(s, iv, buf, int(warmup))
+        self.ws.kline_stream(interval=iv, symbol=s, callback=self._on_kline)
+        if new_symbol:
+            self.ws.ticker_stream(symbol=s, callback=self._on_ticker)
+
+    def on_ticker(self, fn) -> None:
+        self.listeners.append(fn)
+
+    def close(self) -> None:
+        self.ws.exit()
+
+    # ---------- 스트림 콜백 (pybit 스레드) ----------
+    def _on_kline(self, msg: dict) -> None:
+        _, iv, s = msg.get("topic", "..").split(".", 2)
+        buf = self.bars.get((s, iv))
+        if buf is None:
+            return
+        with buf.lock:
+            for k in msg.get("data") or []:
+                buf.put([int(k["start"]), float(k["open"]), float(k["high"]), float(k["low"]),
+                         float(k["close"]), float(k["volume"])])
+            buf.last_msg = time.monotonic()
+
+    def _on_ticker(self, msg: dict) -> None:
+        d = msg.get("data") or {}
+        s = str(d.get("symbol") or msg.get("topic", ".").split(".", 1)[1]).upper()
+        with self._lock:
+            # snapshot 은 전체, delta 는 바뀐 필드만 → 합쳐서 유지
+            if msg.get("type") == "snapshot":
+                self.tickers[s] = dict(d)
+            else:
+                self.tickers.setdefault(s, {}).update(d)
+            self.ticker_at[s] = time.monotonic()
+        for fn in list(self.listeners):
+            fn(s)
+
+    # ---------- REST 보충 ----------
+    def _backfill(self, symbol: str, interval: str, buf: BarBuffer, limit: int) -> None:
+        """REST get_kline 은 락 없이, 버퍼에 합칠 때만 buf.lock"""
+        with buf.lock:
+            puts = buf.puts
+        r = self.session.get_kline(category="linear", symbol=symbol, interval=interval, limit=min(int(limit), MAXLEN))
+        kl = parse_kline(r["result"]["list"])
+        rows = [[int(t)] + [float(kl[c][i]) for c in COLUMNS[1:]] for i, t in enumerate(kl["ts"])]
+        with self._lock:
+            self.rest_calls += 1
+        with buf.lock:
+            buf.depth = max(buf.depth, int(limit))
+            buf.merge(rows, puts)
+            buf.last_msg = time.monotonic()
+
+    # ---------- 읽기 ----------
+    def kline(self, symbol: str, interval, limit: int = 200) -> Optional[List[list]]:
+        """최근 limit 개 봉 (오름차순, 마지막 = 진행 중 봉) — 구독 안 한 (symbol, interval) 이면 None"""
+        s, iv = str(symbol).upper(), bybit_interval(interval)
+        buf = self.bars.get((s, iv))
+        if buf is None:
+            return None
+        n = 0
+        with buf.lock:
+            stale = time.monotonic() - buf.last_msg > self.stale_sec
+            if buf.step and buf.rows and self.now_ms() > buf.rows[-1][0] + buf.step + BEHIND_SEC * 1000:
+                stale = True   # 봉은 닫혔는데 다음 봉 메시지가 아직 없음
+            if limit > buf.depth or not buf.rows:
+                buf.maxlen = max(buf.maxlen, int(limit))
+                n = limit      # 처음이거나(구독 중 첫 REST 실패 등) 더 긴 구간 → 전부
+            elif buf.gap or stale:
+                # 마지막 봉 이후 지난 봉 수 + 여유만 (마지막 봉도 다시 받아 확정값으로)
+                n = int((self.now_ms() - buf.rows[-1][0]) // buf.step) + 3 if buf.step else limit
+                n = max(3, min(n, limit))
+        if n:
+            self._backfill(s, iv, buf, n)
+        with buf.lock:
+            return [list(r) for r in buf.rows[-int(limit):]]
+
+    def price(self, symbol: str, field: str = "lastPrice") -> Optional[float]:
+        """ticker 스트림의 마지막 체결가 — 아직 없거나 오래됐으면 None"""
+        s = str(symbol).upper()
+        with self._lock:
+            px = self.tickers.get(s, {}).get(field)
+            if px in (None, "") or time.monotonic() - self.ticker_at.get(s, 0.0) > self.stale_sec:
+                return None
+            return float(px)
+
+    def mark(self, symbol: str) -> Optional[float]:
+        """마크 가격 (미실현 PnL 기준) — 없으면 마지막 체결가"""
+        px = self.price(symbol, "markPrice")
+        return px if px is not None else self.price(symbol)
@@ -0,0 +1,506 @@
+"""
+오프라인 Bybit HTTP 대역 (pybit.unified_trading.HTTP 와 같은 메서드/응답 형식)
+- 쓰는 엔드포인트만: get_kline, get_tickers, get_positions, get_wallet_balance,
+  get_instruments_info, set_leverage, place_order, get_server_time (가상 시계)
+- 캔들: MOCK_DATA(캔들 저장소 폴더)에 기록된 봉이 있으면 그대로, 없으면 합성 시세(시드 고정, 항상 같은 값)
+- 주문: 시장가만, 현재가(+슬리피지)로 즉시 체결 → 포지션/지갑을 메모리에서 갱신 (one-way 모드)
+- 에러는 pybit 처럼 InvalidRequestError 로 올림 (retCode 는 Bybit 와 같은 값)
+- make_session(): .env / 환경변수 BYBIT_MOCK=1 이면 MockHTTP, 아니면 진짜 HTTP
+- make_websocket(): 같은 조건으로 MockWebSocket(대역 세션의 봉/현재가를 kline/ticker 메시지로 push,
+  주문 체결은 order/execution/position/wallet 메시지로 push) 또는 진짜 WebSocket
+  → API 한도 없이 백테스트/실거래 루프를 격리된 환경에서 최고 속도로 돌려볼 수 있음
+
+환경변수
+  BYBIT_MOCK        1 이면 대역 사용
+  MOCK_DATA         기록된 캔들 저장소 폴더 (없으면 합성 시세만)
+  MOCK_FIXTURES     기록된 응답 JSON (RecordingHTTP 로 저장한 파일) — get_instruments_info 등을 그대로 재생
+  MOCK_START        가상 시계 시작 (YYYY-MM-DD) — 기록된 과거 구간을 실시간처럼 재생
+  MOCK_SPEED        가상 시계 배속 (기본 1)
+  MOCK_BALANCE      시작 USDT (기본 10000)
+  MOCK_FEE          체결 수수료율 (기본 0.00055 = taker)
+  MOCK_SLIPPAGE_BPS 시장가 슬리피지 bp (기본 0)
+  MOCK_WS_SEC       MockWebSocket push 주기 초 (기본 1)
+"""
+
+import os, json, queue, time, threading, zlib
+from typing import Dict, Optional
+
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+from pybit.exceptions import InvalidRequestError
+
+from candle_store import (CandleStore, COLUMNS, DEFAULT_ROOT, INTERVAL_MINUTES,
+                          bucket_start, interval_ms, parse_date_ms, resample)
+
+# 대역이 만든 캔들은 실제 캐시와 섞이지 않도록 따로 저장 (CandleStore 가 session.candle_root 를 씀)
+MOCK_CANDLE_ROOT = os.path.join(DEFAULT_ROOT, "_mock")
+
+# 합성 시세 기준가 (목록에 없는 심볼은 이름 해시로 0.01~100 사이)
+BASE_PRICE = {"BTCUSDT": 60000.0, "ETHUSDT": 3000.0, "SOLUSDT": 150.0, "DOGEUSDT": 0.15}
+
+KLINE_MAX = 1000   # Bybit get_kline limit 상한
+
+
+def _num(x) -> str:
+    """Bybit 처럼 숫자를 문자열로"""
+    return repr(float(x))
+
+
+def _truthy(v) -> bool:
+    return str(v or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def make_session(**kw):
+    """설정에 따라 진짜 pybit HTTP 또는 MockHTTP"""
+    load_dotenv(find_dotenv(), override=True)
+    if _truthy(os.getenv("BYBIT_MOCK")):
+        return MockHTTP()
+    from pybit.unified_trading import HTTP
+    return HTTP(**kw)
+
+
+def make_websocket(session=None, **kw):
+    """설정에 따라 진짜 pybit WebSocket 또는 MockWebSocket (session: 봉을 읽을 MockHTTP)"""
+    load_dotenv(find_dotenv(), override=True)
+    if _truthy(os.getenv("BYBIT_MOCK")):
+        return MockWebSocket(session if isinstance(session, MockHTTP) else MockHTTP())
+    from pybit.unified_trading import WebSocket
+    return WebSocket(**kw)
+
+
+# ================= 합성 시세 =================
+def _mix(x: np.ndarray) -> np.ndarray:
+    """splitmix64 → [0,1) (같은 입력이면 항상 같은 값)"""
+    with np.errstate(over="ignore"):   # uint64 곱셈은 mod 2^64 로 도는 게 정상
+        z = np.asarray(x).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def _seed(symbol: str) -> int:
+    return zlib.crc32(symbol.upper().encode())
+
+
+def synth_price(symbol: str, ts) -> np.ndarray:
+    """시각(ms) → 가격. 여러 주기의 사인파 + 분 단위 잡음 (추세/횡보가 번갈아 나와 지표 교차가 생김)"""
+    seed = _seed(symbol)
+    base = BASE_PRICE.get(symbol.upper(), 10 ** (seed % 5 - 2) * (1 + seed % 7))
+    t = np.asarray(ts, dtype=np.float64) / 3_600_000.0   # 시간 단위
+    ph = (seed % 360) * np.pi / 180
+    x = (0.12 * np.sin(2 * np.pi * t / 720 + ph)
+         + 0.04 * np.sin(2 * np.pi * t / 55 + 2 * ph)
+         + 0.01 * np.sin(2 * np.pi * t / 3.1 + 3 * ph))
+    minute = (np.asarray(ts, dtype=np.int64) // 60_000) ^ np.int64(seed)
+    noise = _mix(minute) - 0.5
+    return base * np.exp(x + 0.002 * noise)
+
+
+def synth_bars(symbol: str, tf: str, ts: np.ndarray, now: int) -> Dict[str, np.ndarray]:
+    """봉 시작 시각들 → OHLCV (진행 중인 봉은 now 까지만)"""
+    step = interval_ms(tf)
+    end = np.minimum(ts + step - 1, now)
+    o = synth_price(symbol, ts)
+    c = synth_price(symbol, end)
+    wick = 1 + 0.003 * _mix(ts ^ np.int64(_seed(symbol) + 1)) * np.sqrt(step / 60_000)
+    return {
+        "ts": ts,
+        "open": o, "close": c,
+        "high": np.maximum(o, c) * wick,
+        "low": np.minimum(o, c) / wick,
+        "volume": 1000 * (0.5 + _mix(ts ^ np.int64(_seed(symbol) + 2))),
+    }
+
+
+# ================= 대역 세션 =================
+class MockHTTP:
+    def __init__(self, data_root: Optional[str] = None, fixtures: Optional[str] = None,
+                 balance: Optional[float] = None, start: Optional[str] = None,
+                 speed: Optional[float] = None, fee: Optional[float] = None,
+                 slippage_bps: Optional[float] = None):
+        data_root = data_root or os.getenv("MOCK_DATA")
+        self.store = CandleStore(data_root) if data_root else None
+        fixtures = fixtures or os.getenv("MOCK_FIXTURES")
+        self.fixtures = {}
+        if fixtures and os.path.exists(fixtures):
+            with open(fixtures, "r", encoding="utf-8") as f:
+                self.fixtures = json.load(f)
+        self.fee = float(fee if fee is not None else os.getenv("MOCK_FEE", 0.00055))
+        self.slippage = float(slippage_bps if slippage_bps is not None else os.getenv("MOCK_SLIPPAGE_BPS", 0)) / 1e4
+        self.candle_root = MOCK_CANDLE_ROOT
+        # 가상 시계: 시작 시각 + 경과 시간 × 배속
+        start = start or os.getenv("MOCK_START")
+        self._t0 = time.monotonic()
+        self._start_ms = parse_date_ms(start) if start else None
+        self.speed = float(speed if speed is not None else os.getenv("MOCK_SPEED", 1))
+        # 계정 상태
+        self.cash = float(balance if balance is not None else os.getenv("MOCK_BALANCE", 10000))
+        self.positions: Dict[str, dict] = {}
+        self.leverage: Dict[str, int] = {}
+        self.fills = []          # 체결 기록 (벤치마크/검증용)
+        self.calls = 0
+        self.listeners = []      # private 메시지 구독 (MockWebSocket) — 체결마다 fn(msg)
+        self._bars_cache: Dict[tuple, Optional[Dict[str, np.ndarray]]] = {}
+        self._lock = threading.RLock()
+
+    # ---------- 공통 ----------
+    def now_ms(self) -> int:
+        if self._start_ms is None:
+            return int(time.time() * 1000)
+        return int(self._start_ms + (time.monotonic() - self._t0) * 1000 * self.speed)
+
+    def get_server_time(self, **kw) -> dict:
+        now = self.now_ms()
+        return self._ok({"timeSecond": str(now // 1000), "timeNano": str(now * 1_000_000)})
+
+    def _ok(self, result: dict) -> dict:
+        self.calls += 1
+        return {"retCode": 0, "retMsg": "OK", "result": result, "retExtInfo": {}, "time": self.now_ms()}
+
+    def _fail(self, method: str, code: int, msg: str):
+        self.calls += 1
+        raise InvalidRequestError(request=method, message=msg, status_code=code,
+                                  time=time.strftime("%H:%M:%S"), resp_headers={})
+
+    def _fixture(self, method: str, symbol: str) -> Optional[dict]:
+        return (self.fixtures.get(method) or {}).get(str(symbol).upper())
+
+    # ---------- 캔들 ----------
+    def _recorded(self, symbol: str, tf: str) -> Optional[Dict[str, np.ndarray]]:
+        """기록된 봉, 없으면 None — 저장된 TF 와 1분봉 집계 중 더 과거부터 있는 쪽 (같으면 저장된 TF)"""
+        if self.store is None:
+            return None
+        key = (symbol.upper(), tf)
+        if key not in self._bars_cache:
+            c = self.store.open(symbol, tf)
+            cols = {k: getattr(c, k) for k in COLUMNS} if len(c) else None
+            if tf != "1":
+                base = self.store.open(symbol, "1")
+                if len(base) and (cols is None or int(bucket_start(base.ts[0], tf)) < int(cols["ts"][0])):
+                    cols = resample({k: getattr(base, k) for k in COLUMNS}, tf)
+            self._bars_cache[key] = cols
+        return self._bars_cache[key]
+
+    def _bars(self, symbol: str, tf: str, start: Optional[int], end: Optional[int], limit: int) -> Dict[str, np.ndarray]:
+        """[start, end] 중 최근 limit 개 (오름차순)"""
+        now = self.now_ms()
+        end = now if end is None else min(int(end), now)
+        rec = self._recorded(symbol, tf)
+        if rec is not None:
+            # 기록 데이터의 진행 중인 봉은 완성된 봉 그대로 나감 (ts <= now 까지만)
+            i1 = int(np.searchsorted(rec["ts"], end, side="right"))
+            i0 = 0 if start is None else int(np.searchsorted(rec["ts"], int(start), side="left"))
+            i0 = max(i0, i1 - limit)
+            return {c: rec[c][i0:i1] for c in COLUMNS}
+        last = int(bucket_start(end, tf))
+        if tf == "M":
+            m1 = np.datetime64(last, "ms").astype("datetime64[M]")
+            ts = np.arange(m1 - limit + 1, m1 + 1).astype("datetime64[ms]").astype(np.int64)
+        else:
+            step = interval_ms(tf)
+            ts = np.arange(last - (limit - 1) * step, last + 1, step, dtype=np.int64)
+        if start is not None:
+            ts = ts[ts >= int(start)]
+        return synth_bars(symbol, tf, ts, now)
+
+    def get_kline(self, category: str = "linear", symbol: str = "", interval: str = "1",
+                  start: Optional[int] = None, end: Optional[int] = None, limit: int = 200, **kw) -> dict:
+        tf = str(interval).upper()
+        if tf not in INTERVAL_MINUTES:
+            self._fail("get_kline", 10001, f"Invalid period! interval={interval}")
+        limit = max(1, min(int(limit), KLINE_MAX))
+        b = self._bars(symbol, tf, start, end, limit)
+        rows = [[str(int(t)), _num(o), _num(h), _num(l), _num(c), _num(v), _num(v * c)]
+                for t, o, h, l, c, v in zip(b["ts"], b["open"], b["high"], b["low"], b["close"], b["volume"])]
+        rows.reverse()   # Bybit 는 최신 봉이 먼저
+        return self._ok({"category": category, "symbol": str(symbol).upper(), "list": rows})
+
+    # ---------- 시세/상품 ----------
+    def last_price(self, symbol: str) -> float:
+        for tf in ("1", "5", "15", "60"):
+            rec = self._recorded(symbol, tf)
+            if rec is not None:
+                b = self._bars(symbol, tf, None, None, 1)
+                if len(b["close"]):
+                    return float(b["close"][-1])
+        return float(synth_price(symbol, self.now_ms()))
+
+    def get_tickers(self, category: str = "linear", symbol: str = "", **kw) -> dict:
+        fx = self._fixture("get_tickers", symbol)
+        if fx is not None:
+            return fx
+        px = self.last_price(symbol)
+        tick = {"symbol": str(symbol).upper(), "lastPrice": _num(px), "markPrice": _num(px),
+                "indexPrice": _num(px), "bid1Price": _num(px), "ask1Price": _num(px)}
+        return self._ok({"category": category, "list": [tick]})
+
+    def get_instruments_info(self, category: str = "linear", symbol: str = "", **kw) -> dict:
+        fx = self._fixture("get_instruments_info", symbol)
+        if fx is not None:
+            return fx
+        px = self.last_price(symbol)
+        # 주문 단위 ≈ 1~10 USDT 어치 (실제 상품과 비슷한 자릿수)
+        qty_step = 10.0 ** np.floor(np.log10(10.0 / px))
+        tick = 10.0 ** (np.floor(np.log10(px)) - 4)
+        info = {
+            "symbol": str(symbol).upper(), "status": "Trading",
+            "lotSizeFilter": {"minOrderQty": _num(qty_step), "qtyStep": _num(qty_step),
+                              "maxOrderQty": _num(qty_step * 1e6)},
+            "priceFilter": {"tickSize": _num(tick)},
+            "leverageFilter": {"minLeverage": "1", "maxLeverage": "100", "leverageStep": "0.01"},
+        }
+        return self._ok({"category": category, "list": [info]})
+
+    # ---------- 계정 ----------
+    def _unrealised(self, symbol: str, pos: dict) -> float:
+        sign = 1 if pos["side"] == "Buy" else -1
+        return sign * (self.last_price(symbol) - pos["avgPrice"]) * pos["size"]
+
+    def _position_row(self, symbol: str) -> dict:
+        pos = self.positions.get(symbol)
+        lev = self.leverage.get(symbol, 10)
+        if not pos:
+            return {"symbol": symbol, "side": "", "size": "0", "avgPrice": "0", "positionValue": "0",
+                    "leverage": str(lev), "unrealisedPnl": "0", "positionIM": "0", "markPrice": "0"}
+        mark = self.last_price(symbol)
+        value = pos["avgPrice"] * pos["size"]
+        return {"symbol": symbol, "side": pos["side"], "size": _num(pos["size"]),
+                "avgPrice": _num(pos["avgPrice"]), "positionValue": _num(value), "leverage": str(pos["leverage"]),
+                "unrealisedPnl": _num(self._unrealised(symbol, pos)), "positionIM": _num(value / pos["leverage"]),
+                "markPrice": _num(mark)}
+
+    def get_positions(self, category: str = "linear", symbol: Optional[str] = None, **kw) -> dict:
+        with self._lock:
+            syms = [str(symbol).upper()] if symbol else list(self.positions)
+            return self._ok({"category": category, "list": [self._position_row(s) for s in syms]})
+
+    def _equity(self) -> float:
+        return self.cash + sum(self._unrealised(s, p) for s, p in self.positions.items())
+
+    def _used_margin(self) -> float:
+        return sum(p["avgPrice"] * p["size"] / p["leverage"] for p in self.positions.values())
+
+    def _account_row(self, accountType: str = "UNIFIED") -> dict:
+        eq = self._equity()
+        upnl = eq - self.cash
+        avail = max(0.0, eq - self._used_margin())
+        coin = {"coin": "USDT", "equity": _num(eq), "walletBalance": _num(self.cash),
+                "unrealisedPnl": _num(upnl), "availableToWithdraw": _num(avail), "usdValue": _num(eq)}
+        return {"accountType": accountType, "totalEquity": _num(eq), "totalWalletBalance": _num(self.cash),
+                "totalAvailableBalance": _num(avail), "coin": [coin]}
+
+    def get_wallet_balance(self, accountType: str = "UNIFIED", **kw) -> dict:
+        with self._lock:
+            return self._ok({"list": [self._account_row(accountType)]})
+
+    def set_leverage(self, category: str = "linear", symbol: str = "", buyLeverage: str = "1",
+                     sellLeverage: str = "1", **kw) -> dict:
+        s = str(symbol).upper()
+        lev = int(float(buyLeverage))
+        with self._lock:
+            if self.leverage.get(s) == lev:
+                self._fail("set_leverage", 110043, "leverage not modified")
+            if s in self.positions:
+                self.positions[s]["leverage"] = lev
+            self.leverage[s] = lev
+        return self._ok({})
+
+    # ---------- 주문 ----------
+    def place_order(self, category: str = "linear", symbol: str = "", side: str = "Buy",
+                    orderType: str = "Market", qty: str = "0", reduceOnly: bool = False, **kw) -> dict:
+        s = str(symbol).upper()
+        if orderType != "Market":
+            self._fail("place_order", 10001, f"mock supports Market orders only (got {orderType})")
+        q = float(qty)
+        if q <= 0:
+            self._fail("place_order", 10001, "Qty invalid")
+        with self._lock:
+            pos = self.positions.get(s)
+            if reduceOnly and (not pos or pos["side"] == side):
+                self._fail("place_order", 110017, "current position is zero, cannot fix reduce-only order qty")
+            px = self.last_price(s) * (1 + self.slippage if side == "Buy" else 1 - self.slippage)
+            lev = self.leverage.get(s, 10)
+
+            close_q = min(q, pos["size"]) if pos and pos["side"] != side else 0.0
+            open_q = 0.0 if reduceOnly else q - close_q
+            if open_q > 0:
+                avail = self._equity() - self._used_margin() + (close_q * pos["avgPrice"] / pos["leverage"] if close_q else 0)
+                if open_q * px / lev + open_q * px * self.fee > avail:
+                    self._fail("place_order", 110007, "ab not enough for new order")
+
+            pnl = 0.0
+            if close_q:
+                sign = 1 if pos["side"] == "Buy" else -1
+                pnl = sign * (px - pos["avgPrice"]) * close_q
+                pos["size"] -= close_q
+                if pos["size"] <= 1e-12:
+                    del self.positions[s]
+                    pos = None
+            if open_q:
+                if pos:
+                    n = pos["size"] + open_q
+                    pos["avgPrice"] = (pos["avgPrice"] * pos["size"] + px * open_q) / n
+                    pos["size"] = n
+                else:
+                    self.positions[s] = {"side": side, "size": open_q, "avgPrice": px, "leverage": lev}
+            fee = (close_q + open_q) * px * self.fee
+            self.cash += pnl - fee
+            oid = f"mock-{len(self.fills) + 1}"
+            self.fills.append({"orderId": oid, "symbol": s, "side": side, "qty": close_q + open_q,
+                               "price": px, "fee": fee, "closedPnl": pnl, "ts": self.now_ms()})
+            self._publish(self.fills[-1], reduceOnly, close_q)
+        return self._ok({"orderId": oid, "orderLinkId": kw.get("orderLinkId", "")})
+
+
+    def _publish(self, fill: dict, reduce_only: bool, closed: float):
+        """체결 하나 → private 메시지 (Bybit 순서: order → execution → position → wallet)"""
+        if not self.listeners:
+            return
+        s, now = fill["symbol"], self.now_ms()
+        q, px = _num(fill["qty"]), _num(fill["price"])
+        order = {"category": "linear", "symbol": s, "orderId": fill["orderId"], "side": fill["side"],
+                 "orderType": "Market", "orderStatus": "Filled", "qty": q, "cumExecQty": q, "avgPrice": px,
+                 "reduceOnly": bool(reduce_only), "cumExecFee": _num(fill["fee"]), "updatedTime": str(now)}
+        execution = {"category": "linear", "symbol": s, "orderId": fill["orderId"], "side": fill["side"],
+                     "execType": "Trade", "execPrice": px, "execQty": q, "execFee": _num(fill["fee"]),
+                     "closedSize": _num(closed), "execTime": str(now)}
+        pos = self._position_row(s)
+        pos = dict(pos, category="linear", entryPrice=pos.pop("avgPrice"), updatedTime=str(now))   # WS 는 entryPrice
+        for topic, data in (("order", [order]), ("execution", [execution]), ("position", [pos]),
+                            ("wallet", [self._account_row()])):
+            msg = {"id": f"mock-{topic}-{fill['orderId']}", "topic": topic, "creationTime": now, "data": data}
+            for fn in list(self.listeners):
+                fn(msg)
+
+
+# ================= 대역 WebSocket =================
+class MockWebSocket:
+    """
+    pybit WebSocket 의 kline_stream / ticker_stream / exit 만 — push 주기마다 대역 세션의 현재 봉을 메시지로
+    (봉이 바뀌면 직전 봉을 confirm=True 로 한 번 더 보냄, 호출 수(session.calls)는 안 셈)
+    private: position_stream / order_stream / execution_stream / wallet_stream — 대역 세션의 체결을 바로
+    (주문한 스레드가 아닌 별도 스레드에서 콜백, 진짜처럼)
+    """
+
+    def __init__(self, session: MockHTTP, push_sec: Optional[float] = None):
+        self.session = session
+        self.push_sec = float(push_sec if push_sec is not None else os.getenv("MOCK_WS_SEC", 1))
+        self.subs = []   # (topic, callback, fn)
+        self.private = {}   # topic → callback
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._inbox: Optional[queue.Queue] = None
+
+    def kline_stream(self, interval, symbol: str, callback):
+        tf, s = str(interval).upper(), str(symbol).upper()
+        last = {"ts": None}
+
+        def push():
+            b = self.session._bars(s, tf, None, None, 2)
+            bars = [dict(start=int(b["ts"][i]), end=int(b["ts"][i]) + interval_ms(tf) - 1, interval=tf,
+                         open=_num(b["open"][i]), close=_num(b["close"][i]), high=_num(b["high"][i]),
+                         low=_num(b["low"][i]), volume=_num(b["volume"][i]), confirm=i < len(b["ts"]) - 1,
+                         timestamp=self.session.now_ms()) for i in range(len(b["ts"]))]
+            if last["ts"] is not None and bars and bars[-1]["start"] == last["ts"]:
+                bars = bars[-1:]   # 같은 봉 진행 중 → 진행 중 봉만
+            if bars:
+                last["ts"] = bars[-1]["start"]
+                callback({"topic": f"kline.{tf}.{s}", "data": bars, "ts": self.session.now_ms(), "type": "snapshot"})
+        self._add(push)
+
+    def ticker_stream(self, symbol: str, callback):
+        s = str(symbol).upper()
+
+        def push():
+            px = _num(self.session.last_price(s))
+            callback({"topic": f"tickers.{s}", "type": "snapshot", "ts": self.session.now_ms(),
+                      "data": {"symbol": s, "lastPrice": px, "markPrice": px, "indexPrice": px}})
+        self._add(push)
+
+    def position_stream(self, callback):
+        self._private("position", callback)
+
+    def order_stream(self, callback):
+        self._private("order", callback)
+
+    def execution_stream(self, callback):
+        self._private("execution", callback)
+
+    def wallet_stream(self, callback):
+        self._private("wallet", callback)
+
+    def _private(self, topic: str, callback):
+        self.private[topic] = callback
+        if self._inbox is None:
+            self._inbox = queue.Queue()
+            self.session.listeners.append(self._inbox.put)
+            threading.Thread(target=self._deliver, daemon=True).start()
+
+    def _deliver(self):
+        while True:
+            msg = self._inbox.get()
+            if msg is None:
+                return
+            cb = self.private.get(msg["topic"])
+            if cb is None:
+                continue
+            try:
+                cb(msg)
+            except Exception as e:
+                print(f"[MOCK WS] {type(e).__name__} {e}")
+
+    def _add(self, push):
+        self.subs.append(push)
+        push()   # 구독 직후 스냅샷
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.push_sec):
+            for push in list(self.subs):
+                try:
+                    push()
+                except Exception as e:
+                    print(f"[MOCK WS] {type(e).__name__} {e}")
+
+    def exit(self):
+        self._stop.set()
+        if self._inbox is not None:
+            if self._inbox.put in self.session.listeners:
+                self.session.listeners.remove(self._inbox.put)
+            self._inbox.put(None)
+
+
+# ================= 응답 기록 =================
+class RecordingHTTP:
+    """진짜 세션을 감싸서 상품/시세 응답을 심볼별로 저장 → MOCK_FIXTURES 로 재생"""
+    RECORD = ("get_instruments_info", "get_tickers")
+
+    def __init__(self, session, path: str):
+        self.session = session
+        self.path = path
+        self.data = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def __getattr__(self, name):
+        fn = getattr(self.session, name)
+        if name not in self.RECORD:
+            return fn
+
+        def wrapped(**kw):
+            r = fn(**kw)
+            if kw.get("symbol"):
+                self.data.setdefault(name, {})[str(kw["symbol"]).upper()] = r
+                self.save()
+            return r
+        return wrapped
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
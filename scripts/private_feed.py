@@ -0,0 +1,152 @@
+"""
+계좌 실시간 상태 (private WebSocket — position / order / execution / wallet 구독)
+- 포지션은 거래소가 밀어주는 position 메시지로 유지, 미실현 PnL 은 시세 피드(MarketFeed)의 markPrice 로 매번 다시 계산
+  → bybit.get_positions (get_PnL / get_ROE / get_position_size ...) 가 REST 없이 메모리에서
+- order / execution / wallet 메시지는 orders / fills / wallet 에 보관
+- on_update(fn) : 포지션 메시지와, 포지션 있는 심볼의 ticker 갱신마다 fn(symbol)
+  → 전략의 TP/SL·트레일링 청산 검사를 폴링 주기가 아니라 갱신마다 돌릴 수 있음
+- 놓친 메시지(끊김 등)는 REST 로 다시 맞춤 — RESYNC_SEC 마다, 우리 주문 직후(expect)엔 그 심볼 메시지가 올 때까지
+- 심볼당 한 행: 헤지 모드의 매도 쪽(positionIdx 2) 행은 무시 — 예전 심볼별 REST 조회의 lst[0](단방향 0 / 헤지 매수 1)과 같은 행
+- 콜백은 pybit 스레드에서 → 상태는 락으로 보호, fn 은 넘기기만 (Engine.trigger / 큐)
+  지표 계산·청산 검사·주문은 전략 쪽 루프에서 — 스트림 스레드가 REST 를 기다리며 메시지를 밀리게 하지 않음
+- BYBIT_MOCK=1 이면 mock_bybit.MockWebSocket (대역 세션의 체결을 같은 형식 메시지로 밀어줌)
+
+  acct = AccountFeed(session, market=feed, api_key=..., api_secret=...)
+  acct.on_update(lambda symbol: ...)
+  acct.start()
+"""
+
+import threading, time
+from collections import deque
+from typing import Dict, Optional
+
+from mock_bybit import make_websocket
+
+RESYNC_SEC  = 60.0    # 이 시간마다 REST 로 한 번 맞춤 (재연결 사이에 놓친 메시지 대비)
+PENDING_SEC = 5.0     # 우리 주문 뒤 이 시간 안에 position 메시지가 안 오면 기다리지 않음
+FILLS_MAX   = 500     # 보관할 최근 체결 수
+HEDGE_SELL_IDX = 2    # 헤지 모드 매도 쪽 positionIdx (단방향 0, 헤지 매수 1)
+
+
+def is_primary(row: dict) -> bool:
+    """심볼의 대표 행인지 — 헤지 모드 매도 쪽 행이 같은 심볼 키를 덮어쓰지 않게"""
+    return int(row.get("positionIdx") or 0) != HEDGE_SELL_IDX
+
+
+class AccountFeed:
+    def __init__(self, session, testnet: bool = False, api_key: Optional[str] = None,
+                 api_secret: Optional[str] = None, market=None):
+        self.session = session
+        self.market = market
+        self.ws = make_websocket(session=session, testnet=testnet, channel_type="private",
+                                 api_key=api_key, api_secret=api_secret)
+        self.positions: Dict[str, dict] = {}   # symbol → 행 (size > 0 만, REST 와 같은 키)
+        self.orders: Dict[str, dict] = {}      # orderId → 마지막 order 메시지
+        self.fills = deque(maxlen=FILLS_MAX)   # 최근 execution
+        self.wallet: Dict[str, dict] = {}      # coin → 행
+        self.synced_at: Optional[float] = None # 마지막 REST 동기화 (time.monotonic)
+        self.pushed_at: Dict[str, float] = {}  # symbol → 마지막 position 메시지
+        self.pending: Dict[str, float] = {}    # symbol → 우리 주문 시각 (position 메시지 대기)
+        self.listeners = []
+        self._lock = threading.RLock()
+
+    # ---------- 구독 ----------
+    def start(self) -> None:
+        self.ws.position_stream(callback=self._on_position)
+        self.ws.order_stream(callback=self._on_order)
+        self.ws.execution_stream(callback=self._on_execution)
+        self.ws.wallet_stream(callback=self._on_wallet)
+        if self.market is not None:
+            self.market.on_ticker(self._on_ticker)
+
+    def on_update(self, fn) -> None:
+        self.listeners.append(fn)
+
+    def close(self) -> None:
+        self.ws.exit()
+
+    # ---------- 스트림 콜백 (pybit 스레드) ----------
+    def _on_position(self, msg: dict) -> None:
+        now, syms = time.monotonic(), []
+        with self._lock:
+            for p in msg.get("data") or []:
+                if p.get("category", "linear") != "linear" or not is_primary(p):
+                    continue
+                s = p["symbol"]
+                self._put(s, dict(p, avgPrice=p.get("avgPrice") or p.get("entryPrice")))   # WS 는 entryPrice
+                self.pushed_at[s] = now
+                self.pending.pop(s, None)
+                syms.append(s)
+        self._emit(syms)
+
+    def _on_order(self, msg: dict) -> None:
+        with self._lock:
+            for o in msg.get("data") or []:
+                self.orders[o["orderId"]] = o
+
+    def _on_execution(self, msg: dict) -> None:
+        with self._lock:
+            self.fills.extend(msg.get("data") or [])
+
+    def _on_wallet(self, msg: dict) -> None:
+        with self._lock:
+            for acct in msg.get("data") or []:
+                for c in acct.get("coin") or []:
+                    self.wallet[c["coin"]] = c
+
+    def _on_ticker(self, symbol: str) -> None:
+        if symbol in self.positions:
+            self._emit([symbol])
+
+    def _emit(self, symbols) -> None:
+        for s in symbols:
+            for fn in list(self.listeners):
+                try:
+                    fn(s)
+                except Exception as e:
+                    print(f"[ACCOUNT] {s}: {type(e).__name__} {e}")
+
+    def _put(self, symbol: str, row: dict) -> None:
+        if float(row.get("size") or 0) > 0:
+            self.positions[symbol] = row
+        else:
+            self.positions.pop(symbol, None)
+
+    # ---------- REST 동기화 ----------
+    def seed(self, rows: Dict[str, dict], asked_at: float) -> None:
+        """REST 로 받은 전체 포지션 (asked_at = 요청 시각) — 그 뒤에 온 메시지가 있는 심볼은 메시지 쪽을 믿음"""
+        with self._lock:
+            for s in set(rows) | set(self.positions):
+                if self.pushed_at.get(s, -1.0) < asked_at:
+                    self._put(s, dict(rows.get(s) or {"size": "0"}))
+            self.synced_at = asked_at
+
+    def expect(self, symbol: str, sent_at: Optional[float] = None) -> None:
+        """우리 주문 직후 — 주문(sent_at) 뒤의 그 심볼 position 메시지가 올 때까지는 REST 로"""
+        s, now = str(symbol).upper(), time.monotonic()
+        with self._lock:
+            if self.pushed_at.get(s, -1.0) < (now if sent_at is None else sent_at):
+                self.pending[s] = now
+
+    def fresh(self) -> bool:
+        """메모리 상태를 그대로 써도 되는지 (최근 동기화 + 기다리는 주문 없음)"""
+        now = time.monotonic()
+        with self._lock:
+            if self.synced_at is None or now - self.synced_at > RESYNC_SEC:
+                return False
+            self.pending = {s: t for s, t in self.pending.items() if now - t <= PENDING_SEC}
+            return not self.pending
+
+    # ---------- 읽기 ----------
+    def snapshot(self) -> Optional[Dict[str, dict]]:
+        """{symbol: 행} — 미실현 PnL 은 지금 markPrice 로, 시세가 없는 포지션이 있으면 None (REST 로)"""
+        with self._lock:
+            rows = {s: dict(p) for s, p in self.positions.items()}
+        for s, p in rows.items():
+            mark = self.market.mark(s) if self.market is not None else None
+            if mark is None:
+                return None
+            sign = 1 if p.get("side") == "Buy" else -1
+            p["markPrice"] = str(mark)
+            p["unrealisedPnl"] = str(sign * (mark - float(p["avgPrice"])) * float(p["size"]))
+        return rows
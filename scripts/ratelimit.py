@@ -0,0 +1,48 @@
+"""
+요청 속도 제한 (토큰 버킷)
+- 초당 rate 개씩 토큰이 차고, 최대 burst 개까지 쌓임
+- 여러 스레드/심볼이 하나의 버킷을 같이 쓰면 전체 요청 속도가 rate 를 넘지 않음
+- LimitedAdapter: requests 세션에 꽂으면 그 세션의 모든 요청이 버킷을 거침 (연결 풀 크기도 같이 지정)
+"""
+
+import time, threading
+from typing import Optional
+
+from requests.adapters import HTTPAdapter
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, n: float = 1.0):
+        """토큰 n 개가 생길 때까지 대기"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                wait = (n - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class LimitedAdapter(HTTPAdapter):
+    """요청마다 토큰 하나 — session.mount("https://", LimitedAdapter(bucket, pool_maxsize=n))"""
+
+    def __init__(self, bucket: TokenBucket, **kw):
+        self.bucket = bucket
+        super().__init__(**kw)
+
+    def send(self, request, **kw):
+        self.bucket.acquire()
+        return super().send(request, **kw)
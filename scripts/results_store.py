@@ -0,0 +1,201 @@
+"""
+스윕 결과 저장소 (SQLite 파일 하나)
+- 조합마다 CSV 를 쓰는 대신 전략별 테이블에 이어 붙임
+    runs              : run_id, strategy, started, settings(JSON)      — run_sweep 한 번 = run 하나
+    {전략}_combos     : combo_id, run_id, key(manifest 키), 파라미터 열 (INTEGER/REAL/TEXT)
+    {전략}_trades     : combo_id + 거래 로그 열 그대로
+    {전략}_stats      : combo_id + 요약 지표 (backtest_core.trade_stats) — 조합을 넣을 때 같이 계산
+                        (지표 테이블 이전의 저장소는 처음 열 때 저장된 거래로 한 번 채움)
+- TP×SL 격자 결과(dict)는 칸마다 조합 하나 (tp_roe / sl_roe 열)
+- 쓰기는 스윕 부모 프로세스만 (워커는 DataFrame 을 돌려줌) → 잠금 경합 없음
+- 요약/노트북 분석은 SQL 또는 trades(...) 한 번 (파일 수만 개를 열고 파일명을 파싱할 필요 없음)
+  summary(...) 는 이미 계산된 지표를 조회만 → 스윕이 끝나는 순간 준비됨 (조합 5만 개여도)
+- 같은 파라미터 조합을 다시 돌리면(봉 추가, 격자 값 추가, manifest 삭제 등) 읽을 때는 마지막 run 것만 (run_id 를 주면 그 run 만)
+
+  rs = ResultStore(os.path.join(OUT_DIR, RESULTS))
+  df = rs.trades("EMA_cross_test")          # 파라미터 열이 붙은 전체 거래
+  sm = rs.summary("EMA_cross_test")         # 조합별 지표
+"""
+
+import json, sqlite3, time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from backtest_core import STATS, trade_stats
+
+RESULTS = "results.sqlite"            # OUT_DIR 안의 기본 이름
+GRID_KEYS = ("tp_roe", "sl_roe")      # dict 결과의 키 (tp, sl) → 조합 열 이름
+
+for _t in (np.integer, np.int64, np.int32):
+    sqlite3.register_adapter(_t, int)
+sqlite3.register_adapter(np.bool_, bool)
+
+
+def _q(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _value_type(v) -> str:
+    if isinstance(v, (bool, int, np.integer, np.bool_)):
+        return "INTEGER"
+    if isinstance(v, (float, np.floating)):
+        return "REAL"
+    return "TEXT"
+
+
+def _dtype_type(dtype) -> str:
+    return {"i": "INTEGER", "u": "INTEGER", "b": "INTEGER", "f": "REAL"}.get(dtype.kind, "TEXT")
+
+
+class ResultStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, strategy TEXT, "
+                        "started INTEGER, settings TEXT)")
+        self._cols: Dict[str, set] = {}
+
+    # ---------- 스키마 ----------
+    def _ensure(self, table: str, coltypes: Dict[str, str], head: str):
+        """없으면 만들고, 새 열(격자에 파라미터 추가 등)은 ALTER TABLE 로 붙임"""
+        have = self._cols.get(table)
+        if have is None:
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS {_q(table)} ({head})")
+            have = {r[1] for r in self.db.execute(f"PRAGMA table_info({_q(table)})")}
+            self._cols[table] = have
+        for c, t in coltypes.items():
+            if c not in have:
+                self.db.execute(f"ALTER TABLE {_q(table)} ADD COLUMN {_q(c)} {t}")
+                have.add(c)
+
+    # ---------- 쓰기 ----------
+    def begin_run(self, strategy: str, settings: Optional[dict] = None) -> int:
+        cur = self.db.execute("INSERT INTO runs (strategy, started, settings) VALUES (?, ?, ?)",
+                              (strategy, int(time.time() * 1000), json.dumps(settings or {}, default=str)))
+        self.db.commit()
+        return int(cur.lastrowid)
+
+    def append(self, run_id: int, strategy: str, task: dict, key: Optional[str], logs) -> Dict[str, Any]:
+        """작업 하나의 결과 → 조합/거래 행 (커밋은 commit()). 반환값은 manifest 에 남길 요약"""
+        self._stats_table(strategy)   # 예전 저장소면 새 조합을 넣기 전에 지표부터 채움
+        params = {k: v for k, v in task.items() if not isinstance(v, (list, tuple, dict))}
+        cells = ([(dict(params, **dict(zip(GRID_KEYS, k))), df) for k, df in logs.items()]
+                 if isinstance(logs, dict) else [(params, logs)])
+        ids, n = [], 0
+        for p, df in cells:
+            ids.append(self._append_one(run_id, strategy, p, key, df))
+            n += len(df)
+        return {"combo_ids": ids, "trades": n}
+
+    def _append_one(self, run_id: int, strategy: str, params: dict, key: Optional[str], df: pd.DataFrame) -> int:
+        ct = f"{strategy}_combos"
+        self._ensure(ct, {k: _value_type(v) for k, v in params.items()},
+                     "combo_id INTEGER PRIMARY KEY, run_id INTEGER, key TEXT")
+        cols = ["run_id", "key"] + list(params)
+        cur = self.db.execute(f"INSERT INTO {_q(ct)} ({', '.join(map(_q, cols))}) VALUES ({', '.join('?' * len(cols))})",
+                              [run_id, key] + list(params.values()))
+        combo_id = int(cur.lastrowid)
+
+        self._put_stats(strategy, combo_id, trade_stats(df))
+        if len(df):
+            tt = f"{strategy}_trades"
+            self._ensure(tt, {c: _dtype_type(df[c].dtype) for c in df.columns}, "combo_id INTEGER")
+            cols = ["combo_id"] + list(df.columns)
+            rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+            self.db.executemany(f"INSERT INTO {_q(tt)} ({', '.join(map(_q, cols))}) VALUES ({', '.join('?' * len(cols))})",
+                                ((combo_id,) + r for r in rows))
+        return combo_id
+
+    def _stats_table(self, strategy: str) -> str:
+        st = f"{strategy}_stats"
+        if st not in self._cols:
+            types = {c: "INTEGER" if c == "trades" else "TEXT" if c.endswith("_at") else "REAL" for c in STATS}
+            self._ensure(st, types, "combo_id INTEGER PRIMARY KEY")
+            self._backfill_stats(strategy, st)
+        return st
+
+    def _backfill_stats(self, strategy: str, st: str, batch: int = 500):
+        """지표 행이 없는 조합(지표 테이블이 생기기 전의 저장소) → 저장된 거래로 한 번 계산해 채움"""
+        ct, tt = f"{strategy}_combos", f"{strategy}_trades"
+        tables = self.tables()
+        if ct not in tables:
+            return
+        missing = [r[0] for r in self.db.execute(
+            f"SELECT combo_id FROM {_q(ct)} WHERE combo_id NOT IN (SELECT combo_id FROM {_q(st)})")]
+        for i in range(0, len(missing), batch):
+            ids = missing[i:i + batch]
+            logs = {}
+            if tt in tables:
+                df = pd.read_sql_query(f"SELECT * FROM {_q(tt)} WHERE combo_id IN ({', '.join('?' * len(ids))})",
+                                       self.db, params=ids)
+                logs = {cid: g.drop(columns="combo_id") for cid, g in df.groupby("combo_id", sort=False)}
+            for cid in ids:
+                self._put_stats(strategy, cid, trade_stats(logs.get(cid, pd.DataFrame())))
+        if missing:
+            self.db.commit()
+            print(f"[RESULTS] {strategy}: 지표 없는 조합 {len(missing)}개를 저장된 거래로 계산")
+
+    def _put_stats(self, strategy: str, combo_id: int, stats: Dict[str, Any]):
+        st = self._stats_table(strategy)
+        cols = ["combo_id"] + list(STATS)
+        self.db.execute(f"INSERT OR REPLACE INTO {_q(st)} ({', '.join(map(_q, cols))}) "
+                        f"VALUES ({', '.join('?' * len(cols))})", [combo_id] + [stats[c] for c in STATS])
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    # ---------- 읽기 ----------
+    def tables(self) -> List[str]:
+        return [r[0] for r in self.db.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+
+    def keys(self, strategy: str) -> set:
+        """저장된 조합들의 manifest 키"""
+        if f"{strategy}_combos" not in self.tables():
+            return set()
+        return {r[0] for r in self.db.execute(f"SELECT DISTINCT key FROM {_q(strategy + '_combos')}")}
+
+    def _latest(self, strategy: str, run_id: Optional[int]) -> str:
+        """같은 파라미터 조합(파라미터 열 전부, 격자 칸은 tp_roe/sl_roe 까지)이 여러 run 에 들어갔으면 마지막 run 것만
+        (manifest key 는 캔들 내용·격자 전체가 섞여 있어 봉이 늘거나 TP 값을 추가하면 달라짐 → 열 값으로 비교)"""
+        ct = _q(f"{strategy}_combos")
+        if run_id is not None:
+            return f"SELECT * FROM {ct} WHERE run_id = {int(run_id)}"
+        cols = [r[1] for r in self.db.execute(f"PRAGMA table_info({ct})")]
+        params = [c for c in cols if c not in ("combo_id", "run_id", "key")]
+        last = f"MAX(run_id) OVER (PARTITION BY {', '.join(map(_q, params))})" if params else "MAX(run_id) OVER ()"
+        return (f"SELECT {', '.join(map(_q, cols))} FROM (SELECT *, {last} AS _last FROM {ct}) "
+                f"WHERE run_id = _last")
+
+    def combos(self, strategy: str, run_id: Optional[int] = None) -> pd.DataFrame:
+        """조합 표 (파라미터 열)"""
+        return pd.read_sql_query(self._latest(strategy, run_id), self.db)
+
+    def trades(self, strategy: str, run_id: Optional[int] = None) -> pd.DataFrame:
+        """파라미터 열이 붙은 거래 로그 전체"""
+        if f"{strategy}_trades" not in self.tables():
+            return self.combos(strategy, run_id).iloc[0:0]
+        tt = _q(f"{strategy}_trades")
+        have = {r[1] for r in self.db.execute(f"PRAGMA table_info({_q(strategy + '_combos')})")}
+        # 로그에도 있는 파라미터 열(symbol, fast ...)은 조합 쪽 것만
+        cols = [r[1] for r in self.db.execute(f"PRAGMA table_info({tt})") if r[1] not in have]
+        return pd.read_sql_query(f"SELECT c.*, {', '.join('t.' + _q(c) for c in cols)} "
+                                 f"FROM ({self._latest(strategy, run_id)}) c JOIN {tt} t ON t.combo_id = c.combo_id",
+                                 self.db)
+
+    def summary(self, strategy: str, run_id: Optional[int] = None) -> pd.DataFrame:
+        """조합별 지표 표 (파라미터 열 + STATS) — 지표는 조합을 넣을 때 계산된 것"""
+        st = _q(self._stats_table(strategy))
+        return pd.read_sql_query(f"SELECT c.*, {', '.join('s.' + _q(c) for c in STATS)} "
+                                 f"FROM ({self._latest(strategy, run_id)}) c JOIN {st} s ON s.combo_id = c.combo_id",
+                                 self.db)
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        return pd.read_sql_query(sql, self.db, params=params)
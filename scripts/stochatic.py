@@ -1,8 +1,11 @@
-import os, time
+import os, time, queue
 import pandas as pd
 import numpy as np
 from datetime import datetime, timezone
 import bybit
+from kline import kline_frame
+from incremental import StochState
+import indicators as ind
 from bybit import (
     get_kline_http, get_current_price, entry_position, close_position,
     get_position_size, set_leverage, get_usdt, get_ROE, get_PnL
@@ -22,62 +25,99 @@ PCT_ARR         = [50]
 OVERBOUGHT_ARR  = [80]    # 0이면 기준선 무시
 OVERSOLD_ARR    = [20]    # 0이면 기준선 무시
 WAIT_TIME       = 8      # 반복 주기 (초)
+USE_WS          = True   # True: kline/현재가를 WebSocket 버퍼에서 (REST 폴링 안 함)
+USE_PRIVATE_WS  = True   # True: 포지션/체결을 private WebSocket 으로 받아 TP/SL 을 갱신마다 검사 (USE_WS 필요)
 
 # ================= 전역상태 =================
 open_positions = {s: None for s in SYMBOLS}   # "LONG"/"SHORT"/None
 entry_px       = {s: None for s in SYMBOLS}
+stoch_state    = {}   # (sym, tf, period, ks, ds) → StochState (처음만 50봉 워밍업, 이후 3봉씩 갱신)
+EVENTS         = queue.Queue()       # 계좌 스트림 갱신 심볼 — 스트림 스레드는 넣기만, 검사/주문은 메인 루프가 (wait_events)
 
 # ================= 유틸 =================
 def utc_now_str():
     return datetime.now(tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
 def kline_list_to_df(kl):
-    if not kl:
-        return pd.DataFrame(columns=["ts","open","high","low","close","volume"])
-    if isinstance(kl[0], (list, tuple)):
-        df = pd.DataFrame(kl)
-        if df.shape[1] < 6:
-            raise ValueError(f"kline columns < 6: got {df.shape[1]}")
-        df = df.iloc[:, :6].copy()
-        df.columns = ["ts","open","high","low","close","volume"]
-    elif isinstance(kl[0], dict):
-        df = pd.DataFrame(kl).copy()
-        if "start" in df.columns: df.rename(columns={"start":"ts"}, inplace=True)
-        if "startTime" in df.columns: df.rename(columns={"startTime":"ts"}, inplace=True)
-        need = ["ts","open","high","low","close","volume"]
-        missing = [c for c in need if c not in df.columns]
-        if missing:
-            raise ValueError(f"missing keys in kline dict: {missing}")
-        df = df[need].copy()
-    else:
-        raise TypeError(f"unexpected kline row type: {type(kl[0])}")
-    df["ts"] = pd.to_numeric(df["ts"], errors="coerce")
-    for c in ["open","high","low","close","volume"]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
-    df.dropna(subset=["ts","open","high","low","close"], inplace=True)
-    df.sort_values("ts", inplace=True)
+    df = kline_frame(kl)   # 리스트/딕셔너리 행 한 번에 변환 (시간 오름차순)
+    df.dropna(subset=["open","high","low"], inplace=True)
     df.reset_index(drop=True, inplace=True)
     return df
 
 def compute_stoch(df, period:int, k_smooth:int, d_smooth:int):
-    low_min  = df["low"].rolling(period).min()
-    high_max = df["high"].rolling(period).max()
-    df["%K_raw"] = 100 * (df["close"] - low_min) / (high_max - low_min + 1e-9)
-    df["%K"] = df["%K_raw"].rolling(k_smooth).mean()
-    df["%D"] = df["%K"].rolling(d_smooth).mean()
+    k_raw = ind.stoch_raw(df["high"], df["low"], df["close"], [period])
+    df["%K_raw"] = k_raw[0]
+    df["%K"] = ind.sma(k_raw, [k_smooth])[0, 0]
+    df["%D"] = ind.sma(df["%K"], [d_smooth])[0]
     return df.dropna()
 
 def get_stoch(symbol, interval, period, k_smooth, d_smooth):
-    kl = get_kline_http(symbol, interval, limit=50)
-    df = kline_list_to_df(kl)
-    df = compute_stoch(df, period, k_smooth, d_smooth)
-    return float(df["%K"].iloc[-2]), float(df["%D"].iloc[-2]), float(df["%K"].iloc[-1]), float(df["%D"].iloc[-1])
+    """(직전 확정 봉 %K, %D, 진행 중 봉 %K, %D)"""
+    key = (symbol, interval, period, k_smooth, d_smooth)
+    st = stoch_state.get(key)
+    now = None
+    if st is not None:
+        df = kline_list_to_df(get_kline_http(symbol, interval, limit=3))
+        now = st.sync(df["ts"].to_numpy(), df["high"].to_numpy(), df["low"].to_numpy(), df["close"].to_numpy())
+    if now is None:   # 처음이거나 봉을 놓침 → 다시 워밍업
+        st = stoch_state[key] = StochState(period, k_smooth, d_smooth)
+        df = kline_list_to_df(get_kline_http(symbol, interval, limit=50))
+        now = st.sync(df["ts"].to_numpy(), df["high"].to_numpy(), df["low"].to_numpy(), df["close"].to_numpy())
+    (k_prev, d_prev), (k_now, d_now) = st.value, now
+    return float(k_prev), float(d_prev), float(k_now), float(d_now)
+
+def check_tp_sl(i, sym, roe):
+    """TP/SL 도달 시 포지션 종료 → True (폴링 루프와 계좌 스트림 콜백이 같이 씀)"""
+    if roe >= TP_ROE_ARR[i]:
+        print(f"💰 [{sym}] TP 도달 (ROE={roe:.2f}%) → 포지션 종료")
+    elif roe <= -SL_ROE_ARR[i]:
+        print(f"🛑 [{sym}] SL 도달 (ROE={roe:.2f}%) → 포지션 종료")
+    else:
+        return False
+    side = "Buy" if open_positions[sym] == "SHORT" else "Sell"
+    close_position(sym, side)
+    open_positions[sym] = None
+    entry_px[sym] = None
+    return True
+
+def on_account_update(sym):
+    """계좌 스트림 갱신마다 (포지션/체결 메시지, 보유 심볼 시세) TP/SL 검사 — 메인 루프가 wait_events 에서 부름"""
+    if sym not in open_positions:
+        return
+    if get_position_size(sym) <= 0:
+        if open_positions[sym] is not None:
+            # 거래소에서 닫힘 (청산/수동 종료) → 상태만 정리
+            print(f"📍 [{sym}] 포지션이 거래소에서 종료됨")
+            open_positions[sym] = None
+            entry_px[sym] = None
+        return
+    check_tp_sl(SYMBOLS.index(sym), sym, get_ROE(sym))
+
+def wait_events(sec):
+    """다음 폴링까지 sec 초 동안 쌓인 계좌 스트림 이벤트를 이 (메인) 스레드에서 처리 — 모인 것은 심볼마다 한 번"""
+    deadline = time.monotonic() + sec
+    while True:
+        try:
+            syms = {EVENTS.get(timeout=max(0.0, deadline - time.monotonic()))}
+        except queue.Empty:
+            return
+        while not EVENTS.empty():
+            syms.add(EVENTS.get_nowait())
+        for sym in syms:
+            try:
+                on_account_update(sym)
+            except Exception as e:
+                print(f"⚠️ [{sym}] 계좌 갱신 처리 오류: {e}")
 
 # ================= 실행 =================
 print(f"보유 USDT: {get_usdt():.2f}")
 
 for i, s in enumerate(SYMBOLS):
     set_leverage(s, LEVERAGE_ARR[i])
+if USE_WS:
+    bybit.start_feed(zip(SYMBOLS, TIMEFRAMES))
+    if USE_PRIVATE_WS:
+        bybit.start_account_feed(on_update=EVENTS.put)
 
 while True:
     try:
@@ -87,8 +127,6 @@ while True:
             ks         = K_SMOOTH_ARR[i]
             ds         = D_SMOOTH_ARR[i]
             gap        = GAP_ARR[i]
-            tp_roe     = TP_ROE_ARR[i]
-            sl_roe     = SL_ROE_ARR[i]
             lev        = LEVERAGE_ARR[i]
             pct        = PCT_ARR[i]
             overbought = OVERBOUGHT_ARR[i]
@@ -106,21 +144,7 @@ while True:
 
             # === TP/SL 우선 ===
             if pos_size > 0:
-                if roe >= tp_roe:
-                    print(f"💰 [{sym}] TP 도달 (ROE={roe:.2f}%) → 포지션 종료")
-                    side = "Buy" if open_positions[sym] == "SHORT" else "Sell"
-                    close_position(sym, side)
-                    open_positions[sym] = None
-                    entry_px[sym] = None
-                    closed_now = True
-                    pos_size = 0  # 즉시 재진입 허용
-
-                elif roe <= -sl_roe:
-                    print(f"🛑 [{sym}] SL 도달 (ROE={roe:.2f}%) → 포지션 종료")
-                    side = "Buy" if open_positions[sym] == "SHORT" else "Sell"
-                    close_position(sym, side)
-                    open_positions[sym] = None
-                    entry_px[sym] = None
+                if check_tp_sl(i, sym, roe):
                     closed_now = True
                     pos_size = 0  # 즉시 재진입 허용
 
@@ -181,7 +205,7 @@ while True:
                 f"| 💎PnL: {pnl:.6f} ⚜️ROE: {roe:.2f}%"
             )
 
-        time.sleep(WAIT_TIME)
+        wait_events(WAIT_TIME)
 
     except Exception as e:
         print(f"⚠️ 오류 발생: {e}")
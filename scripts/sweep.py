@@ -0,0 +1,385 @@
+"""
+병렬 파라미터 스윕 (프로세스 풀)
+- grid(...) 로 중첩 for 를 작업(파라미터 dict) 목록으로 펼치고, run_sweep 이 코어당 워커 하나로 실행
+- plan(...) 은 선언형 격자: 무효 조합(valid)과 결과가 같은 조합(same: 결과에 영향 없는 파라미터)을
+  스케줄 전에 빼고, 몇 번 실행을 아꼈는지 출력
+- 캔들은 부모가 한 번만 읽어 공유 메모리(multiprocessing.shared_memory)에 올림
+  → 워커는 그 위의 numpy 뷰를 candle_store.PINNED 에 꽂아 씀 (DataFrame 피클링/재다운로드 없음,
+    END=None 이어도 모든 워커가 같은 캔들을 봄)
+- 작업은 묶음(chunk) 단위로 보냄 — 순서를 유지하므로 같은 캔들/지표 조합이 한 워커에 몰려 지표 캐시가 맞음
+- 작업마다 예외 격리: SystemExit → [SKIP], 그 외 → [ERR ] 출력 후 계속
+- 진행률: 완료/전체, 초당 작업 수, 남은 시간
+- search(...) 는 전체 격자 대신 표본(random / LHS) + successive halving:
+  후보 전체를 최근 짧은 구간(fn 에 span 인자로 넘김)에서 평가 → 점수 상위 1/eta 만 남기고 구간을 eta 배로
+  → 마지막 단계는 전체 구간. 점수는 거래 로그 지표 (backtest_core.trade_score)
+- manifest=경로 를 주면 이어하기: 조합마다 hash(전략, 파라미터, 고정 설정, 캔들 내용) 키로
+  완료 결과를 한 줄씩 기록(JSON Lines) → 다음 실행은 기록된 조합을 건너뜀
+  (중단 후 재시작 / 격자에 값 하나 추가 → 새 칸만 실행, 캔들이 바뀌면 다시 실행)
+- results=경로 를 주면 조합마다 CSV 대신 SQLite 결과 저장소(results_store)에 거래 로그를 이어 붙임
+  → fn 은 파일을 쓰지 않고 거래 로그(DataFrame, 격자면 {(tp, sl): DataFrame})를 반환, 쓰기는 부모만
+
+  tasks = plan({"symbol": SYMBOLS, "tf": TIMEFRAMES, "fast": FAST, "slow": SLOW, "st_d": ST_D},
+               valid=lambda t: t["fast"] < t["slow"], same={"st_d": unused}, name="EMA_stochastic")
+  run_sweep(evaluate, tasks, candles=[(s, tf, start_ms, end_ms, MAX_CANDLES) for s in SYMBOLS for tf in TIMEFRAMES],
+            store=STORE, manifest=os.path.join(OUT_DIR, MANIFEST), results=os.path.join(OUT_DIR, RESULTS),
+            settings=settings(globals()), on_result=lambda t, r: print(f"✅ 저장: 거래 {r['trades']}건"))
+"""
+
+import os, sys, json, time, hashlib, itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from functools import partial
+
+import numpy as np
+
+import candle_store
+from candle_store import COLUMNS, Candles, pin_key
+from indicator_cache import fingerprint
+from results_store import ResultStore
+
+OK, SKIP, ERR = "ok", "skip", "err"
+MANIFEST = "sweep_manifest.jsonl"    # OUT_DIR 안의 기본 이름
+NOT_SETTINGS = {"OUT_DIR", "WORKERS", "MAX_RETRY", "MANIFEST", "RESULTS", "SEARCH", "METRIC"}   # 결과에 영향 없는 설정
+
+_ATTACHED: List[SharedMemory] = []   # 워커: 붙인 공유 메모리 (프로세스 끝까지 유지)
+
+
+def grid(**axes: Iterable) -> List[Dict[str, Any]]:
+    """키=값 목록 → 카테시안 곱 (앞 키가 바깥 루프, 예전 중첩 for 와 같은 순서)"""
+    keys = list(axes)
+    return [dict(zip(keys, vals)) for vals in itertools.product(*(list(v) for v in axes.values()))]
+
+
+# ===== 계획 (무효/결과 동일 조합 제거) =====
+def unused(task: dict) -> None:
+    """same 용: 결과에 전혀 영향 없는 파라미터 (파일명 호환용 더미 등)"""
+    return None
+
+
+def only_if(name: str, cond: Callable[[dict], bool]) -> Callable[[dict], Any]:
+    """same 용: cond(task) 일 때만 결과에 영향 있는 파라미터 (예: k_only_ok 는 use_strict 일 때만)"""
+    return lambda t: t[name] if cond(t) else None
+
+
+def plan(axes: Dict[Any, Iterable], valid: Optional[Callable[[dict], bool]] = None,
+         same: Optional[Dict[str, Callable[[dict], Any]]] = None, name: str = "") -> List[dict]:
+    """
+    선언형 스윕 격자 → 실제로 돌릴 작업 목록 (순서는 grid 와 같음)
+    - axes: {이름: 값 목록} — 키가 튜플이면 값(튜플)끼리 짝지어 같이 움직임
+      예: {("overbought", "oversold"): list(zip(OB_ARR, OS_ARR))}
+    - valid(task): False 면 제외 (fast >= slow 등)
+    - same: {이름: f(task)} — 결과에 주는 영향을 f 값으로 정규화 (unused / only_if / 직접 함수)
+      정규화한 조합이 같으면 결과도 같으므로 처음 조합만 실행
+    """
+    keys = list(axes)
+    names = [k if isinstance(k, tuple) else (k,) for k in keys]
+    values = [[v if isinstance(k, tuple) else (v,) for v in axes[k]] for k in keys]
+    same = same or {}
+
+    total = invalid = 0
+    seen, tasks = set(), []
+    for combo in itertools.product(*values):
+        total += 1
+        task = {}
+        for ns, vs in zip(names, combo):
+            task.update(zip(ns, vs))
+        if valid is not None and not valid(task):
+            invalid += 1
+            continue
+        canon = json.dumps({k: (same[k](task) if k in same else v) for k, v in task.items()},
+                           sort_keys=True, default=str)
+        if canon in seen:
+            continue
+        seen.add(canon)
+        tasks.append(task)
+
+    dup = total - invalid - len(tasks)
+    print(f"[PLAN] {name + ': ' if name else ''}조합 {total}개 → 무효 {invalid}, 결과 동일 {dup} 제외 → "
+          f"실행 {len(tasks)}개 ({100 * (total - len(tasks)) / max(total, 1):.1f}% 절약)")
+    return tasks
+
+
+# ===== 공유 메모리 캔들 =====
+def _share(store, specs) -> Tuple[List[SharedMemory], List[Tuple]]:
+    """(symbol, tf, start_ms, end_ms, cap) 마다 캔들을 한 블록(ts + OHLCV 연속)에 복사"""
+    blocks, descs = [], []
+    for spec in dict.fromkeys(tuple(s) for s in specs):
+        c = store.arrays(*spec)
+        n = len(c)
+        shm = SharedMemory(create=True, size=max(1, 8 * n * len(COLUMNS)))
+        blocks.append(shm)
+        for k, col in enumerate(COLUMNS):
+            dst = np.ndarray(n, dtype=np.int64 if col == "ts" else np.float64, buffer=shm.buf, offset=8 * n * k)
+            dst[:] = getattr(c, col)
+        descs.append((pin_key(*spec), shm.name, n))
+    return blocks, descs
+
+
+def _attach(descs):
+    """워커 초기화: 공유 메모리 블록을 읽기 전용 뷰로 candle_store.PINNED 에 꽂음"""
+    for key, name, n in descs:
+        shm = SharedMemory(name=name)
+        _ATTACHED.append(shm)
+        cols = {}
+        for k, col in enumerate(COLUMNS):
+            a = np.ndarray(n, dtype=np.int64 if col == "ts" else np.float64, buffer=shm.buf, offset=8 * n * k)
+            a.flags.writeable = False
+            cols[col] = a
+        candle_store.PINNED[key] = Candles(cols)
+
+
+# ===== 이어하기 (manifest) =====
+def settings(namespace: dict) -> Dict[str, Any]:
+    """스크립트 globals() 중 결과에 영향을 주는 고정 설정 (대문자 이름의 숫자/문자열/None)"""
+    return {k: v for k, v in namespace.items()
+            if k.isupper() and k not in NOT_SETTINGS and (v is None or isinstance(v, (bool, int, float, str)))}
+
+
+def data_versions(store, specs) -> Dict[Tuple, str]:
+    """캔들 스펙별 내용 해시 — 저장소 meta.version 은 동기화마다 바뀌므로 실제로 읽는 구간의 내용으로"""
+    out = {}
+    for spec in dict.fromkeys(tuple(s) for s in specs):
+        c = store.arrays(*spec)
+        out[pin_key(*spec)] = fingerprint(*(getattr(c, col) for col in COLUMNS))
+    return out
+
+
+def task_key(strategy: str, task: dict, fixed: Optional[dict], versions: Dict[Tuple, str]) -> str:
+    """조합 식별자 — 작업의 symbol/tf 에 해당하는 캔들만 (없으면 전체) 해시에 넣음"""
+    sym = str(task.get("symbol", "")).upper(); tf = str(task.get("tf", "")).upper()
+    data = sorted(v for k, v in versions.items()
+                  if (not sym or k[0] == sym) and (not tf or k[1] == tf))
+    blob = json.dumps([strategy, task, fixed or {}, data], sort_keys=True, default=str)
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """key → 기록된 결과 (마지막 줄이 중단으로 잘렸으면 무시)"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            done[rec["key"]] = rec.get("result")
+    return done
+
+
+def _strategy_name(fn: Callable) -> str:
+    fn = getattr(fn, "func", fn)   # functools.partial
+    mod = sys.modules.get(fn.__module__)
+    path = getattr(mod, "__file__", None)
+    return os.path.splitext(os.path.basename(path))[0] if path else fn.__module__
+
+
+# ===== 실행 =====
+def _run_chunk(fn: Callable, chunk: List[Tuple[int, dict]]) -> List[Tuple[int, str, Any]]:
+    out = []
+    for idx, task in chunk:
+        try:
+            out.append((idx, OK, fn(**task)))
+        except SystemExit as e:
+            out.append((idx, SKIP, str(e)))
+        except Exception as e:
+            out.append((idx, ERR, f"{type(e).__name__}: {e}"))
+    return out
+
+
+def _fmt_secs(s: float) -> str:
+    s = int(s)
+    return f"{s // 3600}:{s // 60 % 60:02d}:{s % 60:02d}"
+
+
+def run_sweep(fn: Callable, tasks: List[dict], workers: Optional[int] = None, chunksize: Optional[int] = None,
+              store=None, candles: Iterable[Tuple] = (), label: Optional[Callable[[dict], str]] = None,
+              on_result: Optional[Callable[[dict, Any], None]] = None,
+              progress_every: float = 5.0, manifest: Optional[str] = None,
+              settings: Optional[dict] = None, strategy: Optional[str] = None,
+              results: Optional[str] = None) -> List[Tuple[dict, str, Any]]:
+    """
+    fn(**task) 를 작업마다 실행 → [(task, "ok"/"skip"/"err", 반환값 또는 메시지)] (tasks 순서)
+    - fn 은 모듈 최상위 함수여야 함 (워커로 이름만 보냄)
+    - workers: 기본 코어 수, 1 이하면 프로세스 풀 없이 이 프로세스에서
+    - candles: 작업들이 읽을 (symbol, tf, start_ms, end_ms, cap) — store.get 에 넘기는 인자 그대로
+    - on_result(task, 반환값): 부모에서 성공한 작업마다 호출 (출력 등)
+    - manifest: 완료 기록 파일 — 있으면 기록된 조합은 실행 없이 기록된 반환값으로 "ok" (on_result 호출 안 함)
+      반환값은 JSON 으로 저장 가능해야 함 (경로 문자열/리스트 등). SKIP/ERR 는 기록 안 함 → 다음에 다시 시도
+    - settings: 해시에 넣을 고정 설정 (보통 settings(globals())), strategy: 기본은 fn 이 있는 스크립트 이름
+    - results: 결과 저장소(SQLite) 경로 — 있으면 fn 의 반환값(거래 로그)을 저장소에 넣고,
+      그 대신 요약 {"combo_ids": [...], "trades": n} 을 반환값/manifest/on_result 로 씀
+    """
+    label = label or (lambda t: "_".join(f"{k}{v}" for k, v in t.items()))
+    out: List[Optional[Tuple[dict, str, Any]]] = [None] * len(tasks)
+    keys: List[Optional[str]] = [None] * len(tasks)
+    log = rs = None
+    if manifest or results:
+        strategy = strategy or _strategy_name(fn)
+        versions = data_versions(store, candles) if store is not None else {}
+        keys = [task_key(strategy, t, settings, versions) for t in tasks]
+    if results:
+        os.makedirs(os.path.dirname(os.path.abspath(results)), exist_ok=True)
+        rs = ResultStore(results)
+    if manifest:
+        recorded = load_manifest(manifest)
+        stored = rs.keys(strategy) if rs is not None else None
+        for i, t in enumerate(tasks):
+            # 저장소를 쓰면 저장소에도 있어야 완료 (예전 CSV 기록이나 지운 저장소 → 다시 실행)
+            if keys[i] in recorded and (stored is None or keys[i] in stored):
+                out[i] = (t, OK, recorded[keys[i]])
+        skipped = sum(r is not None for r in out)
+        if skipped:
+            print(f"[SWEEP] {manifest}: 완료된 조합 {skipped}/{len(tasks)}개 건너뜀")
+        os.makedirs(os.path.dirname(os.path.abspath(manifest)), exist_ok=True)
+        log = open(manifest, "a", encoding="utf-8")
+
+    indexed = [(i, t) for i, t in enumerate(tasks) if out[i] is None]
+    total = len(indexed)
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    workers = min(workers, max(1, total))
+    chunksize = max(1, int(chunksize or -(-total // (workers * 8))))
+    chunks = [indexed[i:i + chunksize] for i in range(0, total, chunksize)]
+    if rs is not None and total:
+        run_id = rs.begin_run(strategy, settings)
+
+    def close():
+        if log is not None: log.close()
+        if rs is not None: rs.close()
+
+    done = 0
+    t0 = last = time.time()
+
+    def collect(outcomes):
+        nonlocal done, last
+        if rs is not None:
+            # 묶음 단위로 저장소에 넣고 커밋한 뒤에 manifest 기록 → manifest 에 있으면 저장소에도 있음
+            outcomes = [(idx, status, rs.append(run_id, strategy, tasks[idx], keys[idx], value) if status == OK else value)
+                        for idx, status, value in outcomes]
+            rs.commit()
+        for idx, status, value in outcomes:
+            task = tasks[idx]
+            out[idx] = (task, status, value)
+            if status == SKIP:
+                print(f"[SKIP] {label(task)}: {value}")
+            elif status == ERR:
+                print(f"[ERR ] {label(task)}: {value}")
+            else:
+                if log is not None:
+                    # 한 줄씩 바로 flush → 어디서 끊겨도 그때까지 끝난 조합은 남음
+                    log.write(json.dumps({"key": keys[idx], "strategy": strategy, "params": task,
+                                          "result": value, "t": int(time.time())}, default=str) + "\n")
+                    log.flush()
+                if on_result is not None:
+                    on_result(task, value)
+        done += len(outcomes)
+        now = time.time()
+        if now - last >= progress_every or done == total:
+            last = now
+            rate = done / max(now - t0, 1e-9)
+            print(f"[SWEEP] {done}/{total} ({100 * done / max(total, 1):.1f}%) "
+                  f"{rate:.1f} task/s, 남은 시간 {_fmt_secs((total - done) / max(rate, 1e-9))}")
+
+    if total == 0:
+        close()
+        return out
+    if workers == 1:
+        try:
+            for chunk in chunks:
+                collect(_run_chunk(fn, chunk))
+        finally:
+            close()
+        print(f"[SWEEP] 완료 {total}개, 1 프로세스, {_fmt_secs(time.time() - t0)}")
+        return out
+
+    blocks, descs = _share(store, candles) if store is not None else ([], [])
+    try:
+        # spawn: 윈도우와 같은 방식, 부모의 스레드/락 상태를 물려받지 않음
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_attach, initargs=(descs,)) as ex:
+            futures = [ex.submit(_run_chunk, fn, chunk) for chunk in chunks]
+            try:
+                for f in as_completed(futures):
+                    collect(f.result())
+            except KeyboardInterrupt:
+                for f in futures:
+                    f.cancel()
+                print(f"[SWEEP] 중단 — {done}/{total} 완료")
+                raise
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+        close()
+    print(f"[SWEEP] 완료 {total}개, {workers} 워커, {_fmt_secs(time.time() - t0)}")
+    return out
+
+
+# ===== 적응형 탐색 (표본 + successive halving) =====
+def sample(tasks: List[dict], n: Optional[int], method: str = "lhs", seed: int = 0) -> List[dict]:
+    """
+    작업 목록에서 n 개 (원래 순서 유지)
+    - random: 균등 무작위
+    - lhs   : 파라미터마다 값 목록을 n 구간으로 나눠 골고루 (Latin hypercube, 이산 격자)
+              뽑은 점이 목록에 없거나(무효/중복 제거된 조합) 이미 뽑혔으면 남은 것 중 무작위
+    """
+    if n is None or n >= len(tasks):
+        return list(tasks)
+    rng = np.random.default_rng(seed)
+    if method == "random":
+        return [tasks[i] for i in sorted(rng.choice(len(tasks), n, replace=False))]
+    if method != "lhs":
+        raise ValueError(f"unknown sample method: {method}")
+
+    enc = lambda v: json.dumps(v, default=str)
+    keys = list(tasks[0])
+    levels = {k: list(dict.fromkeys(enc(t[k]) for t in tasks)) for k in keys}
+    pos = {k: {v: i for i, v in enumerate(levels[k])} for k in keys}
+    where = {}
+    for i, t in enumerate(tasks):
+        where.setdefault(tuple(pos[k][enc(t[k])] for k in keys), i)
+
+    cols = [((rng.permutation(n) + rng.random(n)) / n * len(levels[k])).astype(int) for k in keys]
+    picked = []
+    for point in zip(*cols):
+        i = where.pop(tuple(int(c) for c in point), None)
+        if i is not None:
+            picked.append(i)
+    rest = np.setdiff1d(np.arange(len(tasks)), picked)
+    picked += list(rng.choice(rest, n - len(picked), replace=False))
+    return [tasks[i] for i in sorted(picked)]
+
+
+def _scored(fn: Callable, metric: Callable[[Any], float], span: float, **task) -> float:
+    return float(metric(fn(span=span, **task)))
+
+
+def search(fn: Callable, tasks: List[dict], metric: Callable[[Any], float], n: Optional[int] = 500,
+           method: str = "lhs", eta: int = 3, rungs: int = 3, top: int = 20, seed: int = 0,
+           **sweep_kw) -> List[Tuple[dict, float]]:
+    """
+    표본 n 개를 successive halving 으로 좁혀 전체 구간 점수 상위 top 개 [(task, score)] (점수 내림차순)
+    - fn(span=..., **task) → 거래 로그 (CSV 저장 없이), metric(로그) → 클수록 좋은 점수
+      span 은 캔들 구간 중 쓸 최근 비율 — fn 이 캔들 조회(STORE.get(..., span=span))까지 넘김
+      둘 다 모듈 최상위 함수(또는 그 partial)여야 함 — 예: partial(trade_score, "total_roe")
+    - 단계 r 의 구간 = 전체의 eta^-(rungs-1-r) (eta=3, rungs=3 → 1/9, 1/3, 전체), 단계마다 상위 1/eta 만 다음으로
+      → n=500 이면 전체 구간 환산 약 170회 + 작업당 고정 비용 (격자 500개 실행과 비슷한 시간)
+    - sweep_kw: workers / chunksize / store / candles / label → run_sweep 그대로
+    """
+    alive = sample(tasks, n, method, seed)
+    print(f"[SEARCH] 후보 {len(alive)}/{len(tasks)}개 ({method}), eta={eta}, 단계 {rungs}")
+    scored: List[Tuple[dict, float]] = []
+    for r in range(rungs):
+        span = float(eta) ** -(rungs - 1 - r)
+        res = run_sweep(partial(_scored, fn, metric, span), alive, **sweep_kw)
+        scored = sorted(((t, v if status == OK and v == v else float("-inf")) for t, status, v in res),
+                        key=lambda tv: tv[1], reverse=True)
+        keep = top if r == rungs - 1 else max(top, -(-len(alive) // eta))
+        alive = [t for t, _ in scored[:keep]]
+        print(f"[SEARCH] 단계 {r + 1}/{rungs}: 구간 {100 * span:.0f}%, 평가 {len(res)}개, "
+              f"최고 {scored[0][1] if scored else float('nan'):.4g} → {len(alive)}개 남김")
+    return scored[:top]
@@ -1,11 +1,21 @@
 
-import os, time, math, re, glob
+import os, time, math
 from datetime import datetime, timezone
 from typing import Optional, List, Tuple, Dict
+from functools import partial
 
 import numpy as np
 import pandas as pd
-from pybit.unified_trading import HTTP
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from candle_store import CandleStore
+from backtest_core import columns, crosses, cross_grid, utc_str, trade_score
+import kernels
+from indicator_cache import CACHE   # 같은 캔들/파라미터 지표는 한 번만 계산
+from mock_bybit import make_session   # BYBIT_MOCK=1 이면 오프라인 대역
+from sweep import plan, run_sweep, search, settings, MANIFEST   # 조합별 병렬 실행 (코어당 워커 하나)
+from results_store import ResultStore, RESULTS   # 전체 거래 로그를 SQLite 파일 하나에
 
 # ================= 사용자 설정 =================
 OUT_DIR        = r"D:\Projects\AutoCoinAI\test"   # 결과 저장 폴더
@@ -23,15 +33,18 @@ LEVERAGE       = 5
 START          = "2025-01-01"                     # 시작일 (UTC)
 END            = None                              # None이면 현재
 MAX_CANDLES    = 20000
-SLEEP_PER_REQ  = 0.12
 MAX_RETRY      = 3
+WORKERS        = None                              # 스윕 프로세스 수 (None = 코어 수, 1 = 직렬)
+SEARCH         = None                              # None = 전체 격자, "lhs" / "random" = 표본 + successive halving → 상위 조합만 저장
+METRIC         = "total_roe"                       # SEARCH 목표: total_roe | win_rate | worst_trade
 
 # 수수료/슬리피지 (요청: 0)
 TAKER_FEE_BPS  = 0.0
 SLIPPAGE_BPS   = 0.0
 
 # ================= Bybit HTTP =================
-session = HTTP() 
+session = make_session()
+STORE = CandleStore(session=session, max_retry=MAX_RETRY)
 
 def parse_date_ms(s: Optional[str]) -> Optional[int]:
     if not s: return None
@@ -43,80 +56,16 @@ def parse_date_ms(s: Optional[str]) -> Optional[int]:
         dt = dt.replace(tzinfo=timezone.utc)
     return int(dt.timestamp() * 1000)
 
-def bybit_interval(tf: str) -> str:
-    tf = str(tf).upper()
-    mapping = {
-        "1":"1","3":"3","5":"5","15":"15","30":"30","60":"60","120":"120","240":"240","360":"360","720":"720",
-        "D":"D","W":"W","M":"M"
-    }
-    if tf not in mapping:
-        raise ValueError(f"unsupported timeframe: {tf}")
-    return mapping[tf]
-
-def fetch_ohlcv(symbol: str, tf: str, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int]) -> pd.DataFrame:
-    interval = bybit_interval(tf)
-    if start_ms is None: start_ms = parse_date_ms("2018-01-01")
-    if end_ms   is None:
-        end_ms   = int(datetime.now(tz=timezone.utc).timestamp()*1000)
-
-    rows: List[Tuple[int,float,float,float,float,float]] = []
-    hard_cap = cap if cap is not None else 10**12
-    cur_end = end_ms
-    last_exc = None
-
-    while len(rows) < hard_cap and cur_end > start_ms:
-        req_limit = int(min(1000, hard_cap - len(rows)))
-        for _ in range(MAX_RETRY):
-            try:
-                resp = session.get_kline(
-                    category="linear",
-                    symbol=symbol,
-                    interval=interval,
-                    end=cur_end,
-                    limit=req_limit
-                )
-                last_exc = None
-                break
-            except Exception as e:
-                last_exc = e
-                time.sleep(0.3)
-        if last_exc is not None:
-            raise RuntimeError(f"Bybit API error: {last_exc}")
-
-        if resp.get("retCode") != 0:
-            raise RuntimeError(resp.get("retMsg","bybit error"))
-
-        lst = resp.get("result",{}).get("list",[])
-        if not lst:
-            break
-
-        for it in lst:
-            ts = int(it[0])
-            if ts < start_ms: continue
-            o = float(it[1]); h = float(it[2]); l = float(it[3]); c = float(it[4]); v = float(it[5])
-            rows.append((ts,o,h,l,c,v))
-
-        min_ts = min(int(x[0]) for x in lst)
-        cur_end = min_ts - 1
-
-        if len(lst) < req_limit:
-            break
-        time.sleep(SLEEP_PER_REQ)
-
-    if not rows:
-        return pd.DataFrame(columns=["ts","open","high","low","close","volume"])
-
-    df = pd.DataFrame(rows, columns=["ts","open","high","low","close","volume"]).drop_duplicates("ts")
-    df.sort_values("ts", inplace=True)
-    if cap is not None:
-        df = df.tail(int(cap))
+def fetch_ohlcv(symbol: str, tf: str, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int],
+                span: float = 1.0) -> pd.DataFrame:
+    # 로컬 캔들 저장소 경유 — 저장 안 된 구간만 다운로드 (span < 1: 최근 그 비율만, search 용)
+    df = STORE.get(symbol, tf, start_ms, end_ms, cap, span=span)
     df["time"] = pd.to_datetime(df["ts"], unit="ms", utc=True)
-    df.reset_index(drop=True, inplace=True)
     return df
 
 # ================= 지표 =================
 def ema(series: pd.Series, period: int) -> pd.Series:
-    return series.ewm(span=period, adjust=False).mean()
+    return pd.Series(CACHE.ema(series, [period])[0], index=series.index)
 
 # ================= 백테스트 =================
 def backtest(symbol: str, tf: str, fast: int, slow: int, tp_roe: float, sl_roe: float,
@@ -133,11 +82,9 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, tp_roe: float, sl_roe:
     ohlc["ema_fast"] = ema(close, fast)
     ohlc["ema_slow"] = ema(close, slow)
 
-    # 교차 플래그 (NaN 안전)
-    above = (ohlc["ema_fast"] > ohlc["ema_slow"]).fillna(False)
-    above_prev = above.shift(1).fillna(False)
-    cross_up = (~above_prev) & (above)     # 골든 → LONG 진입
-    cross_dn = (above_prev) & (~above)     # 데드  → SHORT 진입
+    # 교차 플래그 (NaN 안전) — 컬럼은 한 번만 배열로 꺼냄
+    ts_arr, close_arr, ef, es = columns(ohlc, "ts", "close", "ema_fast", "ema_slow")
+    cross_up, cross_dn = crosses(ef, es)   # 골든 → LONG 진입 / 데드 → SHORT 진입
 
     position: Optional[str] = None
     entry_px: Optional[float] = None
@@ -155,18 +102,16 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, tp_roe: float, sl_roe:
     n = len(ohlc)
 
     for i in range(start_idx, n):
-        ts = int(ohlc.loc[i,"ts"])
-        dt = datetime.fromtimestamp(ts//1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        px = float(ohlc.loc[i,"close"])
+        px = float(close_arr[i])
 
         # 진입
         if position is None:
-            if bool(cross_up.iloc[i]):
+            if cross_up[i]:
                 position = "LONG"
                 entry_px = px * (1 + slip)
                 qty = notional / entry_px
                 continue
-            elif bool(cross_dn.iloc[i]):
+            elif cross_dn[i]:
                 position = "SHORT"
                 entry_px = px * (1 - slip)
                 qty = notional / entry_px
@@ -179,15 +124,15 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, tp_roe: float, sl_roe:
             roe_pct = (pnl / EQUITY) * 100.0
 
             if roe_pct >= tp_roe:
-                log_rows.append([dt, symbol, tf, fast, slow, 0, 0, "CLOSE", "TP LONG", entry_px, exit_px, pnl, roe_pct])
+                log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0, "CLOSE", "TP LONG", entry_px, exit_px, pnl, roe_pct])
                 position = None; entry_px = None; qty = None
                 continue
             if roe_pct <= -sl_roe:
-                log_rows.append([dt, symbol, tf, fast, slow, 0, 0, "CLOSE", "SL LONG", entry_px, exit_px, pnl, roe_pct])
+                log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0, "CLOSE", "SL LONG", entry_px, exit_px, pnl, roe_pct])
                 position = None; entry_px = None; qty = None
                 continue
-            if bool(cross_dn.iloc[i]):
-                log_rows.append([dt, symbol, tf, fast, slow, 0, 0, "CLOSE", "XC LONG", entry_px, exit_px, pnl, roe_pct])
+            if cross_dn[i]:
+                log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0, "CLOSE", "XC LONG", entry_px, exit_px, pnl, roe_pct])
                 position = None; entry_px = None; qty = None
                 continue
 
@@ -197,90 +142,98 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, tp_roe: float, sl_roe:
             roe_pct = (pnl / EQUITY) * 100.0
 
             if roe_pct >= tp_roe:
-                log_rows.append([dt, symbol, tf, fast, slow, 0, 0, "CLOSE", "TP SHORT", entry_px, exit_px, pnl, roe_pct])
+                log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0, "CLOSE", "TP SHORT", entry_px, exit_px, pnl, roe_pct])
                 position = None; entry_px = None; qty = None
                 continue
             if roe_pct <= -sl_roe:
-                log_rows.append([dt, symbol, tf, fast, slow, 0, 0, "CLOSE", "SL SHORT", entry_px, exit_px, pnl, roe_pct])
+                log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0, "CLOSE", "SL SHORT", entry_px, exit_px, pnl, roe_pct])
                 position = None; entry_px = None; qty = None
                 continue
-            if bool(cross_up.iloc[i]):
-                log_rows.append([dt, symbol, tf, fast, slow, 0, 0, "CLOSE", "XC SHORT", entry_px, exit_px, pnl, roe_pct])
+            if cross_up[i]:
+                log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0, "CLOSE", "XC SHORT", entry_px, exit_px, pnl, roe_pct])
                 position = None; entry_px = None; qty = None
                 continue
 
     return pd.DataFrame(log_rows, columns=cols)
 
+# ================= 백테스트 (TP×SL 격자 한 번에) =================
+def backtest_grid(symbol: str, tf: str, fast: int, slow: int, tps: List[float], sls: List[float],
+                  start_ms: Optional[int], end_ms: Optional[int],
+                  span: float = 1.0) -> Dict[Tuple[float, float], pd.DataFrame]:
+    """backtest 를 (tp, sl) 조합마다 돌린 것과 같은 결과 — 교차 구간별 ROE 경로를 한 번만 계산"""
+    assert fast < slow
+    cols = ["datetime","symbol","timeframe","fast","slow","rsi_p","doorstep",
+            "포지션","비고","entry_price","exit_price","미실현PnL","ROE"]
+    ohlc = fetch_ohlcv(symbol, tf, start_ms, end_ms, MAX_CANDLES, span)
+    if ohlc.empty:
+        return {(tp, sl): pd.DataFrame(columns=cols) for tp in tps for sl in sls}
+
+    close = ohlc["close"].astype(float)
+    ohlc["ema_fast"] = ema(close, fast)
+    ohlc["ema_slow"] = ema(close, slow)
+    ts_arr, close_arr, ef, es = columns(ohlc, "ts", "close", "ema_fast", "ema_slow")
+    cross_up, cross_dn = crosses(ef, es)
+
+    notional = EQUITY * LEVERAGE
+    fee = TAKER_FEE_BPS / 10_000.0
+    slip = SLIPPAGE_BPS  / 10_000.0
+
+    def entry_of(e, side):
+        px = float(close_arr[e])
+        entry_px = px * (1 + slip) if side == kernels.LONG else px * (1 - slip)
+        return entry_px, notional / entry_px
+
+    def roe_path(e, side, bars):
+        entry_px, qty = entry_of(e, side)
+        if side == kernels.LONG:
+            pnl = (close_arr[bars] * (1 - slip) - entry_px) * qty - 2*fee*notional
+        else:
+            pnl = (entry_px - close_arr[bars] * (1 + slip)) * qty - 2*fee*notional
+        return (pnl / EQUITY) * 100.0
+
+    label = {kernels.TP: "TP", kernels.SL: "SL", kernels.EXIT: "XC"}
+    out = {}
+    grid = cross_grid(cross_up, cross_dn, roe_path, tps, sls, start=max(fast, slow) + 1)
+    for key, trades in grid.items():
+        rows = []
+        for e, x, side, reason in trades:
+            if reason == kernels.OPEN:
+                continue
+            entry_px, qty = entry_of(e, side)
+            px = float(close_arr[x])
+            if side == kernels.LONG:
+                exit_px = px * (1 - slip)
+                pnl = (exit_px - entry_px) * qty - 2*fee*notional
+            else:
+                exit_px = px * (1 + slip)
+                pnl = (entry_px - exit_px) * qty - 2*fee*notional
+            roe_pct = (pnl / EQUITY) * 100.0
+            name = "LONG" if side == kernels.LONG else "SHORT"
+            rows.append([utc_str(ts_arr[x]), symbol, tf, fast, slow, 0, 0, "CLOSE", f"{label[reason]} {name}",
+                         entry_px, exit_px, pnl, roe_pct])
+        out[key] = pd.DataFrame(rows, columns=cols)
+    return out
+
 # ================= Summary 생성 =================
 def build_summary(out_dir: str):
-    pattern = os.path.join(out_dir, "*_EMA*-*_TP*_*SL*.csv")
-    files = sorted(glob.glob(pattern))
-
-    rows = []
-    fname_re = re.compile(
-        r"^(?P<symbol>[A-Z0-9]+)_(?P<tf>[0-9DWM]+)_EMA(?P<fast>\d+)-(?P<slow>\d+)_TP(?P<tp>[\d\.]+)_SL(?P<sl>[\d\.]+)\.csv$"
-    )
-
-    for fpath in files:
-        fname = os.path.basename(fpath)
-        m = fname_re.match(fname)
-        meta = {"symbol":None,"timeframe":None,"fast":None,"slow":None,"tp":None,"sl":None,"file":fname}
-        if m:
-            meta.update({
-                "symbol": m.group("symbol"),
-                "timeframe": m.group("tf"),
-                "fast": int(m.group("fast")),
-                "slow": int(m.group("slow")),
-                "tp": float(m.group("tp")),
-                "sl": float(m.group("sl")),
-            })
-
-        try:
-            df = pd.read_csv(fpath, encoding="utf-8-sig")
-        except Exception:
-            try:
-                df = pd.read_csv(fpath, encoding="utf-8")
-            except Exception:
-                df = pd.DataFrame()
-
-        if df.empty:
-            rows.append({**meta,
-                "trades": 0,
-                "total_pnl_usdt": 0.0,
-                "total_roe_pct": 0.0,
-                "win_rate_pct": 0.0,
-                "min_loss_pnl_usdt": 0.0,
-                "min_roe_pct": 0.0,
-                "first_trade_at": None,
-                "last_trade_at": None
-            })
-            continue
-
-        trades = len(df)
-        total_pnl_usdt = float(df["미실현PnL"].sum()) if "미실현PnL" in df.columns else 0.0
-        total_roe_pct  = float(df["ROE"].sum()) if "ROE" in df.columns else 0.0
-        win_rate_pct   = float((df["ROE"] > 0).mean() * 100.0) if "ROE" in df.columns and trades>0 else 0.0
-        min_loss_pnl   = float(df["미실현PnL"].min()) if "미실현PnL" in df.columns else 0.0
-        min_roe_pct    = float(df["ROE"].min()) if "ROE" in df.columns else 0.0
-        first_trade_at = df["datetime"].min() if "datetime" in df.columns else None
-        last_trade_at  = df["datetime"].max() if "datetime" in df.columns else None
-
-        rows.append({**meta,
-            "trades": trades,
-            "total_pnl_usdt": round(total_pnl_usdt, 6),
-            "total_roe_pct":  round(total_roe_pct, 4),
-            "win_rate_pct":   round(win_rate_pct, 2),
-            "min_loss_pnl_usdt": round(min_loss_pnl, 6),
-            "min_roe_pct":    round(min_roe_pct, 4),
-            "first_trade_at": first_trade_at,
-            "last_trade_at":  last_trade_at
-        })
-
-    summary_df = pd.DataFrame(rows, columns=[
-        "symbol","timeframe","fast","slow","tp","sl","file",
+    """결과 저장소의 조합별 지표 → summary_EMA.csv (지표는 조합이 끝날 때마다 저장소가 계산해 둠 → 조회만)"""
+    strategy = os.path.splitext(os.path.basename(__file__))[0]   # run_sweep 이 쓰는 테이블 이름
+    rs = ResultStore(os.path.join(out_dir, RESULTS))
+    try:
+        df = rs.summary(strategy)
+    finally:
+        rs.close()
+
+    summary_df = df.rename(columns={"tf": "timeframe", "tp_roe": "tp", "sl_roe": "sl",
+                                    "total_pnl": "total_pnl_usdt", "min_pnl": "min_loss_pnl_usdt"}).reindex(columns=[
+        "symbol","timeframe","fast","slow","tp","sl","run_id","combo_id",
         "trades","total_pnl_usdt","total_roe_pct","win_rate_pct","min_loss_pnl_usdt","min_roe_pct",
+        "max_drawdown_pct","profit_factor","sharpe",
         "first_trade_at","last_trade_at"
     ])
+    summary_df = summary_df.round({"total_pnl_usdt": 6, "total_roe_pct": 4, "win_rate_pct": 2,
+                                   "min_loss_pnl_usdt": 6, "min_roe_pct": 4, "max_drawdown_pct": 4,
+                                   "profit_factor": 4, "sharpe": 4})
     if not summary_df.empty:
         summary_df.sort_values(["symbol","timeframe","fast","slow","tp","sl","last_trade_at"], inplace=True)
     summary_path = os.path.join(out_dir, "summary_EMA.csv")
@@ -288,30 +241,30 @@ def build_summary(out_dir: str):
     print(f"[OK] summary_EMA.csv saved -> {summary_path}")
 
 # ================= 실행 =================
+def evaluate(symbol, tf, fast, slow, start_ms, end_ms, tps, sls, span: float = 1.0) -> Dict[Tuple[float, float], pd.DataFrame]:
+    """스윕 작업 하나 = EMA 조합 하나의 TP×SL 격자 거래 로그 (워커에서 실행, 저장은 부모가 결과 저장소에)"""
+    return backtest_grid(symbol, tf, fast, slow, list(tps), list(sls), start_ms, end_ms, span)
+
 if __name__ == "__main__":
     os.makedirs(OUT_DIR, exist_ok=True)
 
     start_ms = parse_date_ms(START)
     end_ms   = parse_date_ms(END)
 
-    for s in SYMBOLS:
-        for tf in TIMEFRAMES:
-            for fast in EMA_FAST_ARR:
-                for slow in EMA_SLOW_ARR:
-                    if fast >= slow: 
-                        continue
-                    for tp in TP_ROE_ARR:
-                        for sl in SL_ROE_ARR:
-                            try:
-                                trades_df = backtest(s, tf, fast, slow, tp, sl, start_ms, end_ms)
-                            except Exception as e:
-                                print(f"[SKIP] {s}_{tf}_EMA{fast}-{slow}_TP{tp}_SL{sl}: {e}")
-                                continue
-
-                            fname = f"{s}_{tf}_EMA{fast}-{slow}_TP{tp}_SL{sl}.csv"
-                            fpath = os.path.join(OUT_DIR, fname)
-                            trades_df.to_csv(fpath, index=False, encoding="utf-8-sig")
-                            print(f"✅ 저장: {fpath}")
+    # TP×SL 는 작업 안에서 한 번에 (교차 구간별 ROE 경로 공유), EMA 조합은 프로세스 풀로
+    tasks = plan({"symbol": SYMBOLS, "tf": TIMEFRAMES, "fast": EMA_FAST_ARR, "slow": EMA_SLOW_ARR,
+                  "start_ms": [start_ms], "end_ms": [end_ms],
+                  "tps": [tuple(TP_ROE_ARR)], "sls": [tuple(SL_ROE_ARR)]},
+                 valid=lambda t: t["fast"] < t["slow"], name="EMA_cross")
+    candles = [(s, tf, start_ms, end_ms, MAX_CANDLES) for s in SYMBOLS for tf in TIMEFRAMES]
+    task_label = lambda t: f"{t['symbol']}_{t['tf']}_EMA{t['fast']}-{t['slow']}"
+    if SEARCH:   # 전체 격자 대신 표본 + successive halving → 상위 조합만 아래에서 결과 저장소에
+        tasks = [t for t, _ in search(evaluate, tasks, partial(trade_score, METRIC), method=SEARCH,
+                                      workers=WORKERS, store=STORE, candles=candles, label=task_label)]
+    run_sweep(evaluate, tasks, workers=WORKERS, store=STORE, candles=candles,
+              manifest=os.path.join(OUT_DIR, MANIFEST), results=os.path.join(OUT_DIR, RESULTS),
+              settings=settings(globals()), label=task_label,
+              on_result=lambda t, r: print(f"✅ 저장: {task_label(t)} TP×SL {len(r['combo_ids'])}칸, 거래 {r['trades']}건"))
 
     # summary 생성
     build_summary(OUT_DIR)
@@ -2,10 +2,20 @@
 import os, time, math
 from datetime import datetime, timezone
 from typing import Optional, List, Tuple, Dict
+from functools import partial
 
 import numpy as np
 import pandas as pd
-from pybit.unified_trading import HTTP
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from candle_store import CandleStore
+from backtest_core import columns, crosses, cross_grid, utc_str, trade_score
+import kernels
+from indicator_cache import CACHE   # 같은 캔들/파라미터 지표는 한 번만 계산
+from mock_bybit import make_session   # BYBIT_MOCK=1 이면 오프라인 대역
+from sweep import plan, run_sweep, search, settings, MANIFEST   # 조합별 병렬 실행 (코어당 워커 하나)
+from results_store import RESULTS   # 전체 거래 로그를 SQLite 파일 하나에 (조합별 CSV 대신)
 
 # ================= 사용자 설정 =================
 OUT_DIR        = r"d:\Projects\AutoCoinAI\test"
@@ -23,11 +33,14 @@ LEVERAGE       = 5
 START          = "2025-03-01"                  # ISO 또는 "YYYY-MM-DD"
 END            = None                          # None이면 현재시각
 MAX_CANDLES    = 20000
-SLEEP_PER_REQ  = 0.15                          # Bybit rate-limit 완화
 MAX_RETRY      = 3                             # API 실패 재시도 횟수
+WORKERS        = None                          # 스윕 프로세스 수 (None = 코어 수, 1 = 직렬)
+SEARCH         = None                          # None = 전체 격자, "lhs" / "random" = 표본 + successive halving → 상위 조합만 저장
+METRIC         = "total_roe"                   # SEARCH 목표: total_roe | win_rate | worst_trade
 
 # ================= Bybit HTTP =================
-session = HTTP()  # (주의) 환경에 따라 key/secret 지정 필요할 수 있음
+session = make_session()  # (주의) 환경에 따라 key/secret 지정 필요할 수 있음
+STORE = CandleStore(session=session, max_retry=MAX_RETRY)
 
 def parse_date(s: Optional[str]) -> Optional[int]:
     if not s:
@@ -40,96 +53,18 @@ def parse_date(s: Optional[str]) -> Optional[int]:
         dt = dt.replace(tzinfo=timezone.utc)
     return int(dt.timestamp() * 1000)
 
-def bybit_interval(tf: str) -> str:
-    tf = str(tf).upper()
-    # Bybit UTA 인터벌: "1","3","5","15","30","60","120","240","360","720","D","W","M"
-    mapping = {
-        "1": "1", "3": "3", "5": "5", "15": "15", "30": "30", "60": "60",
-        "120": "120", "240": "240", "360": "360", "720": "720",
-        "D": "D", "W": "W", "M": "M"
-    }
-    if tf not in mapping:
-        raise ValueError(f"unsupported tf: {tf}")
-    return mapping[tf]
-
-def fetch_ohlcv(symbol: str, tf: str, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int]) -> pd.DataFrame:
-    """Bybit unified trading API에서 선물(Linear) kline 끊어서 가져오기 (끝에서 과거로 역방향 페이징)"""
-    interval = bybit_interval(tf)
-    if start_ms is None:
-        start_ms = parse_date("2018-01-01")
-    if end_ms is None:
-        end_ms = int(datetime.now(tz=timezone.utc).timestamp() * 1000)
-
-    rows: List[Tuple[int, float, float, float, float, float]] = []
-    hard_cap = cap if cap is not None else 10**12
-    cur_end = end_ms
-
-    while len(rows) < hard_cap and cur_end > start_ms:
-        req_limit = int(min(1000, hard_cap - len(rows)))
-
-        # 재시도 루프
-        last_exc = None
-        for _ in range(MAX_RETRY):
-            try:
-                resp = session.get_kline(
-                    category="linear",
-                    symbol=symbol,
-                    interval=interval,
-                    end=cur_end,
-                    limit=req_limit,
-                )
-                break
-            except Exception as e:
-                last_exc = e
-                time.sleep(0.3)
-        if last_exc is not None and 'resp' not in locals():
-            raise RuntimeError(f"Bybit API error: {last_exc}")
-
-        if resp.get("retCode") != 0:
-            raise RuntimeError(resp.get("retMsg", "bybit error"))
-
-        lst = resp.get("result", {}).get("list", [])
-        if not lst:
-            break
-
-        for it in lst:
-            ts = int(it[0])
-            if ts < start_ms:
-                continue
-            o = float(it[1]); h = float(it[2]); l = float(it[3]); c = float(it[4]); v = float(it[5])
-            rows.append((ts, o, h, l, c, v))
-
-        # 다음 페이지: 가장 과거 ts보다 1ms 앞
-        min_ts = min(int(x[0]) for x in lst)
-        cur_end = min_ts - 1
-
-        if len(lst) < req_limit:
-            break
-        time.sleep(SLEEP_PER_REQ)
-
-    if not rows:
-        return pd.DataFrame(columns=["ts", "open", "high", "low", "close", "volume"])
-
-    df = pd.DataFrame(rows, columns=["ts", "open", "high", "low", "close", "volume"]).drop_duplicates("ts")
-    df.sort_values("ts", inplace=True)
-    if cap is not None:
-        df = df.tail(int(cap))
-    df.reset_index(drop=True, inplace=True)
-    return df
+def fetch_ohlcv(symbol: str, tf: str, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int],
+                span: float = 1.0) -> pd.DataFrame:
+    """Bybit 선물(Linear) kline — 로컬 캔들 저장소 경유 (저장 안 된 구간만 다운로드, span < 1: 최근 그 비율만)"""
+    return STORE.get(symbol, tf, start_ms, end_ms, cap, span=span)
 
 # ================= 지표 =================
 def ema(series: pd.Series, period: int) -> pd.Series:
-    return series.ewm(span=period, adjust=False).mean()
+    return pd.Series(CACHE.ema(series, [period])[0], index=series.index)
 
 # (호환용: 안 써도 열은 남김)
 def compute_rsi(close: pd.Series, period: int) -> pd.Series:
-    delta = close.diff()
-    up = delta.clip(lower=0)
-    down = (-delta).clip(lower=0)
-    roll_up = up.ewm(alpha=1/period, adjust=False).mean()
-    roll_down = down.ewm(alpha=1/period, adjust=False).mean()
-    rs = roll_up / (roll_down + 1e-12)
-    return 100 - (100/(1+rs))
+    return pd.Series(CACHE.rsi(close, [period])[0], index=close.index)
 
 # ================= 백테스트 =================
 # rsi_p, doorstep은 파일 호환만 위해 0으로 기록
@@ -147,10 +82,8 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: f
     ohlc["ema_slow"] = ema(ohlc["close"], slow)
 
     # 교차 판정
-    fast_gt = ohlc["ema_fast"] > ohlc["ema_slow"]
-    fast_gt_prev = fast_gt.shift(1).fillna(False)
-    cross_up = (~fast_gt_prev) & (fast_gt)      # 골든 → 롱 전환
-    cross_dn = (fast_gt_prev) & (~fast_gt)      # 데드 → 숏 전환
+    ts_arr, close, ef, es = columns(ohlc, "ts", "close", "ema_fast", "ema_slow")
+    cross_up, cross_dn = crosses(ef, es)        # 골든 → 롱 전환 / 데드 → 숏 전환
 
     position: Optional[str] = None
     entry_px: Optional[float] = None
@@ -162,20 +95,18 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: f
             "포지션","비고","entry_price","exit_price","미실현PnL","ROE"]
     log_rows: List[List] = []
 
-    for i in range(len(ohlc)):
-        ts = int(ohlc.loc[i, "ts"]) // 1000
-        dt = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        px = float(ohlc.loc[i, "close"])
+    for i in range(len(close)):
+        px = float(close[i])
 
         # 진입
         if position is None:
-            if cross_up.iloc[i]:
+            if cross_up[i]:
                 position = "LONG"
                 entry_px = px
                 qty = notional / entry_px
                 # (진입 자체는 기록 안 함 — 청산 시점만 기록)
                 continue
-            elif cross_dn.iloc[i]:
+            elif cross_dn[i]:
                 position = "SHORT"
                 entry_px = px
                 qty = notional / entry_px
@@ -189,17 +120,17 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: f
                 roe_pct = (pnl / equity_used) * 100.0
 
                 if roe_pct >= tp_roe:
-                    log_rows.append([dt, symbol, tf, fast, slow, 0, 0,
+                    log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0,
                                      "CLOSE", "TP LONG", entry_px, px, pnl, roe_pct])
                     position = None; entry_px = None; qty = None
                     continue
                 if roe_pct <= -sl_roe:
-                    log_rows.append([dt, symbol, tf, fast, slow, 0, 0,
+                    log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0,
                                      "CLOSE", "SL LONG", entry_px, px, pnl, roe_pct])
                     position = None; entry_px = None; qty = None
                     continue
-                if cross_dn.iloc[i]:
-                    log_rows.append([dt, symbol, tf, fast, slow, 0, 0,
+                if cross_dn[i]:
+                    log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0,
                                      "CLOSE", "XC LONG", entry_px, px, pnl, roe_pct])
                     position = None; entry_px = None; qty = None
                     continue
@@ -210,17 +141,17 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: f
                 roe_pct = (pnl / equity_used) * 100.0
 
                 if roe_pct >= tp_roe:
-                    log_rows.append([dt, symbol, tf, fast, slow, 0, 0,
+                    log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0,
                                      "CLOSE", "TP SHORT", entry_px, px, pnl, roe_pct])
                     position = None; entry_px = None; qty = None
                     continue
                 if roe_pct <= -sl_roe:
-                    log_rows.append([dt, symbol, tf, fast, slow, 0, 0,
+                    log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0,
                                      "CLOSE", "SL SHORT", entry_px, px, pnl, roe_pct])
                     position = None; entry_px = None; qty = None
                     continue
-                if cross_up.iloc[i]:
-                    log_rows.append([dt, symbol, tf, fast, slow, 0, 0,
+                if cross_up[i]:
+                    log_rows.append([utc_str(ts_arr[i]), symbol, tf, fast, slow, 0, 0,
                                      "CLOSE", "XC SHORT", entry_px, px, pnl, roe_pct])
                     position = None; entry_px = None; qty = None
                     continue
@@ -228,28 +159,71 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: f
     trades_df = pd.DataFrame(log_rows, columns=cols)
     return trades_df
 
+# ================= 백테스트 (TP×SL 격자 한 번에) =================
+def backtest_grid(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: float,
+                  tps: List[float], sls: List[float], span: float = 1.0) -> Dict[Tuple[float, float], pd.DataFrame]:
+    """backtest 를 (tp, sl) 조합마다 돌린 것과 같은 결과 — 교차 구간별 ROE 경로를 한 번만 계산"""
+    assert fast < slow, "fast < slow 이어야 합니다."
+    start_ms = parse_date(START); end_ms = parse_date(END)
+
+    ohlc = fetch_ohlcv(symbol, tf, start_ms, end_ms, MAX_CANDLES, span)
+    if ohlc.empty:
+        raise SystemExit(f"[{symbol}@{tf}] no data")
+
+    ohlc["ema_fast"] = ema(ohlc["close"], fast)
+    ohlc["ema_slow"] = ema(ohlc["close"], slow)
+    ts_arr, close, ef, es = columns(ohlc, "ts", "close", "ema_fast", "ema_slow")
+    cross_up, cross_dn = crosses(ef, es)
+
+    notional = EQUITY * LEVERAGE
+    equity_used = notional / LEVERAGE
+
+    def roe_path(e, side, bars):
+        entry_px = float(close[e])
+        qty = notional / entry_px
+        pnl = (close[bars] - entry_px) * qty if side == kernels.LONG else (entry_px - close[bars]) * qty
+        return (pnl / equity_used) * 100.0
+
+    cols = ["datetime","symbol","timeframe","fast","slow","rsi_p","doorstep",
+            "포지션","비고","entry_price","exit_price","미실현PnL","ROE"]
+    label = {kernels.TP: "TP", kernels.SL: "SL", kernels.EXIT: "XC"}
+    out = {}
+    for key, trades in cross_grid(cross_up, cross_dn, roe_path, tps, sls).items():
+        rows = []
+        for e, x, side, reason in trades:
+            if reason == kernels.OPEN:
+                continue
+            entry_px, px = float(close[e]), float(close[x])
+            qty = notional / entry_px
+            pnl = (px - entry_px) * qty if side == kernels.LONG else (entry_px - px) * qty
+            roe_pct = (pnl / equity_used) * 100.0
+            name = "LONG" if side == kernels.LONG else "SHORT"
+            rows.append([utc_str(ts_arr[x]), symbol, tf, fast, slow, 0, 0,
+                         "CLOSE", f"{label[reason]} {name}", entry_px, px, pnl, roe_pct])
+        out[key] = pd.DataFrame(rows, columns=cols)
+    return out
+
 # ================= 실행 =================
+def evaluate(symbol, tf, fast, slow, tps, sls, span: float = 1.0) -> Dict[Tuple[float, float], pd.DataFrame]:
+    """스윕 작업 하나 = EMA 조합 하나의 TP×SL 격자 거래 로그 (워커에서 실행, 저장은 부모가 결과 저장소에)"""
+    return backtest_grid(symbol, tf, fast, slow, 0, 0, list(tps), list(sls), span)
+
 if __name__ == "__main__":
     os.makedirs(OUT_DIR, exist_ok=True)
 
-    for s in SYMBOLS:
-        for tf in TIMEFRAMES:
-            for fast in EMA_FAST_ARR:
-                for slow in EMA_SLOW_ARR:
-                    if fast >= slow:
-                        continue
-                    for tp in TP_ROE_ARR:
-                        for sl in SL_ROE_ARR:
-                            try:
-                                df = backtest(s, tf, fast, slow, 0, 0, tp, sl)
-                            except SystemExit as e:
-                                print(f"[SKIP] {s}_{tf}_EMA{fast}-{slow}_TP{tp}_SL{sl}: {e}")
-                                continue
-                            except Exception as e:
-                                print(f"[ERR ] {s}_{tf}_EMA{fast}-{slow}_TP{tp}_SL{sl}: {e}")
-                                continue
-
-                            fname = f"{s}_{tf}_EMA{fast}-{slow}_TP{tp}_SL{sl}.csv"
-                            fpath = os.path.join(OUT_DIR, fname)
-                            df.to_csv(fpath, index=False, encoding="utf-8-sig")
-                            print(f"✅ 저장: {fpath}")
+    # TP×SL 는 작업 안에서 한 번에 (교차 구간별 ROE 경로 공유), EMA 조합은 프로세스 풀로
+    # (TP/SL 목록도 작업 파라미터 → 값을 추가하면 manifest 키가 바뀌어 다시 실행)
+    # (rsi_p/doorstep 은 파일 호환용 0 고정 — 격자 축이 아님)
+    tasks = plan({"symbol": SYMBOLS, "tf": TIMEFRAMES, "fast": EMA_FAST_ARR, "slow": EMA_SLOW_ARR,
+                  "tps": [tuple(TP_ROE_ARR)], "sls": [tuple(SL_ROE_ARR)]},
+                 valid=lambda t: t["fast"] < t["slow"], name="EMA_scalping")
+    start_ms = parse_date(START); end_ms = parse_date(END)
+    candles = [(s, tf, start_ms, end_ms, MAX_CANDLES) for s in SYMBOLS for tf in TIMEFRAMES]
+    task_label = lambda t: f"{t['symbol']}_{t['tf']}_EMA{t['fast']}-{t['slow']}"
+    if SEARCH:   # 전체 격자 대신 표본 + successive halving → 상위 조합만 아래에서 결과 저장소에
+        tasks = [t for t, _ in search(evaluate, tasks, partial(trade_score, METRIC), method=SEARCH,
+                                      workers=WORKERS, store=STORE, candles=candles, label=task_label)]
+    run_sweep(evaluate, tasks, workers=WORKERS, store=STORE, candles=candles,
+              manifest=os.path.join(OUT_DIR, MANIFEST), results=os.path.join(OUT_DIR, RESULTS),
+              settings=settings(globals()), label=task_label,
+              on_result=lambda t, r: print(f"✅ 저장: {task_label(t)} TP×SL {len(r['combo_ids'])}칸, 거래 {r['trades']}건"))
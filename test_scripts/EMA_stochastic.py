@@ -3,10 +3,20 @@
 
 import os, time
 from datetime import datetime, timezone
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
+from functools import partial
 import numpy as np
 import pandas as pd
-from pybit.unified_trading import HTTP
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from candle_store import CandleStore
+from backtest_core import columns, first_hits, utc_str, trade_score
+import kernels   # 전략 상태머신 (numba 있으면 컴파일)
+from indicator_cache import CACHE   # 같은 캔들/파라미터 지표는 한 번만 계산
+from mock_bybit import make_session   # BYBIT_MOCK=1 이면 오프라인 대역
+from sweep import plan, unused, run_sweep, search, settings, MANIFEST   # 조합별 병렬 실행 (코어당 워커 하나)
+from results_store import RESULTS   # 전체 거래 로그를 SQLite 파일 하나에 (조합별 CSV 대신)
 
 # ================= 사용자 설정 =================
 OUT_DIR        = r"d:\Projects\AutoCoinAI\test"
@@ -41,15 +51,18 @@ LEVERAGE       = 5
 START          = "2025-01-01"
 END            = None
 MAX_CANDLES    = 20000
-SLEEP_PER_REQ  = 0.15
 MAX_RETRY      = 3
+WORKERS        = None   # 스윕 프로세스 수 (None = 코어 수, 1 = 이 프로세스에서 직렬)
+SEARCH         = None   # None = 전체 격자, "lhs" / "random" = 표본 + successive halving → 상위 조합만 저장
+METRIC         = "total_roe"   # SEARCH 목표: total_roe | win_rate | worst_trade
 
 # 슬리피지/수수료(테이커)
 SLIPPAGE_RATE   = 0.0005   # 0.05% 불리한 체결 가정
 TAKER_FEE_RATE  = 0.0006   # 0.06%/side (왕복 0.12%)
 
 # ================= Bybit HTTP =================
-session = HTTP()  # 필요 시 key/secret 환경 설정
+session = make_session()  # 필요 시 key/secret 환경 설정
+STORE = CandleStore(session=session, max_retry=MAX_RETRY)
 
 # ================= 유틸 =================
 def parse_date(s: Optional[str]) -> Optional[int]:
@@ -62,98 +75,22 @@ def parse_date(s: Optional[str]) -> Optional[int]:
         dt = dt.replace(tzinfo=timezone.utc)
     return int(dt.timestamp() * 1000)
 
-def bybit_interval(tf: str) -> str:
-    tf = str(tf).upper()
-    mapping = {
-        "1":"1","3":"3","5":"5","15":"15","30":"30","60":"60",
-        "120":"120","240":"240","360":"360","720":"720",
-        "D":"D","W":"W","M":"M"
-    }
-    if tf not in mapping:
-        raise ValueError(f"unsupported tf: {tf}")
-    return mapping[tf]
-
-def fetch_ohlcv(symbol: str, tf: str, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int]) -> pd.DataFrame:
-    """Bybit linear kline 페이징 수집 (최신→과거)"""
-    interval = bybit_interval(tf)
-    if start_ms is None:
-        start_ms = parse_date("2018-01-01")
-    if end_ms is None:
-        end_ms = int(datetime.now(tz=timezone.utc).timestamp() * 1000)
-
-    rows: List[Tuple[int,float,float,float,float,float]] = []
-    hard_cap = cap if cap is not None else 10**12
-    cur_end = end_ms
-
-    while len(rows) < hard_cap and cur_end > start_ms:
-        req_limit = int(min(1000, hard_cap - len(rows)))
-        resp = None; last_exc = None
-        for _ in range(MAX_RETRY):
-            try:
-                resp = session.get_kline(
-                    category="linear", symbol=symbol,
-                    interval=interval, end=cur_end, limit=req_limit
-                )
-                break
-            except Exception as e:
-                last_exc = e; time.sleep(0.3)
-        if resp is None:
-            raise RuntimeError(f"Bybit API error: {last_exc}")
-        if resp.get("retCode") != 0:
-            raise RuntimeError(resp.get("retMsg","bybit error"))
-
-        lst = resp.get("result",{}).get("list",[])
-        if not lst: break
-
-        for it in lst:
-            ts = int(it[0])
-            if ts < start_ms: continue
-            o = float(it[1]); h = float(it[2]); l = float(it[3]); c = float(it[4]); v = float(it[5])
-            rows.append((ts,o,h,l,c,v))
-
-        min_ts = min(int(x[0]) for x in lst)
-        cur_end = min_ts - 1
-
-        if len(lst) < req_limit: break
-        time.sleep(SLEEP_PER_REQ)
-
-    if not rows:
-        return pd.DataFrame(columns=["ts","open","high","low","close","volume"])
-
-    df = pd.DataFrame(rows, columns=["ts","open","high","low","close","volume"]).drop_duplicates("ts")
-    df.sort_values("ts", inplace=True)
-    if cap is not None:
-        df = df.tail(int(cap))
-    df.reset_index(drop=True, inplace=True)
-    return df
+def fetch_ohlcv(symbol: str, tf: str, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int],
+                span: float = 1.0) -> pd.DataFrame:
+    """Bybit linear kline — 로컬 캔들 저장소 경유 (저장 안 된 구간만 다운로드, span < 1: 최근 그 비율만)"""
+    return STORE.get(symbol, tf, start_ms, end_ms, cap, span=span)
 
 # ================= 지표 =================
 def ema(series: pd.Series, period: int) -> pd.Series:
-    return series.ewm(span=period, adjust=False).mean()
+    return pd.Series(CACHE.ema(series, [period])[0], index=series.index)
 
 def compute_k(df: pd.DataFrame, k_period: int, k_smooth: int) -> pd.Series:
     """
     %K_raw = 100 * (Close - LL(k)) / (HH(k) - LL(k))
     %K = SMA(%K_raw, k_smooth)
     """
-    low_min  = df["low"].rolling(window=k_period).min()
-    high_max = df["high"].rolling(window=k_period).max()
-    k_raw = 100.0 * (df["close"] - low_min) / (np.maximum(high_max - low_min, 1e-12))
-    k = k_raw.rolling(window=max(1,k_smooth)).mean()
-    return k
-
-# ================= 교차(EMA 기준) =================
-def ema_cross_up(f_prev: float, f_now: float, s_prev: float, s_now: float) -> bool:
-    # 골든: fast가 slow를 아래→위로 교차
-    if np.isnan(f_prev) or np.isnan(f_now) or np.isnan(s_prev) or np.isnan(s_now):
-        return False
-    return f_prev <= s_prev and f_now > s_now
-
-def ema_cross_down(f_prev: float, f_now: float, s_prev: float, s_now: float) -> bool:
-    # 데드: fast가 slow를 위→아래로 교차
-    if np.isnan(f_prev) or np.isnan(f_now) or np.isnan(s_prev) or np.isnan(s_now):
-        return False
-    return f_prev >= s_prev and f_now < s_now
+    k = CACHE.stoch_k(df["high"], df["low"], df["close"], k_period, [k_smooth], eps=1e-12, floor=True)
+    return pd.Series(k[0], index=df.index)
 
 # ================= 체결가(슬리피지), 수수료 반영 =================
 def execution_price(side: str, px: float, on_entry: bool) -> float:
@@ -207,133 +144,172 @@ def backtest(
     ohlc["ema_fast"] = ema(ohlc["close"], fast)
     ohlc["ema_slow"] = ema(ohlc["close"], slow)
     ohlc["K"] = compute_k(ohlc, st_p, st_k)
-
-    # ===== 포지션 상태 =====
-    position: Optional[str] = None
-    entry_exec: Optional[float] = None
-    qty: Optional[float] = None
+    # 컬럼은 한 번만 배열로 꺼냄 (루프 안에서 .loc 안 씀)
+    ts_arr, close, K, ef, es = columns(ohlc, "ts", "close", "K", "ema_fast", "ema_slow")
 
     notional    = EQUITY * LEVERAGE
     equity_used = EQUITY
 
-    # 레벨 터치 후 EMA 교차 대기 플래그
-    wait_short_after_OB = False   # 80 찍은 뒤, EMA 데드크로스 대기
-    wait_long_after_OS  = False   # 20 찍은 뒤, EMA 골든크로스 대기
-
     cols = ["datetime","symbol","timeframe",
             "fast","slow","st_p","st_k","st_d","OS","OB","side_mode",
             "포지션","비고","entry_px","exit_px","미실현PnL","ROE"]
     logs: List[List] = []
 
-    for i in range(1, len(ohlc)):
-        ts = int(ohlc.loc[i, "ts"]) // 1000
-        dt = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        px_now = float(ohlc.loc[i, "close"])
-
-        # K 및 EMA 값
-        k_now  = float(ohlc.loc[i,   "K"])
-        k_prev = float(ohlc.loc[i-1, "K"])
-
-        f_now  = float(ohlc.loc[i,   "ema_fast"])
-        f_prev = float(ohlc.loc[i-1, "ema_fast"])
-        s_now  = float(ohlc.loc[i,   "ema_slow"])
-        s_prev = float(ohlc.loc[i-1, "ema_slow"])
-
-        # --- 레벨 터치 감지 (플래그 세팅) ---
-        if k_now >= ob_level or k_prev >= ob_level:
-            wait_short_after_OB = True
-        if k_now <= os_level or k_prev <= os_level:
-            wait_long_after_OS = True
-
-        # ===== 진입 =====
-        if position is None:
-            # 숏: 80 찍은 "후" EMA 데드크로스(빠른선이 느린선을 위->아래로)
-            if side_mode in ("BOTH","SHORT_ONLY") and wait_short_after_OB:
-                if ema_cross_down(f_prev, f_now, s_prev, s_now):
-                    position = "SHORT"
-                    entry_exec = execution_price("SHORT", px_now, on_entry=True)
-                    qty = notional / max(entry_exec, 1e-12)
-                    wait_short_after_OB = False  # 소진
-                    continue
+    # ===== 상태머신 (레벨 터치 후 EMA 교차 대기 → 진입, TP/SL/반대 레벨 청산) — 커널 =====
+    trades = kernels.ema_stoch(close, K, ef, es, os_level, ob_level,
+                               side_mode in ("BOTH","LONG_ONLY"), side_mode in ("BOTH","SHORT_ONLY"),
+                               tp_roe, sl_roe, notional, equity_used, SLIPPAGE_RATE, TAKER_FEE_RATE)
+
+    # ===== 청산된 거래만 로그 (체결가/PnL 은 같은 함수로 다시 계산) =====
+    for e, x, side, reason, _ in trades.rows():
+        if reason == kernels.OPEN:
+            continue
+        position   = "LONG" if side == kernels.LONG else "SHORT"
+        entry_exec = execution_price(position, float(close[e]), on_entry=True)
+        qty        = notional / max(entry_exec, 1e-12)
+        exit_exec  = execution_price(position, float(close[x]), on_entry=False)
+        pnl, roe   = realized_roe(position, entry_exec, exit_exec, qty, equity_used)
+        if reason == kernels.LEVEL:
+            remark = "LV LONG(K>=OB)" if position == "LONG" else "LV SHORT(K<=OS)"
+        else:
+            remark = f"{'TP' if reason == kernels.TP else 'SL'} {position}"
+        logs.append([utc_str(ts_arr[x]), symbol, tf, fast, slow, st_p, st_k, st_d_dummy, os_level, ob_level, side_mode,
+                     "CLOSE", remark, entry_exec, exit_exec, pnl, roe])
 
-            # 롱: 20 찍은 "후" EMA 골든크로스(아래->위)
-            if side_mode in ("BOTH","LONG_ONLY") and wait_long_after_OS:
-                if ema_cross_up(f_prev, f_now, s_prev, s_now):
-                    position = "LONG"
-                    entry_exec = execution_price("LONG", px_now, on_entry=True)
-                    qty = notional / max(entry_exec, 1e-12)
-                    wait_long_after_OS = False
-                    continue
+    return pd.DataFrame(logs, columns=cols)
 
-        # ===== 청산 =====
-        if position is not None:
-            exit_exec = execution_price(position, px_now, on_entry=False)
-            pnl, roe = realized_roe(position, entry_exec, exit_exec, qty, equity_used)
-
-            # 1) TP/SL (ROE%)
-            if roe >= tp_roe:
-                logs.append([dt, symbol, tf, fast, slow, st_p, st_k, st_d_dummy, os_level, ob_level, side_mode,
-                             "CLOSE", f"TP {position}", entry_exec, exit_exec, pnl, roe])
-                position = entry_exec = qty = None
-                continue
-            if roe <= -sl_roe:
-                logs.append([dt, symbol, tf, fast, slow, st_p, st_k, st_d_dummy, os_level, ob_level, side_mode,
-                             "CLOSE", f"SL {position}", entry_exec, exit_exec, pnl, roe])
-                position = entry_exec = qty = None
-                continue
-
-            # 2) 반대 극단 레벨 도달 시 청산
-            if position == "LONG":
-                if k_now >= ob_level:
-                    logs.append([dt, symbol, tf, fast, slow, st_p, st_k, st_d_dummy, os_level, ob_level, side_mode,
-                                 "CLOSE", "LV LONG(K>=OB)", entry_exec, exit_exec, pnl, roe])
-                    position = entry_exec = qty = None
-                    continue
-            elif position == "SHORT":
-                if k_now <= os_level:
-                    logs.append([dt, symbol, tf, fast, slow, st_p, st_k, st_d_dummy, os_level, ob_level, side_mode,
-                                 "CLOSE", "LV SHORT(K<=OS)", entry_exec, exit_exec, pnl, roe])
-                    position = entry_exec = qty = None
-                    continue
+# ================= 백테스트 (TP×SL 격자 한 번에) =================
+def backtest_grid(
+    symbol: str, tf: str,
+    fast: int, slow: int,
+    st_p: int, st_k: int, st_d_dummy: int,
+    os_level: float, ob_level: float,
+    side_mode: str,
+    tps: List[float], sls: List[float],
+    span: float = 1.0
+) -> Dict[Tuple[float, float], pd.DataFrame]:
+    """
+    backtest 를 (tp, sl) 조합마다 돌린 것과 같은 결과
+    - 진입 후보 = EMA 교차 봉, 포지션 창 = (진입, 반대 극단 K 레벨 봉] → 진입 봉마다 ROE 경로/first_hits 한 번
+    - 레벨 터치 대기 플래그 = 직전 같은 방향 진입 이후 터치가 있었는지 (누적 터치 수 차이)
+    """
+    assert fast < slow, "fast < slow 이어야 합니다."
+    assert side_mode in ("BOTH","LONG_ONLY","SHORT_ONLY")
 
-    return pd.DataFrame(logs, columns=cols)
+    start_ms = parse_date(START); end_ms = parse_date(END)
+    ohlc = fetch_ohlcv(symbol, tf, start_ms, end_ms, MAX_CANDLES, span)
+    if ohlc.empty:
+        raise SystemExit(f"[{symbol}@{tf}] no data")
+
+    ohlc["ema_fast"] = ema(ohlc["close"], fast)
+    ohlc["ema_slow"] = ema(ohlc["close"], slow)
+    ohlc["K"] = compute_k(ohlc, st_p, st_k)
+    ts_arr, close, K, ef, es = columns(ohlc, "ts", "close", "K", "ema_fast", "ema_slow")
+    n = len(close)
+
+    # ===== 봉별 신호 (backtest 루프와 같은 판정) =====
+    prev = lambda a: np.r_[np.nan, a[:-1]]
+    k_prev, f_prev, s_prev = prev(K), prev(ef), prev(es)
+    cum_ob = np.cumsum((K >= ob_level) | (k_prev >= ob_level))   # 봉 i 까지의 레벨 터치 수
+    cum_os = np.cumsum((K <= os_level) | (k_prev <= os_level))
+    cum_ob -= cum_ob[0]; cum_os -= cum_os[0]   # 루프는 봉 1부터 → 봉 0 터치는 안 셈
+    valid = ~(np.isnan(f_prev) | np.isnan(ef) | np.isnan(s_prev) | np.isnan(es))
+    dead   = valid & (f_prev >= s_prev) & (ef < es)
+    golden = valid & (f_prev <= s_prev) & (ef > es)
+    cands = np.flatnonzero((dead & (side_mode != "LONG_ONLY")) | (golden & (side_mode != "SHORT_ONLY")))
+    cands = cands[cands >= 1]
+    level_exit = {kernels.LONG: np.flatnonzero(K >= ob_level), kernels.SHORT: np.flatnonzero(K <= os_level)}
+
+    notional    = EQUITY * LEVERAGE
+    equity_used = EQUITY
+
+    def entry_of(e, position):
+        entry_exec = execution_price(position, float(close[e]), on_entry=True)
+        return entry_exec, notional / max(entry_exec, 1e-12)
+
+    tables = {}
+    def table(e, side):
+        """진입 봉 e → (first_hits 오프셋, 사유, 레벨 청산 봉 또는 None) — 조합들이 공유"""
+        if e not in tables:
+            lv = level_exit[side]
+            j = np.searchsorted(lv, e, side="right")
+            end = int(lv[j]) if j < len(lv) else None
+            bars = np.arange(e + 1, (n - 1 if end is None else end) + 1)
+            position = "LONG" if side == kernels.LONG else "SHORT"
+            entry_exec, qty = entry_of(e, position)
+            exit_exec = close[bars] * (1 - SLIPPAGE_RATE) if side == kernels.LONG else close[bars] * (1 + SLIPPAGE_RATE)
+            fees = (qty * entry_exec + qty * exit_exec) * TAKER_FEE_RATE
+            pnl = ((exit_exec - entry_exec) if side == kernels.LONG else (entry_exec - exit_exec)) * qty - fees
+            tables[e] = first_hits((pnl / equity_used) * 100.0, tps, sls) + (end,)
+        return tables[e]
+
+    cols = ["datetime","symbol","timeframe",
+            "fast","slow","st_p","st_k","st_d","OS","OB","side_mode",
+            "포지션","비고","entry_px","exit_px","미실현PnL","ROE"]
+    out = {}
+    for a, tp in enumerate(tps):
+        for b, sl in enumerate(sls):
+            logs: List[List] = []
+            last = {kernels.SHORT: 0, kernels.LONG: 0}   # 방향별 직전 진입 봉
+            k = 0
+            while k < len(cands):
+                i = int(cands[k])
+                side = kernels.SHORT if dead[i] else kernels.LONG
+                cum = cum_ob if side == kernels.SHORT else cum_os
+                if cum[i] == cum[last[side]]:   # 직전 진입 이후 레벨 터치 없음
+                    k += 1
+                    continue
+                last[side] = i
+                off, hit, end = table(i, side)
+                if hit[a, b] != kernels.OPEN:
+                    x, reason = i + 1 + int(off[a, b]), int(hit[a, b])
+                elif end is not None:
+                    x, reason = end, kernels.LEVEL
+                else:
+                    break
+                position = "LONG" if side == kernels.LONG else "SHORT"
+                entry_exec, qty = entry_of(i, position)
+                exit_exec = execution_price(position, float(close[x]), on_entry=False)
+                pnl, roe = realized_roe(position, entry_exec, exit_exec, qty, equity_used)
+                if reason == kernels.LEVEL:
+                    remark = "LV LONG(K>=OB)" if position == "LONG" else "LV SHORT(K<=OS)"
+                else:
+                    remark = f"{'TP' if reason == kernels.TP else 'SL'} {position}"
+                logs.append([utc_str(ts_arr[x]), symbol, tf, fast, slow, st_p, st_k, st_d_dummy, os_level, ob_level,
+                             side_mode, "CLOSE", remark, entry_exec, exit_exec, pnl, roe])
+                k = int(np.searchsorted(cands, x, side="right"))
+            out[(tp, sl)] = pd.DataFrame(logs, columns=cols)
+    return out
 
 # ================= 실행 =================
+def evaluate(symbol, tf, fast, slow, st_p, st_k, st_d, os_level, ob_level, side_mode,
+             tps, sls, span: float = 1.0) -> Dict[Tuple[float, float], pd.DataFrame]:
+    """스윕 작업 하나 = EMA/스토캐스틱 조합 하나의 TP×SL 격자 거래 로그 (워커에서 실행, 저장은 부모가 결과 저장소에)"""
+    return backtest_grid(symbol=symbol, tf=tf, fast=fast, slow=slow,
+                         st_p=st_p, st_k=st_k, st_d_dummy=st_d,
+                         os_level=os_level, ob_level=ob_level, side_mode=side_mode,
+                         tps=list(tps), sls=list(sls), span=span)
+
+def task_label(t) -> str:
+    return f"{t['symbol']}_{t['tf']}_EMA{t['fast']}-{t['slow']}_K{t['st_p']}-{t['st_k']}-{t['st_d']}_OS{t['os_level']}_OB{t['ob_level']}_{t['side_mode']}"
+
 if __name__ == "__main__":
     os.makedirs(OUT_DIR, exist_ok=True)
 
-    for s in SYMBOLS:
-        for tf in TIMEFRAMES:
-            for fast in EMA_FAST_ARR:
-                for slow in EMA_SLOW_ARR:
-                    if fast >= slow:  # fast는 slow보다 작아야
-                        continue
-                    for st_p in STOCH_PERIODS:
-                        for st_k in STOCH_K_SMOOTH_ARR:
-                            for st_d in STOCH_D_SMOOTH_ARR:  # D는 미사용, 파일명 호환용으로만 순회
-                                for os_lv in STOCH_OS_LEVELS:
-                                    for ob_lv in STOCH_OB_LEVELS:
-                                        for side_mode in SIDES:
-                                            for tp in TP_ROE_ARR:
-                                                for sl in SL_ROE_ARR:
-                                                    try:
-                                                        df = backtest(
-                                                            symbol=s, tf=tf,
-                                                            fast=fast, slow=slow,
-                                                            st_p=st_p, st_k=st_k, st_d_dummy=st_d,
-                                                            os_level=os_lv, ob_level=ob_lv,
-                                                            side_mode=side_mode,
-                                                            tp_roe=tp, sl_roe=sl
-                                                        )
-                                                    except SystemExit as e:
-                                                        print(f"[SKIP] {s}_{tf}_EMA{fast}-{slow}_K{st_p}-{st_k}-{st_d}_OS{os_lv}_OB{ob_lv}_{side_mode}_TP{tp}_SL{sl}: {e}")
-                                                        continue
-                                                    except Exception as e:
-                                                        print(f"[ERR ] {s}_{tf}_EMA{fast}-{slow}_K{st_p}-{st_k}-{st_d}_OS{os_lv}_OB{ob_lv}_{side_mode}_TP{tp}_SL{sl}: {e}")
-                                                        continue
-
-                                                    fname = f"{s}_{tf}_K80_to_EMAdead_K20_to_EMAgolden_EMA{fast}-{slow}_K{st_p}-{st_k}-{st_d}_OS{os_lv}_OB{ob_lv}_{side_mode}_TP{tp}_SL{sl}.csv"
-
-                                                    fpath = os.path.join(OUT_DIR, fname)
-                                                    df.to_csv(fpath, index=False, encoding="utf-8-sig")
-                                                    print(f"✅ 저장: {fpath}")
+    # TP×SL 는 작업 안에서 한 번에 (backtest_grid), 나머지 조합은 프로세스 풀로
+    # st_d 는 결과에 영향 없음 → 첫 값으로만 실행 (파일명 호환용)
+    tasks = plan({"symbol": SYMBOLS, "tf": TIMEFRAMES, "fast": EMA_FAST_ARR, "slow": EMA_SLOW_ARR,
+                  "st_p": STOCH_PERIODS, "st_k": STOCH_K_SMOOTH_ARR, "st_d": STOCH_D_SMOOTH_ARR,
+                  "os_level": STOCH_OS_LEVELS, "ob_level": STOCH_OB_LEVELS, "side_mode": SIDES,
+                  "tps": [tuple(TP_ROE_ARR)], "sls": [tuple(SL_ROE_ARR)]},
+                 valid=lambda t: t["fast"] < t["slow"],   # fast는 slow보다 작아야
+                 same={"st_d": unused}, name="EMA_stochastic")
+    start_ms = parse_date(START); end_ms = parse_date(END)
+    candles = [(s, tf, start_ms, end_ms, MAX_CANDLES) for s in SYMBOLS for tf in TIMEFRAMES]
+    if SEARCH:   # 전체 격자 대신 표본 + successive halving → 상위 조합만 아래에서 결과 저장소에
+        tasks = [t for t, _ in search(evaluate, tasks, partial(trade_score, METRIC), method=SEARCH,
+                                      workers=WORKERS, store=STORE, candles=candles, label=task_label)]
+    run_sweep(evaluate, tasks, workers=WORKERS, store=STORE, candles=candles,
+              manifest=os.path.join(OUT_DIR, MANIFEST), results=os.path.join(OUT_DIR, RESULTS),
+              settings=settings(globals()), label=task_label,
+              on_result=lambda t, r: print(f"✅ 저장: {task_label(t)} TP×SL {len(r['combo_ids'])}칸, 거래 {r['trades']}건"))
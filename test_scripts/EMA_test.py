@@ -3,10 +3,19 @@
 import os, time
 from datetime import datetime, timezone
 from typing import Optional, List, Tuple
+from functools import partial
 
 import numpy as np
 import pandas as pd
-from pybit.unified_trading import HTTP
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from candle_store import CandleStore
+from backtest_core import columns, crosses, utc_str, trade_score
+from indicator_cache import CACHE   # 같은 캔들/파라미터 지표는 한 번만 계산
+from mock_bybit import make_session   # BYBIT_MOCK=1 이면 오프라인 대역
+from sweep import plan, run_sweep, search, settings, MANIFEST   # 조합별 병렬 실행 (코어당 워커 하나)
+from results_store import RESULTS   # 전체 거래 로그를 SQLite 파일 하나에 (조합별 CSV 대신)
 
 # ================= 사용자 설정 =================
 OUT_DIR = r"d:\Projects\AutoCoinAI\tests" #왜 상대경로가 안 돼 ㅠ
@@ -22,10 +31,13 @@ LEVERAGE       = 5
 START          = "2025-01-01"
 END            = None
 MAX_CANDLES    = 20000
-SLEEP_PER_REQ  = 0.12
+WORKERS        = None   # 스윕 프로세스 수 (None = 코어 수, 1 = 직렬)
+SEARCH         = None   # None = 전체 격자, "lhs" / "random" = 표본 + successive halving → 상위 조합만 저장
+METRIC         = "total_roe"   # SEARCH 목표: total_roe | win_rate | worst_trade
 
 # ================= Bybit HTTP =================
-session = HTTP()
+session = make_session()
+STORE = CandleStore(session=session)
 
 def parse_date(s: Optional[str]) -> Optional[int]:
     if not s: return None
@@ -37,68 +49,24 @@ def parse_date(s: Optional[str]) -> Optional[int]:
         dt = dt.replace(tzinfo=timezone.utc)
     return int(dt.timestamp()*1000)
 
-def bybit_interval(tf: str) -> str:
-    tf = str(tf).upper()
-    mapping = {"1":"1","3":"3","5":"5","15":"15","30":"30","60":"60","120":"120","240":"240","360":"360","720":"720","D":"D","W":"W","M":"M"}
-    if tf not in mapping: raise ValueError(f"unsupported tf: {tf}")
-    return mapping[tf]
-
-def fetch_ohlcv(symbol: str, tf: str, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int]) -> pd.DataFrame:
-    interval = bybit_interval(tf)
-    if start_ms is None: start_ms = parse_date("2018-01-01")
-    if end_ms is None:   end_ms   = int(datetime.now(tz=timezone.utc).timestamp()*1000)
-
-    rows: List[Tuple[int,float,float,float,float,float]] = []
-    hard_cap = cap if cap is not None else 10**12
-    cur_end = end_ms
-
-    while len(rows) < hard_cap and cur_end > start_ms:
-        req_limit = int(min(1000, hard_cap - len(rows)))
-        resp = session.get_kline(category="linear", symbol=symbol, interval=interval, end=cur_end, limit=req_limit)
-        if resp.get("retCode") != 0:
-            raise RuntimeError(resp.get("retMsg", "bybit error"))
-        lst = resp.get("result", {}).get("list", [])
-        if not lst: break
-
-        for it in lst:
-            ts = int(it[0])
-            if ts < start_ms: continue
-            o = float(it[1]); h = float(it[2]); l = float(it[3]); c = float(it[4]); v = float(it[5])
-            rows.append((ts,o,h,l,c,v))
-
-        min_ts = min(int(x[0]) for x in lst)
-        cur_end = min_ts - 1
-        if len(lst) < req_limit: break
-        time.sleep(SLEEP_PER_REQ)
-
-    if not rows:
-        return pd.DataFrame(columns=["ts","open","high","low","close","volume"])
-
-    df = pd.DataFrame(rows, columns=["ts","open","high","low","close","volume"]).drop_duplicates("ts")
-    df.sort_values("ts", inplace=True)
-    if cap is not None:
-        df = df.tail(int(cap))
-    df.reset_index(drop=True, inplace=True)
-    return df
+def fetch_ohlcv(symbol: str, tf: str, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int],
+                span: float = 1.0) -> pd.DataFrame:
+    # 로컬 캔들 저장소 경유 — 저장 안 된 구간만 다운로드 (span < 1: 최근 그 비율만, search 용)
+    return STORE.get(symbol, tf, start_ms, end_ms, cap, span=span)
 
 # ================= 지표 =================
 def ema(series: pd.Series, period: int) -> pd.Series:
-    return series.ewm(span=period, adjust=False).mean()
+    return pd.Series(CACHE.ema(series, [period])[0], index=series.index)
 
 def compute_rsi(close: pd.Series, period: int) -> pd.Series:
-    delta = close.diff()
-    up = delta.clip(lower=0)
-    down = (-delta).clip(lower=0)
-    roll_up = up.ewm(alpha=1/period, adjust=False).mean()
-    roll_down = down.ewm(alpha=1/period, adjust=False).mean()
-    rs = roll_up / (roll_down + 1e-12)
-    return 100 - (100/(1+rs))
+    return pd.Series(CACHE.rsi(close, [period])[0], index=close.index)
 
 # ================= 시뮬 =================
-def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: float) -> pd.DataFrame:
+def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: float,
+             span: float = 1.0) -> pd.DataFrame:
     assert fast < slow
     start_ms = parse_date(START); end_ms = parse_date(END)
-    ohlc = fetch_ohlcv(symbol, tf, start_ms, end_ms, MAX_CANDLES)
+    ohlc = fetch_ohlcv(symbol, tf, start_ms, end_ms, MAX_CANDLES, span)
     if ohlc.empty:
         raise SystemExit(f"[{symbol}@{tf}] no data")
 
@@ -106,10 +74,9 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: f
     ohlc["ema_slow"] = ema(ohlc["close"], slow)
     ohlc["rsi"]      = compute_rsi(ohlc["close"], rsi_p)
 
-    fast_gt_prev = ohlc["ema_fast"] > ohlc["ema_slow"]
-    fast_gt_prev_shift = fast_gt_prev.shift(1).fillna(False) # 여기 경고떠도문제없
-    cross_up = (~fast_gt_prev_shift) & (fast_gt_prev)
-    cross_dn = (fast_gt_prev_shift) & (~fast_gt_prev)
+    # 컬럼은 한 번만 배열로 꺼냄 (루프 안에서 .loc/.iloc 안 씀)
+    ts_arr, close, rsi_arr, ef, es = columns(ohlc, "ts", "close", "rsi", "ema_fast", "ema_slow")
+    cross_up, cross_dn = crosses(ef, es)
 
     position=None; entry_px=None; qty=None; peak_rsi=None; trough_rsi=None
     notional=EQUITY*LEVERAGE
@@ -118,18 +85,16 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: f
           "포지션","비고","entry_price","exit_price","미실현PnL","ROE"]
     log_rows=[]
 
-    for i in range(len(ohlc)):
-        ts = int(ohlc.loc[i,"ts"])//1000
-        dt = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        px = float(ohlc.loc[i,"close"])
-        rv = float(ohlc.loc[i,"rsi"]) if not np.isnan(ohlc.loc[i,"rsi"]) else None
+    for i in range(len(close)):
+        px = float(close[i])
+        rv = float(rsi_arr[i]) if not np.isnan(rsi_arr[i]) else None
 
         if position is None and rv is not None:
-            if cross_up.iloc[i]:
+            if cross_up[i]:
                 position="LONG"; entry_px=px; qty=notional/entry_px
                 peak_rsi=rv; trough_rsi=None
                 continue
-            elif cross_dn.iloc[i]:
+            elif cross_dn[i]:
                 position="SHORT"; entry_px=px; qty=notional/entry_px
                 trough_rsi=rv; peak_rsi=None
                 continue
@@ -139,13 +104,13 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: f
                 peak_rsi = rv if peak_rsi is None else max(peak_rsi, rv)
                 if peak_rsi-rv >= doorstep:  # RSI 되돌림 청산
                     pnl=(px-entry_px)*qty; roe=pnl/(notional/LEVERAGE)
-                    log_rows.append([dt,symbol,tf,fast,slow,rsi_p,doorstep,
+                    log_rows.append([utc_str(ts_arr[i]),symbol,tf,fast,slow,rsi_p,doorstep,
                                      "CLOSE","close LONG",entry_px,px,pnl,roe])
                     position=None; entry_px=None; qty=None; peak_rsi=None
                     continue
-                if cross_dn.iloc[i]:  # 반대 교차 청산
+                if cross_dn[i]:  # 반대 교차 청산
                     pnl=(px-entry_px)*qty; roe=pnl/(notional/LEVERAGE)
-                    log_rows.append([dt,symbol,tf,fast,slow,rsi_p,doorstep,
+                    log_rows.append([utc_str(ts_arr[i]),symbol,tf,fast,slow,rsi_p,doorstep,
                                      "CLOSE","stop LONG",entry_px,px,pnl,roe])
                     position="SHORT"; entry_px=px; qty=notional/entry_px
                     trough_rsi=rv; peak_rsi=None
@@ -155,13 +120,13 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: f
                 trough_rsi = rv if trough_rsi is None else min(trough_rsi, rv)
                 if rv-trough_rsi >= doorstep:  # RSI 되돌림 청산
                     pnl=(entry_px-px)*qty; roe=pnl/(notional/LEVERAGE)
-                    log_rows.append([dt,symbol,tf,fast,slow,rsi_p,doorstep,
+                    log_rows.append([utc_str(ts_arr[i]),symbol,tf,fast,slow,rsi_p,doorstep,
                                      "CLOSE","close SHORT",entry_px,px,pnl,roe])
                     position=None; entry_px=None; qty=None; trough_rsi=None
                     continue
-                if cross_up.iloc[i]:  # 반대 교차 청산
+                if cross_up[i]:  # 반대 교차 청산
                     pnl=(entry_px-px)*qty; roe=pnl/(notional/LEVERAGE)
-                    log_rows.append([dt,symbol,tf,fast,slow,rsi_p,doorstep,
+                    log_rows.append([utc_str(ts_arr[i]),symbol,tf,fast,slow,rsi_p,doorstep,
                                      "CLOSE","stop SHORT",entry_px,px,pnl,roe])
                     position="LONG"; entry_px=px; qty=notional/entry_px
                     peak_rsi=rv; trough_rsi=None
@@ -171,17 +136,19 @@ def backtest(symbol: str, tf: str, fast: int, slow: int, rsi_p: int, doorstep: f
     return trades_df
 
 # ================= 실행 =================
+def evaluate(symbol, tf, fast, slow, rsi_p, ds, span: float = 1.0) -> pd.DataFrame:
+    """스윕 작업 하나의 거래 로그 (워커에서 실행, 저장은 부모가 결과 저장소에)"""
+    return backtest(symbol,tf,fast,slow,rsi_p,ds,span)
+
 if __name__=="__main__":
     os.makedirs(OUT_DIR, exist_ok=True)
-    for s in SYMBOLS:
-        for tf in TIMEFRAMES:
-            for fast in EMA_FAST_ARR:
-                for slow in EMA_SLOW_ARR:
-                    if fast>=slow or slow-fast>=EMA_PASS_GAP: continue
-                    for rsi_p in RSI_PERIODS:
-                        for ds in DOORSTEP_ARR:
-                            trades_df=backtest(s,tf,fast,slow,rsi_p,ds)
-                            fname=f"{s}_{tf}_RSI{rsi_p}_EMA{fast}-{slow}_DS{ds}.csv"
-                            trades_path=os.path.join(OUT_DIR,fname)
-                            trades_df.to_csv(trades_path,index=False,encoding="utf-8-sig")
-                            print(f"✅ 저장: {trades_path}")
+    tasks=plan({"symbol":SYMBOLS,"tf":TIMEFRAMES,"fast":EMA_FAST_ARR,"slow":EMA_SLOW_ARR,"rsi_p":RSI_PERIODS,"ds":DOORSTEP_ARR},
+               valid=lambda t: t["fast"]<t["slow"] and t["slow"]-t["fast"]<EMA_PASS_GAP,name="EMA_test")
+    start_ms=parse_date(START); end_ms=parse_date(END)
+    candles=[(s,tf,start_ms,end_ms,MAX_CANDLES) for s in SYMBOLS for tf in TIMEFRAMES]
+    if SEARCH:   # 전체 격자 대신 표본 + successive halving → 상위 조합만 아래에서 결과 저장소에
+        tasks=[t for t,_ in search(evaluate,tasks,partial(trade_score,METRIC),method=SEARCH,
+                                   workers=WORKERS,store=STORE,candles=candles)]
+    run_sweep(evaluate,tasks,workers=WORKERS,store=STORE,candles=candles,
+              manifest=os.path.join(OUT_DIR,MANIFEST),results=os.path.join(OUT_DIR,RESULTS),
+              settings=settings(globals()),on_result=lambda t,r: print(f"✅ 저장: 거래 {r['trades']}건"))
@@ -2,10 +2,20 @@ import os
 import time
 from datetime import datetime, timezone
 from typing import Optional
+from functools import partial
 
 import pandas as pd
 import numpy as np
-from pybit.unified_trading import HTTP
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from candle_store import CandleStore
+from backtest_core import columns, utc_str, trade_score
+import kernels   # 전략 상태머신 (numba 있으면 컴파일)
+from indicator_cache import CACHE   # 같은 캔들/파라미터 지표는 한 번만 계산
+from mock_bybit import make_session   # BYBIT_MOCK=1 이면 오프라인 대역
+from sweep import plan, only_if, run_sweep, search, settings, MANIFEST   # 조합별 병렬 실행 (코어당 워커 하나)
+from results_store import RESULTS   # 전체 거래 로그를 SQLite 파일 하나에 (조합별 CSV 대신)
 
 # ====== 사용자 설정 변수 ======
 SYMBOL = ["PUMPFUNUSDT","FARTCOINUSDT"]
@@ -18,6 +28,9 @@ END = "2025-11-12"
 OUT_DIR = "test"
 
 MAX_CANDLES = 20000 
+WORKERS = None   # 스윕 프로세스 수 (None = 코어 수, 1 = 직렬)
+SEARCH  = None   # None = 전체 격자, "lhs" / "random" = 표본 + successive halving → 상위 조합만 저장
+METRIC  = "total_roe"   # SEARCH 목표: total_roe | win_rate | worst_trade
 
 # RSI 트리거 값
 OPEN_SHORT_RSI  = 72.0   # 숏 진입 기준 (롱 반대 과상태)
@@ -34,7 +47,8 @@ SL_ROE_ARR   = [10,15]
 TP_MODE_ARR  = [1, 2]   # 1 = DOORSTEP + TP / SL, 2 = TP/SL만 의존
 # ==========================
 
-session = HTTP()
+session = make_session()
+STORE = CandleStore(session=session)
 
 # ---------- 유틸 ----------
 def _as_list(x):
@@ -51,190 +65,61 @@ def parse_date(s: Optional[str]) -> Optional[int]:
         dt = dt.replace(tzinfo=timezone.utc)
     return int(dt.timestamp() * 1000)
 
-def bybit_interval(tf: str) -> str:
-    tf = str(tf).upper()
-    mapping = {
-        "1":"1","3":"3","5":"5","15":"15","30":"30",
-        "60":"60","120":"120","240":"240","360":"360","720":"720",
-        "D":"D","W":"W","M":"M"
-    }
-    if tf not in mapping:
-        raise ValueError(f"지원하지 않는 분봉/주기: {tf}")
-    return mapping[tf]
-
-def fetch_ohlcv_10000(symbol: str, tf: str, start_ms=None, end_ms=None, max_candles: int = MAX_CANDLES) -> pd.DataFrame:
-    interval = bybit_interval(tf)
-    if end_ms is None:
-        end_ms = int(datetime.now(tz=timezone.utc).timestamp()*1000)
-
-    rows = []
-    while len(rows) < max_candles:
-        resp = None
-        last_err = None
-        for attempt in range(3):
-            try:
-                r = session.get_kline(
-                    category="linear",
-                    symbol=symbol,
-                    interval=interval,
-                    end=end_ms,
-                    limit=1000
-                )
-                if r.get("retCode") == 0:
-                    resp = r
-                    break
-                else:
-                    last_err = RuntimeError(f"retCode {r.get('retCode')} {r.get('retMsg')}")
-            except Exception as e:
-                last_err = e
-            time.sleep(0.4)
-
-        if resp is None:
-            raise last_err if last_err else RuntimeError("Unknown API error")
-
-        lst = resp["result"]["list"]
-        if not lst:
-            break
-        for it in lst:
-            ts = int(it[0]); o,h,l,c,v = map(float, it[1:6])
-            rows.append((ts,o,h,l,c,v))
-        end_ms = min(int(x[0]) for x in lst) - 1
-        if len(lst) < 1000:
-            break
-        time.sleep(0.12)
-
-    df = pd.DataFrame(rows, columns=["ts","open","high","low","close","volume"]).drop_duplicates("ts")
-    df.sort_values("ts", inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    return df.head(max_candles)
+def fetch_ohlcv_10000(symbol: str, tf: str, start_ms=None, end_ms=None, max_candles: int = MAX_CANDLES,
+                      span: float = 1.0) -> pd.DataFrame:
+    # 시작일 무시하고 end 기준 최근 max_candles 개 (로컬 캔들 저장소 경유, span < 1: 그중 최근 그 비율만)
+    return STORE.get(symbol, tf, None, end_ms, max_candles, span=span)
 
 def compute_rsi(close: pd.Series, period: int) -> pd.Series:
-    delta = close.diff()
-    up = delta.clip(lower=0)
-    down = (-delta).clip(lower=0)
-    roll_up = up.ewm(alpha=1/period, adjust=False).mean()
-    roll_down = down.ewm(alpha=1/period, adjust=False).mean()
-    rs = roll_up / (roll_down + 1e-12)
-    return 100 - (100/(1+rs))
+    return pd.Series(CACHE.rsi(close, [period])[0], index=close.index)
 
 # ---------- 시뮬 ----------
-def run(symbol: str, tf: str, rsi_period: int, leverage: float, equity: float,
-        start: Optional[str], end: Optional[str], out_dir: str,
-        tp_roe: float, sl_roe: float, tp_mode: int) -> str:
-    
+def simulate(symbol: str, tf: str, rsi_period: int, leverage: float, equity: float,
+             start: Optional[str], end: Optional[str],
+             tp_roe: float, sl_roe: float, tp_mode: int, span: float = 1.0) -> pd.DataFrame:
+    """청산된 거래 로그 (저장은 run)"""
     start_ms = parse_date(start)
     end_ms   = parse_date(end)
 
-    ohlc = fetch_ohlcv_10000(symbol, tf, start_ms, end_ms)
+    ohlc = fetch_ohlcv_10000(symbol, tf, start_ms, end_ms, span=span)
     if ohlc.empty:
         raise SystemExit("❌ 시세 데이터가 비었습니다. 심볼/기간/분봉을 확인하세요.")
 
     ohlc["rsi"] = compute_rsi(ohlc["close"], rsi_period)
+    # 컬럼은 한 번만 배열로 꺼냄 (루프 안에서 .loc 안 씀)
+    ts_arr, close, rsi = columns(ohlc, "ts", "close", "rsi")
 
     cols = ["datetime","symbol","timeframe","close","rsi","포지션","비고","entry_price","미실현PnL","ROE"]
     log = []
 
-    position    = None
-    entry_px    = None
-    qty         = None
-    init_margin = None
-
-    for i in range(len(ohlc)):
-        ts = int(ohlc.loc[i, "ts"]) // 1000
-        dt = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        px = float(ohlc.loc[i, "close"])
-        rv = float(ohlc.loc[i, "rsi"]) if not np.isnan(ohlc.loc[i, "rsi"]) else None
-
-        remark      = ""
-        pos_name    = position if position else "FLAT"
-        entry_price = entry_px if entry_px is not None else np.nan
-        unreal      = 0.0
-        roe         = 0.0
-
-        # === 진입 ===
-        if position is None and rv is not None:
-            if rv >= OPEN_SHORT_RSI:
-                position = "SHORT"; entry_px = px
-                notional    = equity * leverage
-                qty         = notional / entry_px
-                init_margin = notional / leverage
-                remark      = "SHORT 진입"
-            elif rv <= OPEN_LONG_RSI:
-                position = "LONG"; entry_px = px
-                notional    = equity * leverage
-                qty         = notional / entry_px
-                init_margin = notional / leverage
-                remark      = "LONG 진입"
-
-        # === 보유 중 ===
-        elif position is not None and rv is not None:
-
-            if position == "LONG":
-                unreal = (px - entry_px) * qty
-                roe    = (unreal / init_margin) * 100
-
-                if tp_mode == 1:
-                    # 1) SL : 항상 ROE 기준
-                    if roe <= -sl_roe:
-                        remark = f"close LONG (SL {roe:.1f}%)"; position = None
-
-                    # 2) TP : 조건 분기
-                    elif roe >= tp_roe:
-                        # 반대 과상태: 과매수 영역 (롱의 반대)
-                        if rv >= OPEN_SHORT_RSI:
-                            # DOORSTEP 밴드 안에 들어왔을 때만 청산
-                            if (OPEN_SHORT_RSI - DOORSTEP) <= rv <= (OPEN_SHORT_RSI + DOORSTEP):
-                                remark = f"close LONG (DOORSTEP TP, ROE {roe:.1f}%)"; position = None
-                            # DOORSTEP 바깥이면 계속 홀딩
-                        else:
-                            # 반대 과상태가 아니면 TP에만 의존 → TP 즉시 청산
-                            remark = f"close LONG (TP {roe:.1f}%)"; position = None
-
-                elif tp_mode == 2:
-                    if roe >= tp_roe:
-                        remark = f"close LONG (TP {roe:.1f}%)"; position = None
-                    elif roe <= -sl_roe:
-                        remark = f"close LONG (SL {roe:.1f}%)"; position = None
-
-
-            elif position == "SHORT":
-                unreal = (entry_px - px) * qty
-                roe    = (unreal / init_margin) * 100
-
-                if tp_mode == 1:
-                    # 1) SL : 항상 ROE 기준
-                    if roe <= -sl_roe:
-                        remark = f"close SHORT (SL {roe:.1f}%)"; position = None
-
-                    # 2) TP : 조건 분기
-                    elif roe >= tp_roe:
-                        # 반대 과상태: 과매도 영역 (숏의 반대)
-                        if rv <= OPEN_LONG_RSI:
-                            if (OPEN_LONG_RSI - DOORSTEP) <= rv <= (OPEN_LONG_RSI + DOORSTEP):
-                                remark = f"close SHORT (DOORSTEP TP, ROE {roe:.1f}%)"; position = None
-                            # DOORSTEP 바깥 → 홀딩
-                        else:
-                            # 반대 과상태 아니면 TP에만 의존
-                            remark = f"close SHORT (TP {roe:.1f}%)"; position = None
-
-                elif tp_mode == 2:
-                    if roe >= tp_roe:
-                        remark = f"close SHORT (TP {roe:.1f}%)"; position = None
-                    elif roe <= -sl_roe:
-                        remark = f"close SHORT (SL {roe:.1f}%)"; position = None
-
-            # === 청산된 경우만 로그 기록 ===
-            if remark and "close" in remark:
-                log.append([dt, symbol, tf, px, rv, "CLOSE", remark, entry_px, unreal, roe])
-                entry_px = None
-                qty = None
-                init_margin = None
-                continue
+    # 상태머신은 커널(numba 있으면 컴파일)에서, 로그는 청산된 거래만 여기서 만듦
+    trades = kernels.rsi_doorstep(close, rsi, equity, leverage, OPEN_SHORT_RSI, OPEN_LONG_RSI,
+                                  DOORSTEP, tp_roe, sl_roe, tp_mode)
+    notional    = equity * leverage
+    init_margin = notional / leverage
+    for e, x, side, reason, _ in trades.rows():
+        if reason == kernels.OPEN:
+            continue
+        name     = "LONG" if side == kernels.LONG else "SHORT"
+        entry_px = float(close[e])
+        px       = float(close[x])
+        qty      = notional / entry_px
+        unreal   = (px - entry_px) * qty if side == kernels.LONG else (entry_px - px) * qty
+        roe      = (unreal / init_margin) * 100
+        if reason == kernels.DOORSTEP_TP:
+            remark = f"close {name} (DOORSTEP TP, ROE {roe:.1f}%)"
+        else:
+            remark = f"close {name} ({'TP' if reason == kernels.TP else 'SL'} {roe:.1f}%)"
+        log.append([utc_str(ts_arr[x]), symbol, tf, px, float(rsi[x]), "CLOSE", remark, entry_px, unreal, roe])
 
     # === 청산된 데이터만 저장 ===
     df = pd.DataFrame(log, columns=cols)
-    df = df[df["포지션"] == "CLOSE"].reset_index(drop=True)
+    return df[df["포지션"] == "CLOSE"].reset_index(drop=True)
 
+def run(symbol: str, tf: str, rsi_period: int, leverage: float, equity: float,
+        start: Optional[str], end: Optional[str], out_dir: str,
+        tp_roe: float, sl_roe: float, tp_mode: int) -> str:
+    df = simulate(symbol, tf, rsi_period, leverage, equity, start, end, tp_roe, sl_roe, tp_mode)
     os.makedirs(out_dir, exist_ok=True)
     fname = f"{symbol}_{tf}_{rsi_period}_TP{tp_roe}_SL{sl_roe}_MODE{tp_mode}.csv"
     path = os.path.join(out_dir, fname)
@@ -242,12 +127,23 @@ def run(symbol: str, tf: str, rsi_period: int, leverage: float, equity: float,
     return path
 
 # ---------- 실행 ----------
+def evaluate(symbol, tf, rsi_period, tp_roe, sl_roe, tp_mode, span: float = 1.0) -> pd.DataFrame:
+    """스윕 작업 하나의 거래 로그 (워커에서 실행, 저장은 부모가 결과 저장소에)"""
+    return simulate(symbol, tf, rsi_period, LEVERAGE, EQUITY, START, END, tp_roe, sl_roe, tp_mode, span)
+
 if __name__ == "__main__":
-    for s in _as_list(SYMBOL):
-        for tf in _as_list(TIMEFRAME):
-            for rp in _as_list(RSI_PERIOD):
-                for tp in TP_ROE_ARR:
-                    for sl in SL_ROE_ARR:
-                        for mode in TP_MODE_ARR:
-                            csv_path = run(s, tf, rp, LEVERAGE, EQUITY, START, END, OUT_DIR, tp, sl, mode)
-                            print(f"✅ 저장 완료: {csv_path}")
+    # TP/SL 은 tp_mode 1/2 에서만 사용 (그 외 모드는 청산 없음)
+    has_exit = lambda t: t["tp_mode"] in (1, 2)
+    tasks = plan({"symbol": _as_list(SYMBOL), "tf": _as_list(TIMEFRAME), "rsi_period": _as_list(RSI_PERIOD),
+                  "tp_roe": TP_ROE_ARR, "sl_roe": SL_ROE_ARR, "tp_mode": TP_MODE_ARR},
+                 same={"tp_roe": only_if("tp_roe", has_exit), "sl_roe": only_if("sl_roe", has_exit)},
+                 name="RSItest")
+    end_ms = parse_date(END)
+    # fetch_ohlcv_10000 은 시작일 없이 end 기준 최근 MAX_CANDLES 개
+    candles = [(s, tf, None, end_ms, MAX_CANDLES) for s in _as_list(SYMBOL) for tf in _as_list(TIMEFRAME)]
+    if SEARCH:   # 전체 격자 대신 표본 + successive halving → 상위 조합만 아래에서 결과 저장소에
+        tasks = [t for t, _ in search(evaluate, tasks, partial(trade_score, METRIC), method=SEARCH,
+                                      workers=WORKERS, store=STORE, candles=candles)]
+    run_sweep(evaluate, tasks, workers=WORKERS, store=STORE, candles=candles,
+              manifest=os.path.join(OUT_DIR, MANIFEST), results=os.path.join(OUT_DIR, RESULTS),
+              settings=settings(globals()), on_result=lambda t, r: print(f"✅ 저장 완료: 거래 {r['trades']}건"))
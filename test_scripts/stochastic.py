@@ -1,9 +1,19 @@
 import os, time
 from datetime import datetime, timezone
 from typing import Optional, List
+from functools import partial
 import pandas as pd
 import numpy as np
-from pybit.unified_trading import HTTP
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from candle_store import CandleStore
+from backtest_core import columns, utc_str, trade_score
+import kernels   # 전략 상태머신 (numba 있으면 컴파일)
+from indicator_cache import CACHE, fingerprint   # 같은 캔들/파라미터 지표는 한 번만 계산
+from mock_bybit import make_session   # BYBIT_MOCK=1 이면 오프라인 대역
+from sweep import plan, only_if, run_sweep, search, settings, MANIFEST   # 조합별 병렬 실행 (코어당 워커 하나)
+from results_store import RESULTS   # 전체 거래 로그를 SQLite 파일 하나에 (조합별 CSV 대신)
 
 # ================= 사용자 설정 =================
 OUT_DIR        = r"d:\Projects\AutoCoinAI\test"
@@ -31,10 +41,13 @@ LEVERAGE       = 10
 START          = "2025-01-01"
 END            = None
 MAX_CANDLES    = 30000
-SLEEP_PER_REQ  = 0.07
 MAX_RETRY      = 3
+WORKERS        = None   # 스윕 프로세스 수 (None = 코어 수, 1 = 직렬)
+SEARCH         = None   # None = 전체 격자, "lhs" / "random" = 표본 + successive halving → 상위 조합만 저장
+METRIC         = "total_roe"   # SEARCH 목표: total_roe | win_rate | worst_trade
 
-session = HTTP()
+session = make_session()
+STORE = CandleStore(session=session, max_retry=MAX_RETRY)
 
 # ================= 도우미 =================
 def parse_date(s: Optional[str]) -> Optional[int]:
@@ -47,142 +60,53 @@ def parse_date(s: Optional[str]) -> Optional[int]:
         dt = dt.replace(tzinfo=timezone.utc)
     return int(dt.timestamp() * 1000)
 
-def fetch_ohlcv(symbol: str, tf: str, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int]) -> pd.DataFrame:
-    interval = tf
-    if start_ms is None: start_ms = parse_date("2018-01-01")
-    if end_ms is None: end_ms = int(datetime.now(tz=timezone.utc).timestamp() * 1000)
-    rows = []
-    cur_end = end_ms
-
-    while len(rows) < cap and cur_end > start_ms:
-        try:
-            resp = session.get_kline(category="linear", symbol=symbol, interval=interval, end=cur_end, limit=1000)
-        except Exception as e:
-            print("API Error", e)
-            time.sleep(1); continue
-
-        if resp.get("retCode") != 0:
-            print(f"❌ API Error {resp.get('retMsg')}"); break
-
-        result = resp.get("result", {})
-        lst = result.get("list", result.get("rows", []))
-        if not lst:
-            print(f"[WARN] No kline data for {symbol} {tf}"); break
-
-        for it in lst:
-            ts = int(it[0]) if isinstance(it, list) else int(it.get("start", it.get("startTime", 0)))
-            o = float(it[1]) if isinstance(it, list) else float(it.get("open", 0))
-            h = float(it[2]) if isinstance(it, list) else float(it.get("high", 0))
-            l = float(it[3]) if isinstance(it, list) else float(it.get("low", 0))
-            c = float(it[4]) if isinstance(it, list) else float(it.get("close", 0))
-            v = float(it[5]) if isinstance(it, list) else float(it.get("volume", 0))
-            rows.append((ts, o, h, l, c, v))
-
-        cur_end = min(r[0] for r in rows[-len(lst):]) - 1
-        if len(lst) < 1000: break
-        time.sleep(SLEEP_PER_REQ)
-
-    if not rows:
+def fetch_ohlcv(symbol: str, tf: str, start_ms: Optional[int], end_ms: Optional[int], cap: Optional[int],
+                span: float = 1.0) -> pd.DataFrame:
+    # 로컬 캔들 저장소 경유 — 저장 안 된 구간만 다운로드 (span < 1: 최근 그 비율만, search 용)
+    df = STORE.get(symbol, tf, start_ms, end_ms, cap, span=span)
+    if df.empty:
         print(f"[EMPTY] {symbol}@{tf}")
-        return pd.DataFrame(columns=["ts","open","high","low","close","volume"])
-
-    df = pd.DataFrame(rows, columns=["ts","open","high","low","close","volume"])
-    df.drop_duplicates("ts", inplace=True)
-    df.sort_values("ts", inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    return df.tail(cap)
+    return df
 
 def compute_stoch(df, period:int, k_smooth:int, d_smooth:int):
-    low_min = df["low"].rolling(period).min()
-    high_max = df["high"].rolling(period).max()
-    df["%K_raw"] = 100 * (df["close"] - low_min) / (high_max - low_min + 1e-9)
-    df["%K"] = df["%K_raw"].rolling(k_smooth).mean()
-    df["%D"] = df["%K"].rolling(d_smooth).mean()
+    hlc = (df["high"], df["low"], df["close"])
+    fp = fingerprint(*hlc)
+    df["%K_raw"] = CACHE.stoch_raw(*hlc, [period], fp=fp)[0]
+    df["%K"] = CACHE.stoch_k(*hlc, period, [k_smooth], fp=fp)[0]
+    df["%D"] = CACHE.stoch_d(*hlc, period, k_smooth, [d_smooth], fp=fp)[0]
     return df
 
 # ================= 백테스트 =================
 def backtest(symbol, tf, period, k_smooth, d_smooth, tp_roe, sl_roe, gap,
-             overbought, oversold, use_strict, k_only_ok, use_cross_stoploss):   
+             overbought, oversold, use_strict, k_only_ok, use_cross_stoploss, span: float = 1.0):
     start_ms = parse_date(START); end_ms = parse_date(END)
-    ohlc = fetch_ohlcv(symbol, tf, start_ms, end_ms, MAX_CANDLES)
+    ohlc = fetch_ohlcv(symbol, tf, start_ms, end_ms, MAX_CANDLES, span)
     if ohlc.empty: return pd.DataFrame()
 
     ohlc = compute_stoch(ohlc, period, k_smooth, d_smooth)
     ohlc.dropna(inplace=True)
     ohlc.reset_index(drop=True, inplace=True)
-    
-    position = None
-    entry_px = None
-    qty = None
+    # 컬럼은 한 번만 배열로 꺼냄 (루프 안에서 .loc 안 씀)
+    ts_arr, close, K, D = columns(ohlc, "ts", "close", "%K", "%D")
+
     notional = EQUITY * LEVERAGE
     eq_used = EQUITY
     logs = []
 
-    touched_upper = False
-    touched_lower = False
-
-    for i in range(2, len(ohlc)):
-        ts = int(ohlc.loc[i, "ts"]) // 1000
-        dt = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        k_prev, d_prev = ohlc.loc[i-1, "%K"], ohlc.loc[i-1, "%D"]
-        k_now,  d_now  = ohlc.loc[i, "%K"],  ohlc.loc[i, "%D"]
-        px = ohlc.loc[i, "close"]
-
-        # strict 조건일 때 상/하한 터치 체크
-        if use_strict:
-            if overbought and ((k_only_ok and k_now >= overbought) or (not k_only_ok and k_now >= overbought and d_now >= overbought)):
-                touched_upper = True
-            if oversold and ((k_only_ok and k_now <= oversold) or (not k_only_ok and k_now <= oversold and d_now <= oversold)):
-                touched_lower = True
-
-        # === 진입 ===
-        if position is None:
-            # 숏 진입
-            if (k_prev > d_prev) and (k_now < d_now) and (k_prev - d_prev >= gap):
-                cond_now = (k_now > overbought) and (d_now > overbought)
-                if use_strict:
-                    cond_now = (k_now > overbought) if k_only_ok else ((k_now > overbought) and (d_now > overbought))
-                if cond_now and ((not use_strict) or touched_upper):
-                    position = "SHORT"; entry_px = px; qty = notional / px
-                    touched_upper = False; continue
-
-            # 롱 진입
-            if (k_prev < d_prev) and (k_now > d_now) and (d_prev - k_prev >= gap):
-                cond_now = (k_now < oversold) and (d_now < oversold)
-                if use_strict:
-                    cond_now = (k_now < oversold) if k_only_ok else ((k_now < oversold) and (d_now < oversold))
-                if cond_now and ((not use_strict) or touched_lower):
-                    position = "LONG"; entry_px = px; qty = notional / px
-                    touched_lower = False; continue
-
-        # === 청산 ===
-        if position:
-            pnl = (px - entry_px) * qty if position == "LONG" else (entry_px - px) * qty
-            roe = (pnl / eq_used) * 100
-            hit_tp = (tp_roe > 0 and roe >= tp_roe)
-            hit_sl = (sl_roe > 0 and roe <= -sl_roe)
-
-            if hit_tp or hit_sl:
-                logs.append([dt, symbol, tf, period, gap, f"{position}→{'TP' if hit_tp else 'SL'}",
-                             entry_px, px, pnl, roe, k_now, d_now])
-                position = None; entry_px = None; qty = None; continue
-
-            # 반대 크로스 손절 옵션 적용
-            if use_cross_stoploss:
-                if position == "LONG" and (k_prev > d_prev) and (k_now < d_now) and (d_prev - k_prev >= gap):
-                    logs.append([dt, symbol, tf, period, gap, "LONG→CrossSL", entry_px, px, pnl, roe, k_now, d_now])
-                    position = None; entry_px = None; qty = None; continue
-                if position == "SHORT" and (k_prev < d_prev) and (k_now > d_now) and (k_prev - d_prev >= gap):
-                    logs.append([dt, symbol, tf, period, gap, "SHORT→CrossSL", entry_px, px, pnl, roe, k_now, d_now])
-                    position = None; entry_px = None; qty = None; continue
-
-            # 반대 교차 시 청산 (기본 EXIT)
-            if position == "LONG" and (k_prev > d_prev) and (k_now < d_now):
-                logs.append([dt, symbol, tf, period, gap, "LONG→EXIT", entry_px, px, pnl, roe, k_now, d_now])
-                position = None; entry_px = None; qty = None; continue
-            if position == "SHORT" and (k_prev < d_prev) and (k_now > d_now):
-                logs.append([dt, symbol, tf, period, gap, "SHORT→EXIT", entry_px, px, pnl, roe, k_now, d_now])
-                position = None; entry_px = None; qty = None; continue
+    # 상태머신(strict 터치/교차 진입/TP·SL/크로스 손절)은 커널에서, 로그는 청산된 거래만
+    trades = kernels.stoch_cross(close, K, D, notional, eq_used, tp_roe, sl_roe, gap,
+                                 overbought, oversold, use_strict, k_only_ok, use_cross_stoploss)
+    for e, x, side, reason, _ in trades.rows():
+        if reason == kernels.OPEN:
+            continue
+        position = "LONG" if side == kernels.LONG else "SHORT"
+        entry_px, px = close[e], close[x]
+        qty = notional / entry_px
+        pnl = (px - entry_px) * qty if side == kernels.LONG else (entry_px - px) * qty
+        roe = (pnl / eq_used) * 100
+        label = {kernels.TP: "TP", kernels.SL: "SL", kernels.CROSS_SL: "CrossSL", kernels.EXIT: "EXIT"}[reason]
+        logs.append([utc_str(ts_arr[x]), symbol, tf, period, gap, f"{position}→{label}",
+                     entry_px, px, pnl, roe, K[x], D[x]])
 
     return pd.DataFrame(logs, columns=[
         "datetime","symbol","timeframe","period","gap%","position",
@@ -190,27 +114,35 @@ def backtest(symbol, tf, period, k_smooth, d_smooth, tp_roe, sl_roe, gap,
     ])
 
 # ================= 실행 =================
+def task_label(t) -> str:
+    return (f"{t['symbol']}@{t['tf']} ST{t['period']} K{t['k_smooth']}D{t['d_smooth']} gap{t['gap']}% "
+            f"TP{t['tp_roe']} SL{t['sl_roe']} OB{t['overbought']} OS{t['oversold']} "
+            f"strict{t['use_strict']} Konly{t['k_only_ok']} CrossSL{t['use_cross_stoploss']}")
+
+def report(t, r) -> None:
+    """거래가 있는 조합만 출력"""
+    if r["trades"]:
+        print(f"✅ Saved: {task_label(t)} ({r['trades']} trades)")
+
 if __name__ == "__main__":
     os.makedirs(OUT_DIR, exist_ok=True)
     THRESH_PAIRS = list(zip(STO_OVERBOUGHT_ARR, STO_OVERSOLD_ARR))  # 인덱스 동일 조합만 실행
 
-    for s in SYMBOLS:
-        for tf in TIMEFRAMES:
-            for p in STOCH_PERIODS:
-                for ks in K_SMOOTH_ARR:
-                    for ds in D_SMOOTH_ARR:
-                        for tp in TP_ROE_ARR:
-                            for sl in SL_ROE_ARR:
-                                for gap in N_GAP_LIST:
-                                    for (overbought, oversold) in THRESH_PAIRS:
-                                        for use_strict in USE_STRICT_THRESH:
-                                            for k_only_ok in K_ONLY_OK:
-                                                for use_cross_sl in USE_CROSS_STOPLOSS_ARR:
-                                                    label = f"{s}@{tf} ST{p} K{ks}D{ds} gap{gap}% TP{tp} SL{sl} OB{overbought} OS{oversold} strict{use_strict} Konly{k_only_ok} CrossSL{use_cross_sl}"
-                                                    print(f"▶ {label}")
-                                                    df = backtest(s, tf, p, ks, ds, tp, sl, gap,
-                                                                  overbought, oversold, use_strict, k_only_ok, use_cross_sl)
-                                                    if df.empty: continue
-                                                    fname = f"{s}_{tf}_ST{p}_K{ks}D{ds}_gap{gap}_TP{tp}_SL{sl}_OB{overbought}_OS{oversold}_strict{use_strict}_Konly{k_only_ok}_CrossSL{use_cross_sl}.csv"
-                                                    df.to_csv(os.path.join(OUT_DIR, fname), index=False, encoding="utf-8-sig")
-                                                    print(f"✅ Saved: {fname}")
+    # K_ONLY_OK 는 strict 일 때만, TP/SL 은 0 이하면 전부 '미사용'으로 같은 결과
+    tasks = plan({"symbol": SYMBOLS, "tf": TIMEFRAMES, "period": STOCH_PERIODS, "k_smooth": K_SMOOTH_ARR,
+                  "d_smooth": D_SMOOTH_ARR, "tp_roe": TP_ROE_ARR, "sl_roe": SL_ROE_ARR, "gap": N_GAP_LIST,
+                  ("overbought", "oversold"): THRESH_PAIRS, "use_strict": USE_STRICT_THRESH,
+                  "k_only_ok": K_ONLY_OK, "use_cross_stoploss": USE_CROSS_STOPLOSS_ARR},
+                 same={"k_only_ok": only_if("k_only_ok", lambda t: t["use_strict"]),
+                       "tp_roe": lambda t: max(t["tp_roe"], 0), "sl_roe": lambda t: max(t["sl_roe"], 0)},
+                 name="stochastic")
+    start_ms = parse_date(START); end_ms = parse_date(END)
+    candles = [(s, tf, start_ms, end_ms, MAX_CANDLES) for s in SYMBOLS for tf in TIMEFRAMES]
+    if SEARCH:   # 전체 격자 대신 표본 + successive halving → 상위 조합만 아래에서 결과 저장소에
+        tasks = [t for t, _ in search(backtest, tasks, partial(trade_score, METRIC), method=SEARCH,
+                                      workers=WORKERS, store=STORE, candles=candles, label=task_label)]
+    # 거래 없는 조합도 저장소에 한 줄 (요약에서 trades 0)
+    run_sweep(backtest, tasks, workers=WORKERS, store=STORE, candles=candles,
+              manifest=os.path.join(OUT_DIR, MANIFEST), results=os.path.join(OUT_DIR, RESULTS),
+              settings=settings(globals()), label=task_label,
+              on_result=report)
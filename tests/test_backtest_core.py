@@ -0,0 +1,118 @@
+"""
+backtest_core.cross_grid / first_hits 테스트 — TP×SL 격자를 한 번에 푼 결과가
+칸마다 EMA 교차 봉 루프(EMA_cross_test.backtest 의 예전 루프)를 돌린 것과 같은지
+  python -m pytest -q tests
+"""
+
+import os, sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+os.environ.setdefault("BYBIT_MOCK", "1")   # 스크립트 import 시 진짜 세션 대신 오프라인 대역
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "scripts"))
+sys.path.append(os.path.join(ROOT, "test_scripts"))
+import kernels
+from backtest_core import crosses, cross_grid, first_hits
+import indicators as ind
+import EMA_cross_test as ec
+
+NOTIONAL, EQUITY = 500.0, 100.0   # 레버리지 5
+TPS = [0, 5, 7.5, 10]
+SLS = [0, 5, 7.5, 10]
+
+
+def roe_of(close, e, side, bars):
+    qty = NOTIONAL / close[e]
+    pnl = (close[bars] - close[e]) * qty if side == kernels.LONG else (close[e] - close[bars]) * qty
+    return pnl / EQUITY * 100.0
+
+
+def cross_loop(close, cross_up, cross_dn, tp, sl, start):
+    """칸 하나 — 예전 봉 루프 그대로 (진입 봉은 건너뜀, TP → SL → 반대 교차 순서, 청산 봉에서는 진입 안 함)"""
+    trades, side, e = [], None, None
+    for i in range(start, len(close)):
+        if side is None:
+            if cross_up[i] or cross_dn[i]:
+                side, e = (kernels.LONG if cross_up[i] else kernels.SHORT), i
+            continue
+        roe = roe_of(close, e, side, i)
+        opposite = cross_dn[i] if side == kernels.LONG else cross_up[i]
+        reason = kernels.TP if roe >= tp else kernels.SL if roe <= -sl else kernels.EXIT if opposite else None
+        if reason is not None:
+            trades.append((e, i, side, reason))
+            side = None
+    if side is not None:
+        trades.append((e, -1, side, kernels.OPEN))
+    return trades
+
+
+def grid_vs_loop(close, cross_up, cross_dn, start):
+    close = np.asarray(close, dtype=np.float64)
+    grid = cross_grid(cross_up, cross_dn, lambda e, side, bars: roe_of(close, e, side, bars), TPS, SLS, start)
+    assert sorted(grid) == [(tp, sl) for tp in TPS for sl in SLS]
+    loops = {}
+    for tp in TPS:
+        for sl in SLS:
+            loops[(tp, sl)] = cross_loop(close, cross_up, cross_dn, tp, sl, start)
+            assert grid[(tp, sl)] == loops[(tp, sl)], (tp, sl)
+    return loops
+
+
+# ===== 만든 시나리오 =====
+def test_grid_matches_loop_ties_and_reentry():
+    #        0    1    2    3    4     5   6   7     8     9   10   11    12
+    close = [100, 100, 100, 101, 98.9, 99, 97, 97.5, 98.5, 98, 96, 95.9, 96]
+    up = np.zeros(len(close), bool); dn = np.zeros(len(close), bool)
+    up[[1, 7, 12]] = True
+    dn[[5, 10]] = True
+    loops = grid_vs_loop(close, up, dn, start=0)
+
+    # 진입 다음 봉이 평평 (ROE 0) → tp=0, sl=0 칸은 같은 봉에서 TP/SL 둘 다 → TP 우선
+    assert loops[(0, 0)][0] == (1, 2, kernels.LONG, kernels.TP)
+    assert loops[(5, 0)][0] == (1, 2, kernels.LONG, kernels.SL)
+    # TP 도 SL 도 안 닿으면 반대 교차(5)에서 청산, 그 봉에서는 진입 안 하고 다음 교차(7)에서 재진입
+    assert loops[(10, 10)] == [(1, 5, kernels.LONG, kernels.EXIT), (7, 10, kernels.LONG, kernels.EXIT),
+                               (12, -1, kernels.LONG, kernels.OPEN)]
+    # 교차 봉(10)에서 SL 이 반대 교차보다 먼저
+    assert loops[(10, 7.5)][1] == (7, 10, kernels.LONG, kernels.SL)
+    # 창 안에서 TP → 다음 교차에서 재진입, 교차 봉(12)에서 청산되면 그 교차로는 진입 안 함
+    assert loops[(5, 10)] == [(1, 3, kernels.LONG, kernels.TP), (5, 6, kernels.SHORT, kernels.TP),
+                              (7, 8, kernels.LONG, kernels.TP), (10, 12, kernels.SHORT, kernels.EXIT)]
+
+
+def test_first_hits_same_bar_prefers_tp():
+    off, hit = first_hits([0.0, 3.0, -6.0], [0, 5], [0, 5])
+    assert off.tolist() == [[0, 0], [0, 2]]
+    assert hit.tolist() == [[kernels.TP, kernels.TP], [kernels.SL, kernels.SL]]
+    off, hit = first_hits([1.0, 2.0], [5], [5])
+    assert off.tolist() == [[2]] and hit.tolist() == [[kernels.OPEN]]
+
+
+# ===== 랜덤워크 + 실제 EMA 교차 =====
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_grid_matches_loop_on_ema_crosses(seed):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 800)))
+    close[200:203] = close[199]   # 평평한 봉 (ROE 0 동점)
+    ef, es = ind.ema(close, [5, 13])
+    up, dn = crosses(ef, es)
+    loops = grid_vs_loop(close, up, dn, start=14)
+    reasons = {r for trades in loops.values() for *_, r in trades}
+    assert {kernels.TP, kernels.SL, kernels.EXIT} <= reasons
+
+
+def test_script_grid_matches_per_cell_backtest(monkeypatch):
+    """EMA_cross_test: backtest_grid 의 칸별 로그 == 칸마다 backtest 를 돌린 로그"""
+    rng = np.random.default_rng(5)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 600)))
+    close[300:303] = close[299]
+    ohlc = pd.DataFrame({"ts": 1_735_689_600_000 + 300_000 * np.arange(600, dtype=np.int64),
+                         "open": close, "high": close, "low": close, "close": close, "volume": np.ones(600)})
+    monkeypatch.setattr(ec, "fetch_ohlcv", lambda *a, **kw: ohlc.copy())
+    grid = ec.backtest_grid("BTCUSDT", "5", 5, 13, TPS, SLS, None, None)
+    for tp in TPS:
+        for sl in SLS:
+            pd.testing.assert_frame_equal(grid[(tp, sl)], ec.backtest("BTCUSDT", "5", 5, 13, tp, sl, None, None))
@@ -0,0 +1,115 @@
+"""
+candle_store 테스트 — 가짜 세션(요청 기록, 지정 횟수 뒤 끊김)으로 구간/구멍 처리 확인
+  python -m pytest -q tests
+"""
+
+import os, sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import candle_store as cs
+from candle_store import CandleStore, interval_ms
+
+HOUR = 3_600_000
+
+
+class FakeSession:
+    """get_kline 만 — [start, end] 의 봉(최신 먼저), fail_after 번째 요청부터 예외"""
+
+    def __init__(self, fail_after=None):
+        self.calls = []
+        self.fail_after = fail_after
+
+    def get_kline(self, category="linear", symbol="", interval="1", start=None, end=None, limit=200):
+        if self.fail_after is not None and len(self.calls) >= self.fail_after:
+            raise ConnectionError("끊김")
+        self.calls.append((interval, start, end))
+        step = interval_ms(interval)
+        ts = np.arange(-(-start // step) * step, end + 1, step)[-limit:]
+        rows = [[str(t), "1", "2", "0.5", "1.5", "10", "15"] for t in ts[::-1]]
+        return {"retCode": 0, "result": {"list": rows}}
+
+
+@pytest.fixture
+def now():
+    return cs.now_ms() // HOUR * HOUR
+
+
+# ===== 구멍 (user-002) =====
+def test_separate_ensures_are_not_gaps(tmp_path, now):
+    """START 가 다른 ensure 두 번 → 두 구간 사이는 구멍이 아님 (sync 가 사이를 받지 않음)"""
+    store = CandleStore(str(tmp_path), session=FakeSession())
+    store.ensure("BTCUSDT", "60", now - 4000 * HOUR, now - 3500 * HOUR)
+    store.ensure("BTCUSDT", "60", now - 1000 * HOUR, now - 500 * HOUR)
+    assert store.gaps("BTCUSDT", "60") == []
+    assert store.fill_gaps("BTCUSDT", "60") == 0
+
+
+def test_interrupted_sync_refills_only_pending(tmp_path, now):
+    store = CandleStore(str(tmp_path), session=FakeSession(fail_after=2))
+    with pytest.raises(RuntimeError):
+        store.sync("BTCUSDT", "60", start_ms=now - 3500 * HOUR, checkpoint_pages=1)
+    meta = store._load_meta("BTCUSDT", "60")
+    end = store.now_ms
+    assert meta["pending"] == [[now - 1500 * HOUR, end]]   # 체크포인트 2번 뒤 남은 창
+
+    # 앞쪽에 따로 받은 구간이 있어도 다시 받는 건 pending 만
+    store.session = FakeSession()
+    store.ensure("BTCUSDT", "60", now - 6000 * HOUR, now - 5000 * HOUR)
+    store.session.calls.clear()
+    assert store.gaps("BTCUSDT", "60") == [(now - 1500 * HOUR, end)]
+    store.fill_gaps("BTCUSDT", "60")
+    assert [c[1] for c in store.session.calls] == [now - 1500 * HOUR, now - 500 * HOUR]
+    assert store._load_meta("BTCUSDT", "60")["pending"] == []
+    assert store.gaps("BTCUSDT", "60") == []
+
+
+# ===== 짧은 구간 (sweep.search) =====
+def test_span_is_per_call(tmp_path, now):
+    """span 은 호출 인자 — 최근 그 비율만, 다음 호출에는 남지 않음"""
+    store = CandleStore(str(tmp_path), session=FakeSession())
+    full = store.arrays("BTCUSDT", "60", None, now - HOUR, 900)
+    part = store.arrays("BTCUSDT", "60", None, now - HOUR, 900, span=0.1)
+    assert len(full) == 900 and len(part) == 90
+    assert np.array_equal(part.ts, full.ts[-90:])
+    assert len(store.get("BTCUSDT", "60", None, now - HOUR, 900)) == 900
+
+
+# ===== 다운로드 풀 (user-004) =====
+def test_sync_all_shares_one_pool(tmp_path, now):
+    store = CandleStore(str(tmp_path), session=FakeSession())
+    pool = store._pool
+    out = store.sync_all(["BTCUSDT", "ETHUSDT", "XRPUSDT"], ["60", "240"], start_ms=now - 3000 * HOUR)
+    assert len(out) == 6 and store._pool is pool
+    store.close()
+    with pytest.raises(RuntimeError):   # 닫힌 뒤에는 새 작업을 받지 않음
+        pool.submit(print)
+
+
+# ===== 1분봉 → 상위 TF (user-006) =====
+def minutes(t0, n, skip=()):
+    ts = np.array([t0 + k * 60_000 for k in range(n) if k not in skip], dtype=np.int64)
+    x = np.arange(len(ts), dtype=np.float64)
+    return {"ts": ts, "open": x, "high": x + 1, "low": x - 1, "close": x + 0.5, "volume": np.ones(len(ts))}
+
+
+def test_resample_drops_partial_buckets():
+    t0 = 1_700_000_000_000 // HOUR * HOUR
+    cols = minutes(t0 + 10 * 60_000, 170, skip={70, 71})   # 첫 시간은 10분부터, 둘째 시간 두 분 빠짐
+    out = cs.resample(cols, "60")
+    assert list(out["ts"]) == [t0 + 2 * HOUR]                # 60개가 다 있는 셋째 시간만
+    i = int(np.searchsorted(cols["ts"], t0 + 2 * HOUR))
+    assert out["open"][0] == cols["open"][i] and out["volume"][0] == 60
+    assert out["high"][0] == cols["high"][i:i + 60].max()
+
+
+def test_resample_keeps_exchange_holes_and_open_bar():
+    t0 = 1_700_000_000_000 // HOUR * HOUR
+    cols = minutes(t0, 150, skip={70, 71})
+    hole = [[t0 + 70 * 60_000, t0 + 72 * 60_000 - 1]]        # 거래소에도 없던 두 분
+    out = cs.resample(cols, "60", holes=hole, now_ms=t0 + 150 * 60_000)
+    assert list(out["ts"]) == [t0, t0 + HOUR, t0 + 2 * HOUR]   # 마지막 봉은 진행 중 → 남김
+    assert out["volume"][1] == 58
+    assert len(cs.resample(cols, "60", holes=hole)["ts"]) == 2   # now 를 모르면 덜 찬 마지막 봉도 버림
@@ -0,0 +1,53 @@
+"""
+engine.Engine.trigger 테스트 — 다른 스레드(스트림 콜백)의 이벤트가 엔진 스레드 풀에서 돌고, 몰리면 합쳐지는지
+  python -m pytest -q tests
+"""
+
+import asyncio, os, sys, threading, time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from engine import Engine
+
+
+def run_for(eng: Engine, sec: float) -> None:
+    async def main():
+        try:
+            await asyncio.wait_for(eng.main(), sec)
+        except asyncio.TimeoutError:
+            pass
+    asyncio.run(main())
+
+
+def test_trigger_runs_on_engine_pool_and_coalesces():
+    eng = Engine()
+    calls, busy, overlap = [], set(), []
+
+    def on_event(symbol):
+        if symbol in busy:
+            overlap.append(symbol)
+        busy.add(symbol)
+        calls.append((symbol, threading.current_thread().name))
+        time.sleep(0.05)
+        busy.discard(symbol)
+
+    post = eng.trigger(on_event, name="account")
+    post("AUSDT")   # 엔진 시작 전 → 버림
+
+    def stream():
+        """pybit 스레드 흉내 — 0.2초 동안 1ms 마다 시세 갱신"""
+        end = time.monotonic() + 0.2
+        while time.monotonic() < end:
+            post("AUSDT")
+            post("BUSDT")
+            time.sleep(0.001)
+
+    started = []
+    eng.every(10, lambda: started or (started.append(1), threading.Thread(target=stream, name="ws").start()))
+    run_for(eng, 0.6)
+
+    assert eng.workers == 2
+    assert {s for s, _ in calls} == {"AUSDT", "BUSDT"}
+    assert all(t.startswith("engine") for _, t in calls)   # 스트림 스레드에서는 안 돎
+    assert not overlap                                     # 같은 심볼이 겹쳐 돌지 않음
+    assert len(calls) < 2 * 0.3 / 0.05 + 4                 # 수백 번 온 갱신이 처리 시간만큼으로 합쳐짐
+    post("AUSDT")   # 엔진 종료 후 → 버림 (예외 없음)
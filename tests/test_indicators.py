@@ -0,0 +1,161 @@
+"""
+indicators 골든 테스트 — 예전 스크립트별 pandas 식과 값 비교 (앞쪽 NaN 구간 포함)
+  python -m pytest -q tests
+"""
+
+import os, sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import indicators as ind
+from indicator_cache import IndicatorCache
+
+RTOL = 1e-10
+
+
+# ===== 예전 pandas 식 (스크립트에 있던 그대로) =====
+def pd_ema(close: pd.Series, p: int) -> pd.Series:
+    return close.ewm(span=p, adjust=False).mean()
+
+def pd_rsi(close: pd.Series, period: int, eps: float = 1e-12) -> pd.Series:
+    delta = close.diff()
+    up = delta.clip(lower=0)
+    down = (-delta).clip(lower=0)
+    roll_up = up.ewm(alpha=1/period, adjust=False).mean()
+    roll_down = down.ewm(alpha=1/period, adjust=False).mean()
+    rs = roll_up / (roll_down + eps)
+    return 100 - (100/(1+rs))
+
+def pd_stoch(df: pd.DataFrame, period: int, k_smooth: int, d_smooth: int, floor: bool = False):
+    """stochastic.py compute_stoch (floor=False) / EMA_stochastic.py compute_k (floor=True, eps=1e-12)"""
+    low_min = df["low"].rolling(period).min()
+    high_max = df["high"].rolling(period).max()
+    if floor:
+        k_raw = 100.0 * (df["close"] - low_min) / (np.maximum(high_max - low_min, 1e-12))
+    else:
+        k_raw = 100 * (df["close"] - low_min) / (high_max - low_min + 1e-9)
+    k = k_raw.rolling(max(1, k_smooth)).mean()
+    return k_raw, k, k.rolling(d_smooth).mean()
+
+
+# ===== 입력 =====
+@pytest.fixture(scope="module")
+def ohlc() -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    close = 30000 + np.cumsum(rng.normal(0, 50, 600))
+    spread = np.abs(rng.normal(0, 30, (2, 600)))
+    df = pd.DataFrame({"high": close + spread[0], "low": close - spread[1], "close": close})
+    df.iloc[300:305, 2] = df["close"].iloc[299]   # 평평한 구간 (상승/하락 0)
+    return df
+
+
+def assert_same(a, b):
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    assert a.shape == b.shape
+    assert np.array_equal(np.isnan(a), np.isnan(b)), "NaN 위치가 다름"
+    np.testing.assert_allclose(a, b, rtol=RTOL, atol=1e-9, equal_nan=True)
+
+
+# ===== EMA / RSI =====
+def test_ema_matches_pandas(ohlc):
+    ps = [5, 12, 5, 200]   # 중복 기간 포함, 행 순서 = 넘긴 순서
+    out = ind.ema(ohlc["close"], ps)
+    assert out.shape == (len(ps), len(ohlc))
+    for row, p in zip(out, ps):
+        assert_same(row, pd_ema(ohlc["close"], p))
+    assert_same(ind.ema(ohlc["close"], 12)[0], out[1])   # int 하나도 받음
+
+
+@pytest.mark.parametrize("eps", [1e-12, 1e-9])
+def test_rsi_matches_pandas(ohlc, eps):
+    ps = [2, 7, 14, 50]
+    out = ind.rsi(ohlc["close"], ps, eps)
+    assert out.shape == (len(ps), len(ohlc))
+    for row, p in zip(out, ps):
+        ref = pd_rsi(ohlc["close"], p, eps)
+        assert np.isnan(row[0]) and np.isnan(ref.iloc[0])   # 첫 봉은 diff 가 없음
+        assert_same(row, ref)
+
+
+# ===== rolling / SMA =====
+@pytest.mark.parametrize("w", [1, 2, 5, 14, 599, 600, 601])
+def test_rolling_extremes_match_pandas(ohlc, w):
+    assert_same(ind.rolling_max(ohlc["high"], w), ohlc["high"].rolling(w).max())
+    assert_same(ind.rolling_min(ohlc["low"], w), ohlc["low"].rolling(w).min())
+
+
+def test_monodeque_matches_rolling(ohlc):
+    w, x = 9, ohlc["high"].to_numpy()
+    hi, lo = ind.MonoDeque(w, True), ind.MonoDeque(w, False)
+    got_hi, got_lo = [], []
+    for i, v in enumerate(x):
+        hi.push(i, v); lo.push(i, v)
+        got_hi.append(hi.front(i)); got_lo.append(lo.front(i))
+    assert_same(got_hi[w - 1:], ohlc["high"].rolling(w).max()[w - 1:])
+    assert_same(got_lo[w - 1:], ohlc["high"].rolling(w).min()[w - 1:])
+
+
+@pytest.mark.parametrize("w", [1, 3, 10, 100, 600, 601])
+def test_sma_matches_pandas_with_nan(ohlc, w):
+    x = ohlc["close"].to_numpy().copy()
+    x[[0, 1, 250, 251, 252, 480]] = np.nan   # 앞쪽 워밍업 + 중간 결측
+    assert_same(ind.sma(x, [w])[0], pd.Series(x).rolling(w).mean())
+
+
+def test_sma_multi_window_nd(ohlc):
+    """마지막 축 기준, 결과 앞에 windows 축 — (W, P, n)"""
+    raw = ind.stoch_raw(ohlc["high"], ohlc["low"], ohlc["close"], [5, 14, 30])
+    ws = [1, 3, 7]
+    out = ind.sma(raw, ws)
+    assert out.shape == (len(ws),) + raw.shape
+    for i, w in enumerate(ws):
+        for j in range(raw.shape[0]):
+            assert_same(out[i, j], pd.Series(raw[j]).rolling(w).mean())
+
+
+def test_sma_long_series_precision():
+    """긴 시리즈에서도 pandas 와 같은 자릿수 (전체 누적합 차분 오차 없음)"""
+    x = 1e5 + np.cumsum(np.random.default_rng(1).normal(0, 10, 200_000))
+    assert_same(ind.sma(x, [20])[0], pd.Series(x).rolling(20).mean())
+
+
+# ===== 스토캐스틱 =====
+@pytest.mark.parametrize("floor", [False, True])
+def test_stoch_batches_match_pandas(ohlc, floor):
+    eps = 1e-12 if floor else 1e-9
+    periods, smooths, ds = [5, 14, 9], [1, 3], [3, 5]
+    h, l, c = ohlc["high"], ohlc["low"], ohlc["close"]
+    raw = ind.stoch_raw(h, l, c, periods, eps, floor)
+    k = ind.stoch_k(h, l, c, periods, smooths, eps, floor)
+    d = ind.stoch_d(k, ds)
+    assert raw.shape == (3, len(ohlc))
+    assert k.shape == (3, 2, len(ohlc))
+    assert d.shape == (3, 2, 2, len(ohlc))
+    for i, p in enumerate(periods):
+        for j, s in enumerate(smooths):
+            for m, dd in enumerate(ds):
+                ref_raw, ref_k, ref_d = pd_stoch(ohlc, p, s, dd, floor)
+                assert_same(raw[i], ref_raw)
+                assert_same(k[i, j], ref_k)
+                assert_same(d[i, j, m], ref_d)
+
+
+def test_stoch_smooth_zero_is_raw(ohlc):
+    """k_smooth 0 → 1 (EMA_stochastic.py 의 max(1, k_smooth))"""
+    h, l, c = ohlc["high"], ohlc["low"], ohlc["close"]
+    k = ind.stoch_k(h, l, c, [14], [0], 1e-12, True)
+    assert_same(k[0, 0], pd_stoch(ohlc, 14, 0, 3, True)[1])
+
+
+def test_cache_matches_direct(ohlc, tmp_path):
+    """캐시를 거쳐도 (디스크로 밀려났다 다시 읽어도) 같은 값"""
+    cache = IndicatorCache(max_items=1, disk_dir=str(tmp_path))
+    h, l, c = ohlc["high"], ohlc["low"], ohlc["close"]
+    for _ in range(2):
+        assert_same(cache.rsi(c, [14, 7]), ind.rsi(c, [14, 7]))
+        assert_same(cache.ema(c, [50]), ind.ema(c, [50]))
+        assert_same(cache.stoch_d(h, l, c, 14, 3, [3]), pd_stoch(ohlc, 14, 3, 3)[2].to_numpy()[None])
+    assert cache.hits > 0
@@ -0,0 +1,107 @@
+"""
+kernels 골든 테스트 — 커널(파이썬 / njit)로 돌린 전략 로그가 예전 봉 루프(898e1a5) 로그와 같은지
+  - 입력: 고정 시드 캔들 (candles), 예전 로그: tests/fixtures/kernels/*.csv
+  - numba 가 없으면 njit 쪽은 건너뜀
+  python -m pytest -q tests
+"""
+
+import importlib
+import io
+import os, sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+os.environ.setdefault("BYBIT_MOCK", "1")   # 스크립트 import 시 진짜 세션 대신 오프라인 대역
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "scripts"))
+sys.path.append(os.path.join(ROOT, "test_scripts"))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "kernels")
+
+import kernels
+
+T0 = 1_735_689_600_000   # 2025-01-01 00:00 UTC
+STEP = 15 * 60_000
+
+
+def candles(n: int = 1500, seed: int = 11) -> pd.DataFrame:
+    """15분봉 흉내 — 추세가 바뀌는 랜덤워크 (RSI/스토캐스틱 극단과 교차가 골고루 나오게)"""
+    rng = np.random.default_rng(seed)
+    drift = np.repeat(rng.normal(0, 0.002, n // 100 + 1), 100)[:n]
+    close = 100 * np.exp(np.cumsum(drift + rng.normal(0, 0.006, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    wick = np.abs(rng.normal(0, 0.003, (2, n))) * close
+    return pd.DataFrame({"ts": T0 + STEP * np.arange(n, dtype=np.int64), "open": open_,
+                         "high": np.maximum(open_, close) + wick[0], "low": np.minimum(open_, close) - wick[1],
+                         "close": close, "volume": np.ones(n)})
+
+
+# ===== 전략별 실행 (예전/지금 스크립트 공통 인터페이스) =====
+def _rsitest(mod, out_dir):
+    return pd.read_csv(mod.run("BTCUSDT", "15", 9, 5, 100.0, None, None, str(out_dir), 10, 15, 1))
+
+def _rsitest_mode2(mod, out_dir):
+    return pd.read_csv(mod.run("BTCUSDT", "15", 7, 5, 100.0, None, None, str(out_dir), 5, 5, 2))
+
+def _rsi50(mod, out_dir):
+    return pd.read_csv(mod.run("BTCUSDT", "15", 9, 5, 100.0, None, None, 5, 16, 4, str(out_dir)))
+
+def _stochastic(mod, out_dir):
+    return mod.backtest("BTCUSDT", "15", 9, 5, 3, 10, 10, 1, 80, 20, True, False, True)
+
+def _stochastic_loose(mod, out_dir):
+    return mod.backtest("BTCUSDT", "15", 14, 3, 3, 0, 5, 0, 80, 20, False, False, False)
+
+def _ema_stochastic(mod, out_dir):
+    return mod.backtest("BTCUSDT", "15", 5, 13, 14, 3, 3, 20, 80, "BOTH", 10, 5)
+
+def _ema_stochastic_long(mod, out_dir):
+    return mod.backtest("BTCUSDT", "15", 3, 9, 10, 1, 3, 20, 80, "LONG_ONLY", 0, 7.5)
+
+
+# (골든 파일 이름, 스크립트 모듈, 교체할 fetch 함수, 실행)
+CASES = [
+    ("rsitest_mode1", "RSItest", "fetch_ohlcv_10000", _rsitest),
+    ("rsitest_mode2", "RSItest", "fetch_ohlcv_10000", _rsitest_mode2),
+    ("rsi50", "RSI50_test", "fetch_ohlcv_capped", _rsi50),
+    ("stochastic", "stochastic", "fetch_ohlcv", _stochastic),
+    ("stochastic_loose", "stochastic", "fetch_ohlcv", _stochastic_loose),
+    ("ema_stochastic", "EMA_stochastic", "fetch_ohlcv", _ema_stochastic),
+    ("ema_stochastic_long", "EMA_stochastic", "fetch_ohlcv", _ema_stochastic_long),
+]
+
+
+def run_case(mod, fn, out_dir) -> pd.DataFrame:
+    """실행 → CSV 로 한 번 거친 로그 (골든 파일과 같은 dtype)"""
+    df = fn(mod, out_dir)
+    return pd.read_csv(io.StringIO(df.to_csv(index=False)))
+
+
+@pytest.fixture(params=["python", "njit"])
+def mode(request):
+    """kernels 를 파이썬 / njit 으로 다시 로드 (스크립트는 kernels.* 를 호출 시점에 찾으므로 그대로 반영)"""
+    saved = sys.modules.get("numba")
+    if request.param == "python":
+        sys.modules["numba"] = None   # import 실패 → njit 없는 경로
+    else:
+        pytest.importorskip("numba")
+    importlib.reload(kernels)
+    assert kernels.HAVE_NUMBA == (request.param == "njit")
+    yield request.param
+    if saved is None:
+        sys.modules.pop("numba", None)
+    else:
+        sys.modules["numba"] = saved
+    importlib.reload(kernels)
+
+
+@pytest.mark.parametrize("name,module,fetch,fn", CASES, ids=[c[0] for c in CASES])
+def test_kernel_matches_baseline_loop(mode, name, module, fetch, fn, tmp_path, monkeypatch):
+    mod = importlib.import_module(module)
+    monkeypatch.setattr(mod, fetch, lambda *a, **kw: candles())   # 저장소 대신 고정 캔들
+    got = run_case(mod, fn, tmp_path)
+    want = pd.read_csv(os.path.join(FIXTURES, f"{name}.csv"))
+    assert len(want) > 0
+    # 지표 합산 순서가 바뀐 곳(O(n) SMA)은 마지막 자리만 다를 수 있음 → 값은 상대 1e-9
+    pd.testing.assert_frame_equal(got, want, check_exact=False, rtol=1e-9)
@@ -0,0 +1,82 @@
+"""
+market_feed 테스트 — REST 보충이 버퍼 락 밖에서 도는지, 빈 버퍼 보충
+  python -m pytest -q tests
+"""
+
+import os, sys, threading
+
+import pytest
+
+os.environ.setdefault("BYBIT_MOCK", "1")   # WebSocket 대역 (구독 안 하면 아무것도 안 밂)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from market_feed import BarBuffer, MarketFeed
+
+STEP = 300_000
+NOW = 1_735_689_600_000 + 1000 * STEP
+
+
+class FakeSession:
+    """get_kline 만 — NOW 까지의 5분봉 (최신 먼저), empty 면 빈 목록, gate 가 있으면 그게 열릴 때까지 대기"""
+
+    def __init__(self):
+        self.calls = []
+        self.empty = False
+        self.gate = None
+        self.entered = threading.Event()
+
+    def now_ms(self):
+        return NOW + 60_000
+
+    def get_kline(self, category="linear", symbol="", interval="5", limit=200):
+        self.calls.append((symbol, limit))
+        self.entered.set()
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        ts = [] if self.empty else [NOW - k * STEP for k in range(limit)]
+        return {"retCode": 0, "result": {"list": [[str(t), "1", "2", "0.5", "1.5", "10", "15"] for t in ts]}}
+
+
+def kline_msg(symbol, ts, close):
+    return {"topic": f"kline.5.{symbol}", "data": [dict(start=ts, open="1", high="2", low="0.5",
+                                                        close=str(close), volume="10")]}
+
+
+@pytest.fixture
+def feed():
+    session = FakeSession()
+    f = MarketFeed(session)
+    for s in ("AUSDT", "BUSDT"):
+        f.bars[(s, "5")] = BarBuffer("5")
+    return f
+
+
+def test_empty_buffer_gets_full_backfill(feed):
+    """REST 가 빈 목록을 준 뒤(상장 직후 등) stale 이어도 IndexError 없이 limit 만큼 다시"""
+    feed.session.empty = True
+    assert feed.kline("AUSDT", "5", 50) == []
+    feed.session.empty = False
+    feed.stale_sec = -1.0   # 매번 stale
+    rows = feed.kline("AUSDT", "5", 50)
+    assert feed.session.calls[-1] == ("AUSDT", 50)
+    assert len(rows) == 50 and rows[-1][0] == NOW
+
+
+def test_rest_runs_outside_buffer_lock(feed):
+    """한 심볼 REST 가 끝나길 기다리는 동안 다른 심볼 읽기, 같은 심볼 스트림 봉은 막히지 않음"""
+    feed.kline("BUSDT", "5", 20)
+    feed.session.gate = threading.Event()
+    slow = threading.Thread(target=feed.kline, args=("AUSDT", "5", 20))
+    slow.start()
+    assert feed.session.entered.wait(5)
+
+    other = threading.Thread(target=lambda: (feed.kline("BUSDT", "5", 20),
+                                             feed._on_kline(kline_msg("AUSDT", NOW, 1.75))))
+    other.start()
+    other.join(2)
+    done = not other.is_alive()
+    feed.session.gate.set()
+    slow.join(5)
+    other.join(5)
+    assert done
+    # REST 를 받는 사이 들어온 진행 중 봉이 REST 값으로 되돌아가지 않음
+    assert feed.kline("AUSDT", "5", 20)[-1][4] == 1.75
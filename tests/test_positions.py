@@ -0,0 +1,52 @@
+"""
+포지션 스냅샷 테스트 — 헤지 모드(심볼당 positionIdx 1/2 두 행)에서도 심볼 행은 예전 lst[0](매수 쪽)
+  python -m pytest -q tests
+"""
+
+import os, sys
+
+import pytest
+
+os.environ.setdefault("BYBIT_MOCK", "1")   # 모듈 세션은 오프라인 대역 (테스트에서 get_positions 만 바꿈)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import bybit
+from private_feed import AccountFeed
+
+
+def row(symbol, idx, side, size, pnl):
+    return {"symbol": symbol, "positionIdx": idx, "side": side, "size": str(size), "avgPrice": "100",
+            "unrealisedPnl": str(pnl), "positionIM": "10"}
+
+
+HEDGE = [row("BTCUSDT", 1, "Buy", 0.5, 2.0), row("BTCUSDT", 2, "Sell", 0.3, -1.0),
+         row("ETHUSDT", 1, "", 0, 0), row("ETHUSDT", 2, "Sell", 1.0, 3.0),
+         row("XRPUSDT", 0, "Sell", 7, 1.0)]   # 단방향
+
+
+@pytest.fixture
+def rest(monkeypatch):
+    """session.get_positions → 심볼 조회면 그 심볼 행들(예전 코드), 아니면 전체"""
+    def get_positions(category="linear", symbol=None, **kw):
+        return {"result": {"list": [p for p in HEDGE if symbol in (None, p["symbol"])]}}
+    monkeypatch.setattr(bybit.session, "get_positions", get_positions)
+    monkeypatch.setattr(bybit, "ACCOUNT", None)
+    bybit.invalidate_positions()
+    return get_positions
+
+
+def test_position_row_matches_old_first_row(rest):
+    for s in ("BTCUSDT", "ETHUSDT", "XRPUSDT"):
+        first = rest(symbol=s)["result"]["list"][0]   # 예전 get_ROE / get_position_size 가 쓰던 행
+        assert bybit.get_position_size(s) == float(first["size"])
+        assert bybit.get_PnL(s) == (float(first["unrealisedPnl"]) if float(first["size"]) else 0.0)
+    assert bybit.get_position("BTCUSDT")["side"] == "Buy"
+    assert bybit.get_position("ETHUSDT") == {}   # 매수 쪽이 비어 있으면 매도 쪽이 대신 나오지 않음
+
+
+def test_account_feed_ignores_hedge_sell_side(rest):
+    acct = AccountFeed(bybit.session)
+    acct._on_position({"data": [dict(p, category="linear") for p in HEDGE]})
+    assert sorted(acct.positions) == ["BTCUSDT", "XRPUSDT"]
+    assert acct.positions["BTCUSDT"]["side"] == "Buy"
+    acct._on_position({"data": [dict(row("BTCUSDT", 2, "Sell", 0, 0), category="linear")]})   # 매도 쪽 청산
+    assert acct.positions["BTCUSDT"]["size"] == "0.5"
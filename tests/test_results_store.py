@@ -0,0 +1,101 @@
+"""
+results_store 재실행 테스트 — 같은 파라미터 조합을 다시 돌려도 요약/거래 행이 늘지 않음 (마지막 run 것만)
+  python -m pytest -q tests
+"""
+
+import os, sys
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from results_store import ResultStore
+from sweep import run_sweep
+
+STRATEGY = "grid_test"
+BARS = 0   # 캔들 봉 수 흉내 (workers=1 → 같은 프로세스에서 읽음)
+
+
+def grid_backtest(fast: int, slow: int, tps, sls):
+    """TP×SL 격자 결과 흉내 — 칸마다 거래 1건 (ROE 에 BARS 를 섞어 run 을 구분)"""
+    return {(tp, sl): pd.DataFrame({"datetime": ["2024-01-01 00:00:00"], "PnL": [tp - sl + BARS],
+                                    "ROE": [float(tp - sl + BARS)]})
+            for tp in tps for sl in sls}
+
+
+def sweep(tmp_path, tps, bars: int):
+    global BARS
+    BARS = bars
+    tasks = [{"fast": f, "slow": s, "tps": tps, "sls": [5, 10]} for f in (5, 9) for s in (20, 50)]
+    # 봉이 늘면 결과·manifest key 가 달라짐 → settings 로 흉내 (key 에 들어감)
+    run_sweep(grid_backtest, tasks, workers=1, strategy=STRATEGY,
+              settings={"END": bars}, manifest=str(tmp_path / "manifest.jsonl"),
+              results=str(tmp_path / "results.sqlite"), progress_every=1e9)
+    return ResultStore(str(tmp_path / "results.sqlite"))
+
+
+def test_rerun_same_grid_does_not_grow(tmp_path):
+    rs = sweep(tmp_path, [5, 7.5, 10], bars=0)
+    n = len(rs.summary(STRATEGY))
+    assert n == 4 * 3 * 2
+    rs.close()
+
+    for bars in (0, 1):   # 그대로 다시 (manifest 로 건너뜀) / 봉 추가 (전부 다시 실행)
+        rs = sweep(tmp_path, [5, 7.5, 10], bars=bars)
+        sm = rs.summary(STRATEGY)
+        assert len(sm) == n == len(rs.combos(STRATEGY))   # 지표는 넣을 때 계산 → 조합마다 한 줄
+        assert len(rs.trades(STRATEGY)) == n
+        assert sm["run_id"].nunique() == 1
+        rs.close()
+
+
+def test_added_grid_value_keeps_one_row_per_params(tmp_path):
+    sweep(tmp_path, [5, 7.5, 10], bars=0).close()
+    rs = sweep(tmp_path, [5, 7.5, 10, 12], bars=0)   # TP 값 추가 → key 가 달라져 전부 다시 실행
+    sm = rs.summary(STRATEGY)
+    params = ["fast", "slow", "tp_roe", "sl_roe"]
+    assert len(sm) == 4 * 4 * 2
+    assert not sm.duplicated(params).any()
+    assert (sm["run_id"] == sm["run_id"].max()).all()
+    # run 을 지정하면 그 run 만
+    first = rs.summary(STRATEGY, run_id=int(sm["run_id"].min()) - 1)
+    assert len(first) == 4 * 3 * 2
+    rs.close()
+
+
+def test_new_param_column_null_matches(tmp_path):
+    """나중에 생긴 파라미터 열은 예전 행에서 NULL → NULL 끼리 같은 조합으로"""
+    rs = ResultStore(str(tmp_path / "r.sqlite"))
+    log = pd.DataFrame({"PnL": [1.0], "ROE": [1.0]})
+    for _ in range(2):
+        run = rs.begin_run(STRATEGY)
+        rs.append(run, STRATEGY, {"fast": 5}, "k", log)
+    run = rs.begin_run(STRATEGY)
+    rs.append(run, STRATEGY, {"fast": 5, "gap": 0.5}, "k2", log)
+    rs.commit()
+    sm = rs.summary(STRATEGY)
+    assert len(sm) == 2
+    assert sorted(sm["run_id"]) == [2, 3]
+    rs.close()
+
+
+def test_old_store_without_stats_gets_backfilled(tmp_path):
+    """지표 테이블이 없던 저장소 → summary 가 저장된 거래로 지표를 채워 조합이 빠지지 않음"""
+    path = str(tmp_path / "old.sqlite")
+    rs = ResultStore(path)
+    run = rs.begin_run(STRATEGY)
+    logs = {5: pd.DataFrame({"datetime": ["2024-01-01 00:00:00", "2024-01-02 00:00:00"],
+                             "PnL": [2.0, -1.0], "ROE": [10.0, -5.0]}),
+            9: pd.DataFrame(columns=["datetime", "PnL", "ROE"])}   # 거래 없는 조합
+    for fast, log in logs.items():
+        rs.append(run, STRATEGY, {"fast": fast}, "k", log)
+    want = rs.summary(STRATEGY)
+    rs.db.execute(f'DROP TABLE "{STRATEGY}_stats"')
+    rs.close()
+
+    rs = ResultStore(path)
+    got = rs.summary(STRATEGY)
+    assert len(got) == 2
+    pd.testing.assert_frame_equal(got, want)
+    assert got.set_index("fast").loc[5, "total_roe_pct"] == 5.0
+    assert got.set_index("fast").loc[9, "trades"] == 0
+    rs.close()